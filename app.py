@@ -1,19 +1,17 @@
 
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash, session, render_template_string
-import sqlite3, os, csv, calendar
+from flask import Flask, render_template, request, redirect, url_for, send_file, send_from_directory, flash, session, jsonify, Response, stream_with_context
+import sqlite3, os, sys, csv, calendar, threading, queue, hashlib, zipfile, time, unicodedata, json, base64, bisect, mimetypes, logging
+import click
 from datetime import date, timedelta, datetime
-from io import StringIO, BytesIO
+from io import BytesIO, TextIOWrapper
+from operator import itemgetter
+from collections import OrderedDict, deque
 from werkzeug.security import generate_password_hash, check_password_hash
 
-# PDF (Romaneio)
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage
-    from reportlab.lib import colors
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import cm
-except Exception:
-    A4 = None
+# PDF (Romaneio); o ReportLab só é importado no primeiro PDF
+import romaneio_pdf
+# Registros compactos dos relatórios
+from records import StockRow, SeriesDay, RomaneioLine, AgingRow, ShortfallRow, trend_day, as_dicts
 
 APP_TITLE = "BBH — Lavanderia PRO"
 
@@ -27,24 +25,204 @@ DEFAULT_MOV_NAMES = [
     "TOALHA BANHO","TOALHA PISCINA","TOALHA ROSTO"
 ]
 
+MOV_TYPES = ('entrada','saida','envio','retorno','perda')
+
 BASE_DIR = os.path.dirname(__file__)
-DB_PATH = os.path.join(BASE_DIR, "lavanderia.db")
+DB_PATH = os.environ.get("BBH_DB_PATH") or os.path.join(BASE_DIR, "lavanderia.db")   # BBH_DB_PATH: outro banco (ex.: testes, benchmarks)
 
 # ------------- DB helpers -------------
+# Uma conexão por thread de trabalho (waitress/Flask), reaproveitada entre requisições.
+# WAL deixa leitores seguirem enquanto o balcão grava; busy_timeout espera em vez de falhar.
+DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA cache_size=-16384;",        # 16 MB
+    "PRAGMA mmap_size=67108864;",       # 64 MB
+    "PRAGMA busy_timeout=5000;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA foreign_keys=ON;",
+)
+
+class PooledConnection(sqlite3.Connection):
+    """Conexão do pool: close() apenas devolve ao pool (desfaz transação pendente na última liberação)."""
+    depth = 0
+    catalog_dv = None   # PRAGMA data_version visto na última checagem do catálogo
+    ledger_dv = None    # idem, da versão do livro (ledger_version)
+    after_commit = None # callbacks pós-commit da transação da WRITE_QUEUE (ver after_commit())
+
+    def close(self):
+        self.depth = max(self.depth - 1, 0)
+        if self.depth == 0 and self.in_transaction:
+            self.rollback()
+
+    def release(self):
+        self.depth = 0
+        if self.in_transaction:
+            self.rollback()
+
+    def dispose(self):
+        sqlite3.Connection.close(self)
+
+    def cursor(self, factory=None):
+        return sqlite3.Connection.cursor(self, factory or TimingCursor)
+
+# ---- Tempo de SQL ----
+# Durante uma requisição, _sql_trace.active acumula nº de comandos e tempo (execute + fetch).
+# Comandos acima de SLOW_SQL_MS entram em _slow_sql (os mais lentos por texto, com os parâmetros do pior caso).
+SLOW_SQL_MS = float(os.environ.get("BBH_SLOW_SQL_MS", "25"))
+SLOW_SQL_MAX = 20
+_sql_trace = threading.local()
+_slow_sql = {}
+_slow_sql_lock = threading.Lock()
+
+def _sql_record(sql, params, seconds, new_statement):
+    trace = getattr(_sql_trace, "active", None)
+    if trace is None:
+        return
+    trace["seconds"] += seconds
+    if new_statement:
+        trace["count"] += 1
+        trace["last"] = (sql, params, seconds)
+    elif trace.get("last"):
+        sql, params, prev = trace["last"]; seconds += prev
+        trace["last"] = (sql, params, seconds)
+    if seconds * 1000 >= SLOW_SQL_MS:
+        with _slow_sql_lock:
+            entry = _slow_sql.get(sql)
+            if entry is None:
+                if len(_slow_sql) >= SLOW_SQL_MAX:
+                    fastest = min(_slow_sql, key=lambda k: _slow_sql[k]["max"])
+                    if _slow_sql[fastest]["max"] >= seconds:
+                        return
+                    del _slow_sql[fastest]
+                entry = _slow_sql[sql] = dict(count=0, max=0.0, params=None, route=None)
+            if new_statement: entry["count"] += 1
+            if seconds >= entry["max"]:
+                entry.update(max=seconds, params=params, route=trace.get("route"))
+
+class TimingCursor(sqlite3.Cursor):
+    """Cursor que mede execute/fetch para as métricas da requisição; sem requisição ativa só repassa."""
+    def execute(self, sql, params=()):
+        t = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            _sql_record(sql, params, time.perf_counter() - t, True)
+
+    def executemany(self, sql, seq):
+        t = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            _sql_record(sql, None, time.perf_counter() - t, True)
+
+    def fetchone(self):
+        t = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _sql_record(None, None, time.perf_counter() - t, False)
+
+    def fetchmany(self, size=None):
+        t = time.perf_counter()
+        try:
+            return super().fetchmany(size if size is not None else self.arraysize)
+        finally:
+            _sql_record(None, None, time.perf_counter() - t, False)
+
+    def fetchall(self):
+        t = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _sql_record(None, None, time.perf_counter() - t, False)
+
+def slow_sql_report(explain=True):
+    """Comandos mais lentos (pior caso primeiro), com EXPLAIN QUERY PLAN das consultas SELECT/WITH."""
+    with _slow_sql_lock:
+        entries = sorted(_slow_sql.items(), key=lambda kv: -kv[1]["max"])
+    report = []
+    for sql, e in entries:
+        plan = None
+        if explain and e["params"] is not None and sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            conn = db_connect()
+            try:
+                c = conn.cursor(sqlite3.Cursor)   # cursor simples: o EXPLAIN não entra nas métricas
+                c.execute("EXPLAIN QUERY PLAN " + sql, e["params"])
+                plan = [r[3] for r in c.fetchall()]
+            except sqlite3.Error as err:
+                plan = [f"(sem plano: {err})"]
+            finally:
+                conn.close()
+        report.append(dict(sql=" ".join(sql.split()), max_ms=round(e["max"]*1000, 2), count=e["count"], route=e["route"], plan=plan))
+    return report
+
+_pool = threading.local()
+_pool_lock = threading.Lock()
+_pool_stats = dict(hits=0, misses=0)
+
+def _pool_count(key):
+    with _pool_lock:
+        _pool_stats[key] += 1
+
 def db_connect():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = getattr(_pool, "conn", None)
+    if conn is not None and _pool.path == DB_PATH:
+        _pool_count("hits")
+    else:
+        if conn is not None:
+            conn.dispose()
+        conn = sqlite3.connect(DB_PATH, factory=PooledConnection)
+        conn.row_factory = sqlite3.Row
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        _pool.conn = conn; _pool.path = DB_PATH
+        _pool_count("misses")
+    conn.depth += 1
     return conn
 
+def db_release():
+    """Fim da requisição: devolve a conexão da thread ao pool sem transação aberta."""
+    conn = getattr(_pool, "conn", None)
+    if conn is not None:
+        conn.release()
+
+def db_pool_stats():
+    with _pool_lock:
+        return dict(_pool_stats)
+
 def row_get(row, key, default=None):
     try:
         return row[key]
     except Exception:
         return default
 
-def init_db():
-    conn = db_connect()
-    c = conn.cursor()
+MOVEMENTS_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        mov_date TEXT NOT NULL,
+        mov_day TEXT,
+        mov_type TEXT NOT NULL CHECK(mov_type IN ('entrada','saida','envio','retorno','perda')),
+        item_id INTEGER NOT NULL,
+        qty INTEGER NOT NULL,
+        ref TEXT,
+        note TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(item_id) REFERENCES items(id)
+    );
+"""
+MOVEMENTS_COLUMNS = "id, mov_date, mov_day, mov_type, item_id, qty, ref, note, created_at"
+
+STOCK_BALANCE_DDL = """
+    CREATE TABLE IF NOT EXISTS stock_balance (
+        item_id INTEGER PRIMARY KEY,
+        no_hotel INTEGER NOT NULL DEFAULT 0,
+        em_lavanderia INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY(item_id) REFERENCES items(id)
+    );
+"""
+
+def init_db(c):
     # Itens
     c.execute("""
         CREATE TABLE IF NOT EXISTS items (
@@ -55,20 +233,10 @@ def init_db():
             created_at TEXT DEFAULT CURRENT_TIMESTAMP
         );
     """)
-    # Movimentações
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS movements (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            mov_date TEXT NOT NULL,
-            mov_type TEXT NOT NULL CHECK(mov_type IN ('entrada','saida','envio','retorno','perda')),
-            item_id INTEGER NOT NULL,
-            qty REAL NOT NULL,
-            ref TEXT,
-            note TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(item_id) REFERENCES items(id)
-        );
-    """)
+    # Movimentações (quantidades em peças inteiras)
+    c.execute(MOVEMENTS_DDL.format(table="movements"))
+    # Saldo materializado por item (mantido junto com cada movimentação)
+    c.execute(STOCK_BALANCE_DDL)
     # Usuários
     c.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -79,276 +247,2222 @@ def init_db():
             created_at TEXT DEFAULT CURRENT_TIMESTAMP
         );
     """)
-    conn.commit()
-    conn.close()
 
-def migrate_db():
-    """Garante schema compatível com versões anteriores."""
+def migrate_db(c):
+    """Garante schema compatível com versões anteriores."""
+    c.execute("PRAGMA table_info(users);")
+    cols = [r[1] for r in c.fetchall()]
+    if "active" not in cols:
+        c.execute("ALTER TABLE users ADD COLUMN active INTEGER DEFAULT 1;")
+        c.execute("UPDATE users SET active=1 WHERE active IS NULL;")
+    # Dia canônico (AAAA-MM-DD) para filtros por data que usam índice
+    c.execute("PRAGMA table_info(movements);")
+    cols = [r[1] for r in c.fetchall()]
+    if "mov_day" not in cols:
+        c.execute("ALTER TABLE movements ADD COLUMN mov_day TEXT;")
+    c.execute("UPDATE movements SET mov_day=date(mov_date) WHERE mov_day IS NULL;")
+
+def migrate_data(c):
+    """Normaliza dados existentes (tipos e índices)."""
+    # Normaliza tipos para minúsculo e sem acentos comuns
+    c.execute("UPDATE movements SET mov_type=LOWER(TRIM(mov_type)) WHERE mov_type IS NOT NULL;")
+    # Corrige possíveis variações com acento
+    c.execute("UPDATE movements SET mov_type='saida' WHERE mov_type IN ('saída');")
+    # Garante só valores válidos (se houver algo estranho, mapeia para 'saida' para não quebrar)
+    c.execute("UPDATE movements SET mov_type='saida' WHERE mov_type NOT IN ('entrada','saida','envio','retorno','perda');")
+    # Índices para desempenho e filtros por data/tipo
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mov_day ON movements(mov_day, mov_type, item_id);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mov_item ON movements(item_id);")
+    # Substituídos por idx_mov_day (idx_mov_type levava o planner a varrer todo um tipo)
+    c.execute("DROP INDEX IF EXISTS idx_mov_date;")
+    c.execute("DROP INDEX IF EXISTS idx_mov_type;")
+
+def create_app_meta(c):
+    # Contadores do sistema (ex.: catalog_gen), lidos por todos os processos
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS app_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+
+def meta_get(c, key):
+    c.execute("SELECT value FROM app_meta WHERE key=?;", (key,))
+    row = c.fetchone()
+    return row[0] if row else 0
+
+def meta_bump(c, key):
+    """Incrementa o contador key na transação de c (efeito visível a outros processos no commit)."""
+    c.execute("INSERT INTO app_meta(key, value) VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value=value+1;", (key,))
+
+def meta_set(c, key, value):
+    c.execute("INSERT INTO app_meta(key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value;", (key, value))
+
+def closed_through(c):
+    """Último dia arquivado ('AAAA-12-31', ver archive_year) ou '' se nenhum ano saiu do banco."""
+    year = meta_get(c, "archived_year")
+    return f"{year}-12-31" if year else ""
+
+def preload_items(c):
+    # Garante itens padrão
+    c.executemany("INSERT OR IGNORE INTO items(name) VALUES (?);", [(name,) for name in DEFAULT_MOV_NAMES])
+    # Também garante alguns itens extras usados antes
+    extras = ["TRAVESSEIRO","VIP COLCHA","VIP FRONHA","VIP LENÇOL","BLACK OUT"]
+    c.executemany("INSERT OR IGNORE INTO items(name) VALUES (?);", [(name,) for name in extras])
+    # catalog_gen é incrementado pelo bootstrap() na mesma transação (app_meta só existe a partir da versão 9)
+
+def create_default_user(c):
+    c.execute("SELECT 1 FROM users WHERE username='admin'")
+    if not c.fetchone():
+        c.execute("INSERT INTO users(username,password,active) VALUES (?,?,1)", ("admin", generate_password_hash("1234")))
+
+def migrate_history_indexes(c):
+    # Índices da paginação por chave (mov_day, id) do histórico, um por filtro
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mov_seek ON movements(mov_day, id);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mov_item_day ON movements(item_id, mov_day, id);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mov_type_day ON movements(mov_type, mov_day, id);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mov_ref_day ON movements(ref, mov_day, id);")
+    c.execute("DROP INDEX IF EXISTS idx_mov_item;")   # coberto por idx_mov_item_day
+
+def migrate_archive(c):
+    # Arquivo anual (ver archive_year): opening_balances guarda o saldo de cada item no início do primeiro
+    # ano que ficou no banco (uma linha por item a cada ano arquivado); archives, os arquivos gerados
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS opening_balances (
+            year INTEGER NOT NULL,
+            item_id INTEGER NOT NULL,
+            no_hotel INTEGER NOT NULL DEFAULT 0,
+            em_lavanderia INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(year, item_id),
+            FOREIGN KEY(item_id) REFERENCES items(id)
+        ) WITHOUT ROWID;
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS archives (
+            year INTEGER PRIMARY KEY,
+            file TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            first_id INTEGER,
+            last_id INTEGER,
+            archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+def migrate_item_aliases(c):
+    # Apelidos de itens (ex.: "LENCOL KING" para "LENÇOL CASAL"), usados na busca
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS item_aliases (
+            item_id INTEGER NOT NULL,
+            alias TEXT NOT NULL,
+            PRIMARY KEY(item_id, alias),
+            FOREIGN KEY(item_id) REFERENCES items(id)
+        );
+    """)
+
+# ------------- Estoque materializado -------------
+# Efeito de cada tipo de movimentação em (no_hotel, em_lavanderia)
+STOCK_EFFECT = {
+    'entrada': (1, 0), 'retorno': (1, -1), 'envio': (-1, 1),
+    'saida': (-1, 0), 'perda': (-1, 0),
+}
+
+STOCK_LEDGER_SQL = """
+    SELECT item_id,
+           SUM(CASE WHEN mov_type IN ('entrada','retorno') THEN qty
+                    WHEN mov_type IN ('envio','saida','perda') THEN -qty
+                    ELSE 0 END) as no_hotel,
+           SUM(CASE WHEN mov_type='envio' THEN qty
+                    WHEN mov_type='retorno' THEN -qty
+                    ELSE 0 END) as em_lavanderia
+    FROM movements GROUP BY item_id
+"""
+
+def stock_apply(c, deltas):
+    """Soma deltas {item_id: (no_hotel, em_lavanderia)} no saldo, no cursor/transação do chamador."""
+    c.executemany("""
+        INSERT INTO stock_balance(item_id, no_hotel, em_lavanderia) VALUES (?,?,?)
+        ON CONFLICT(item_id) DO UPDATE SET no_hotel=no_hotel+excluded.no_hotel,
+                                           em_lavanderia=em_lavanderia+excluded.em_lavanderia;
+    """, [(iid, h, l) for iid, (h, l) in deltas.items()])
+
+def stock_deltas(rows, sign=1):
+    """Agrupa movimentações (item_id, mov_type, qty) em deltas por item."""
+    deltas = {}
+    for iid, mov_type, qty in rows:
+        h, l = STOCK_EFFECT[mov_type]
+        dh, dl = deltas.get(iid, (0, 0))
+        deltas[iid] = (dh + sign*h*qty, dl + sign*l*qty)
+    return deltas
+
+def stock_opening(c):
+    """Saldos de abertura {item_id: (no_hotel, em_lavanderia)} do primeiro ano no banco (vazio sem arquivo anual)."""
+    c.execute("SELECT item_id, no_hotel, em_lavanderia FROM opening_balances WHERE year=(SELECT MAX(year) FROM opening_balances);")
+    return {r[0]: (r[1], r[2]) for r in c.fetchall()}
+
+def stock_verify(c):
+    """Compara o saldo materializado com o recalculado (abertura + livro de movimentos). Retorna a lista de divergências."""
+    c.execute(STOCK_LEDGER_SQL)
+    ledger = {r[0]: (r[1] or 0, r[2] or 0) for r in c.fetchall()}
+    for iid, (h, l) in stock_opening(c).items():
+        dh, dl = ledger.get(iid, (0, 0)); ledger[iid] = (dh + h, dl + l)
+    c.execute("SELECT item_id, no_hotel, em_lavanderia FROM stock_balance;")
+    stored = {r[0]: (r[1], r[2]) for r in c.fetchall()}
+    drift = []
+    for iid in sorted(set(ledger) | set(stored)):
+        exp = ledger.get(iid, (0, 0)); got = stored.get(iid, (0, 0))
+        if exp != got:
+            drift.append(dict(item_id=iid, esperado=exp, atual=got))
+    return drift
+
+def stock_fill(c, opening=True):
+    """Reescreve stock_balance inteiro a partir de movements e dos saldos de abertura (no cursor/transação do chamador)."""
+    c.execute("DELETE FROM stock_balance;")
+    c.execute("INSERT INTO stock_balance(item_id, no_hotel, em_lavanderia) " + STOCK_LEDGER_SQL + ";")
+    if opening:
+        stock_apply(c, stock_opening(c))
+
+def stock_rebuild(fix=True):
+    """Recalcula stock_balance a partir de movements. Retorna as divergências encontradas antes da correção."""
+    conn = db_connect(); c = conn.cursor()
+    try:
+        drift = stock_verify(c)
+        if fix and drift:
+            stock_fill(c)
+            ledger_changed(c)
+            conn.commit()
+    finally:
+        conn.close()
+    return drift
+
+def migrate_stock(c):
+    """Popula stock_balance na primeira execução após a atualização."""
+    stock_fill(c, opening=False)   # opening_balances só existe a partir da versão 12
+
+# ------------- Fechamento diário (rollup) -------------
+# stock_daily guarda, por dia e item com movimentação, os totais de cada tipo e o saldo ao fim do dia.
+# Gravações marcam o dia em rollup_dirty; rollup_refresh() refaz só esses dias e reencadeia os saldos
+# a partir do mais antigo deles. Dias sem linha herdam o saldo da última linha anterior do item.
+ROLLUP_FLOWS = ", ".join(f"SUM(CASE WHEN mov_type='{t}' THEN qty ELSE 0 END)" for t in MOV_TYPES)
+ROLLUP_NO_HOTEL = " + ".join(f"({STOCK_EFFECT[t][0]})*{t}" for t in MOV_TYPES)
+ROLLUP_EM_LAVANDERIA = " + ".join(f"({STOCK_EFFECT[t][1]})*{t}" for t in MOV_TYPES)
+
+def migrate_rollup(c):
+    c.execute(f"""
+        CREATE TABLE IF NOT EXISTS stock_daily (
+            day TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            {", ".join(f"{t} INTEGER NOT NULL DEFAULT 0" for t in MOV_TYPES)},
+            linhas INTEGER NOT NULL DEFAULT 0,
+            no_hotel INTEGER NOT NULL DEFAULT 0,
+            em_lavanderia INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(day, item_id)
+        ) WITHOUT ROWID;
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_daily_item ON stock_daily(item_id, day);")
+    c.execute("CREATE TABLE IF NOT EXISTS rollup_dirty (day TEXT PRIMARY KEY) WITHOUT ROWID;")
+    rollup_rebuild(c)
+
+def rollup_mark(c, days):
+    """Marca dias (qualquer formato aceito por date()) para recálculo, na transação do chamador."""
+    c.executemany("INSERT OR IGNORE INTO rollup_dirty(day) SELECT date(?) WHERE date(?) IS NOT NULL;",
+                  [(d, d) for d in set(days)])
+
+def rollup_refresh(c):
+    """Recalcula stock_daily dos dias pendentes (no cursor/transação do chamador). Retorna o nº de dias refeitos."""
+    c.execute("SELECT MIN(day), COUNT(*) FROM rollup_dirty;")
+    first, n = c.fetchone()
+    if not n:
+        return 0
+    c.execute("DELETE FROM stock_daily WHERE day IN (SELECT day FROM rollup_dirty);")
+    c.execute(f"""
+        INSERT INTO stock_daily(day, item_id, {", ".join(MOV_TYPES)}, linhas)
+        SELECT mov_day, item_id, {ROLLUP_FLOWS}, COUNT(*)
+        FROM movements WHERE mov_day IN (SELECT day FROM rollup_dirty)
+        GROUP BY mov_day, item_id;
+    """)
+    # Saldos: último fechamento antes do primeiro dia pendente + soma acumulada dos dias seguintes.
+    # pending é materializado para ler só os dias >= ?1 pela chave primária (sem ele o planner
+    # percorre idx_daily_item inteiro só para evitar ordenar a janela).
+    c.execute(f"""
+        WITH pending AS MATERIALIZED (SELECT * FROM stock_daily WHERE day >= ?1),
+        base AS (
+            SELECT i.id AS item_id,
+                   (SELECT no_hotel FROM stock_daily WHERE item_id=i.id AND day<?1 ORDER BY day DESC LIMIT 1) AS no_hotel,
+                   (SELECT em_lavanderia FROM stock_daily WHERE item_id=i.id AND day<?1 ORDER BY day DESC LIMIT 1) AS em_lavanderia
+            FROM items i
+        )
+        UPDATE stock_daily SET no_hotel=r.no_hotel, em_lavanderia=r.em_lavanderia
+        FROM (
+            SELECT s.day, s.item_id,
+                   IFNULL(b.no_hotel,0) + SUM({ROLLUP_NO_HOTEL}) OVER w AS no_hotel,
+                   IFNULL(b.em_lavanderia,0) + SUM({ROLLUP_EM_LAVANDERIA}) OVER w AS em_lavanderia
+            FROM pending s LEFT JOIN base b ON b.item_id=s.item_id
+            WINDOW w AS (PARTITION BY s.item_id ORDER BY s.day)
+        ) r
+        WHERE stock_daily.day=r.day AND stock_daily.item_id=r.item_id;
+    """, (first,))
+    c.execute("DELETE FROM rollup_dirty;")
+    return n
+
+def rollup_rebuild(c):
+    """Marca todo o histórico e refaz stock_daily do zero (no cursor/transação do chamador).
+
+    Dias de anos arquivados ficam como estão: suas movimentações já não estão em movements.
+    """
+    closed = closed_through(c)
+    c.execute("DELETE FROM stock_daily WHERE day > ?;", (closed,))
+    c.execute("INSERT OR IGNORE INTO rollup_dirty(day) SELECT DISTINCT mov_day FROM movements WHERE mov_day > ?;", (closed,))
+    return rollup_refresh(c)
+
+def rollup_update():
+    """Traz stock_daily em dia antes de uma leitura; sem dias pendentes custa uma consulta.
+
+    O recálculo é uma gravação: vai para a WRITE_QUEUE, e a leitura continua sem abrir transação.
+    """
+    conn = db_connect()
+    try:
+        pending = conn.execute("SELECT 1 FROM rollup_dirty LIMIT 1;").fetchone() is not None
+    finally:
+        conn.close()
+    return WRITE_QUEUE.submit(rollup_refresh) if pending else 0
+
+# ------------- Conciliação envio/retorno -------------
+# Cada envio vira um lote em recon_batches com o que ainda não voltou (open_qty). Um retorno abate lotes do mesmo
+# item com data até a sua: primeiro os da mesma ref. (o romaneio), depois os mais antigos (FIFO). O que o retorno
+# trouxe além dos lotes abertos fica em recon_excess e é abatido quando chega um envio com data igual ou anterior
+# (envio lançado depois do retorno). recon_matches guarda quanto cada retorno abateu de cada lote, para desfazer
+# exclusões. A conciliação é mantida nas mesmas operações que gravam o saldo e custa o que está em aberto do item,
+# não o histórico; envelhecimento e faltas leem os lotes, nunca refazem o casamento.
+# Por item vale: peças em lotes abertos - sobras = stock_balance.em_lavanderia (ver recon_verify).
+RECON_AGING_DAYS = (2, 7, 15, 30)   # limites (dias desde o envio) das faixas do envelhecimento; a última é "mais de 30"
+
+def migrate_recon(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS recon_batches (
+            envio_id INTEGER PRIMARY KEY,
+            item_id INTEGER NOT NULL,
+            mov_day TEXT NOT NULL,
+            ref TEXT NOT NULL DEFAULT '',
+            qty INTEGER NOT NULL,
+            open_qty INTEGER NOT NULL
+        );
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_recon_day ON recon_batches(mov_day, item_id);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_recon_open ON recon_batches(item_id, mov_day, envio_id) WHERE open_qty > 0;")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_recon_open_day ON recon_batches(mov_day, item_id, ref) WHERE open_qty > 0;")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS recon_matches (
+            retorno_id INTEGER NOT NULL,
+            envio_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            PRIMARY KEY(retorno_id, envio_id)
+        ) WITHOUT ROWID;
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_recon_match_envio ON recon_matches(envio_id);")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS recon_excess (
+            retorno_id INTEGER PRIMARY KEY,
+            item_id INTEGER NOT NULL,
+            mov_day TEXT NOT NULL,
+            ref TEXT NOT NULL DEFAULT '',
+            qty INTEGER NOT NULL
+        );
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_recon_excess_item ON recon_excess(item_id, mov_day);")
+    recon_rebuild(c)
+
+def _sorted_add(items, x):
+    if not items or items[-1] < x:
+        items.append(x)   # o caso comum: lançamentos chegam em ordem de data
+    else:
+        bisect.insort(items, x)
+
+def _drop_closed(batches):
+    """Tira da frente da lista os lotes que já voltaram inteiros."""
+    if batches and not batches[0][4]:
+        del batches[:next((k for k, b in enumerate(batches) if b[4]), len(batches))]
+
+class Reconciler:
+    """Conciliação dos itens tocados por uma operação, em memória; flush() grava só o que mudou.
+
+    Um item é lido na primeira vez que aparece (lotes abertos e sobras, pelos índices parciais). fresh=True parte
+    do zero sem ler nada (recon_rebuild). Lote = [dia, envio_id, ref, qty, aberto, item_id];
+    sobra = [dia, retorno_id, ref, qty, item_id]. As listas ficam em ordem de (dia, id); lotes que zeram saem
+    delas aos poucos (quando chegam à frente ou numa exclusão).
+    """
+    def __init__(self, c, fresh=False):
+        self.c = c; self.fresh = fresh
+        self.items = {}      # item_id -> (lotes abertos, {ref: lotes abertos}, sobras)
+        self.loaded = {}     # envio_id -> lote já em memória
+        self.batches = {}    # envio_id -> lote alterado
+        self.excess = {}     # retorno_id -> sobra alterada (qty 0 = apagar)
+        self.matches = {}    # (retorno_id, envio_id) -> peças abatidas nesta operação
+        self.dropped = []    # envio_id de lotes excluídos
+
+    def _state(self, iid):
+        st = self.items.get(iid)
+        if st is None:
+            batches, excess, refs = [], [], {}
+            if not self.fresh:
+                self.c.execute("""SELECT mov_day, envio_id, ref, qty, open_qty, item_id FROM recon_batches
+                                  WHERE item_id=? AND open_qty > 0 ORDER BY mov_day, envio_id;""", (iid,))
+                batches = [list(r) for r in self.c.fetchall()]
+                self.c.execute("SELECT mov_day, retorno_id, ref, qty, item_id FROM recon_excess WHERE item_id=? ORDER BY mov_day, retorno_id;", (iid,))
+                excess = [list(r) for r in self.c.fetchall()]
+            for b in batches:
+                self.loaded[b[1]] = b
+                if b[2]: refs.setdefault(b[2], []).append(b)
+            st = self.items[iid] = (batches, refs, excess)
+        return st
+
+    def _take(self, b, rid, qty):
+        q = min(b[4], qty); b[4] -= q
+        self.batches[b[1]] = b
+        self.matches[rid, b[1]] = self.matches.get((rid, b[1]), 0) + q
+        return qty - q
+
+    def _consume(self, iid, rid, day, ref, qty):
+        """Abate qty peças do retorno rid nos lotes abertos com data até day (mesma ref. primeiro). Devolve o que sobrou."""
+        batches, refs, _ = self._state(iid)
+        same = refs.get(ref) if ref else None
+        if same:
+            for b in same:
+                if b[0] > day or not qty: break
+                if b[4]: qty = self._take(b, rid, qty)
+            _drop_closed(same)
+            if not same: del refs[ref]
+        if qty:
+            for b in batches:
+                if b[0] > day or not qty: break
+                if b[4]: qty = self._take(b, rid, qty)
+        _drop_closed(batches)
+        return qty
+
+    def _absorb(self, b):
+        """Abate no lote b (novo ou reaberto) as sobras de retornos com data igual ou posterior à dele."""
+        excess = self.items[b[5]][2]
+        i = bisect.bisect_left(excess, [b[0]])
+        if i == len(excess) or not b[4]:
+            return
+        for e in sorted(excess[i:], key=lambda e: e[2] != b[2] or not b[2]):   # mesma ref. primeiro
+            if not b[4]: break
+            e[3] = self._take(b, e[1], e[3]); self.excess[e[1]] = e
+        excess[:] = [e for e in excess if e[3]]
+
+    def _open(self, b):
+        batches, refs, _ = self.items[b[5]]
+        _sorted_add(batches, b)
+        if b[2]: _sorted_add(refs.setdefault(b[2], []), b)
+
+    def _compact(self, iid):
+        batches, refs, _ = self._state(iid)
+        batches[:] = [b for b in batches if b[4]]
+        for ref in list(refs):
+            refs[ref] = [b for b in refs[ref] if b[4]]
+            if not refs[ref]: del refs[ref]
+
+    def _add_excess(self, iid, rid, day, ref, qty):
+        excess = self.items[iid][2]
+        e = next((e for e in excess if e[1] == rid), None) if not self.fresh else None
+        if e is None:
+            e = [day, rid, ref, 0, iid]; _sorted_add(excess, e)
+        e[3] += qty; self.excess[rid] = e
+
+    def envio(self, iid, eid, day, ref, qty):
+        self._state(iid)
+        b = self.loaded[eid] = self.batches[eid] = [day, eid, ref, qty, qty, iid]
+        self._open(b); self._absorb(b)
+
+    def retorno(self, iid, rid, day, ref, qty):
+        left = self._consume(iid, rid, day, ref, qty)
+        if left:
+            self._add_excess(iid, rid, day, ref, left)
+
+    def remove_envio(self, iid, eid):
+        """Exclui o lote; as peças que retornos tinham abatido dele voltam a ser casadas com os outros lotes."""
+        self._compact(iid)
+        b = self._batch(eid)
+        if b is None:
+            return
+        if b[4]:
+            b[4] = 0; self._compact(iid)
+        self.batches.pop(eid, None); self.dropped.append(eid)
+        self.c.execute("SELECT m.retorno_id, m.qty, v.mov_day, IFNULL(v.ref, '') FROM recon_matches m LEFT JOIN movements v ON v.id=m.retorno_id WHERE m.envio_id=?;", (eid,))
+        freed = self.c.fetchall()
+        self.c.execute("DELETE FROM recon_matches WHERE envio_id=?;", (eid,))
+        for rid, qty, day, ref in freed:
+            self.retorno(iid, rid, day or closed_through(self.c), ref or "", qty)
+
+    def remove_retorno(self, iid, rid):
+        """Desfaz o que o retorno abateu (os lotes reabrem e podem absorver sobras de outros retornos)."""
+        _, _, excess = self._state(iid)
+        self._compact(iid)
+        self.c.execute("SELECT envio_id, qty FROM recon_matches WHERE retorno_id=?;", (rid,))
+        reopened = []
+        for eid, qty in self.c.fetchall():
+            b = self._batch(eid)
+            if b is None: continue
+            if not b[4]: reopened.append(b)
+            b[4] += qty; self.batches[eid] = b
+        self.c.execute("DELETE FROM recon_matches WHERE retorno_id=?;", (rid,))
+        for e in excess:
+            if e[1] == rid:
+                e[3] = 0; self.excess[rid] = e
+        excess[:] = [e for e in excess if e[3]]
+        for b in sorted(reopened):
+            self._open(b)
+        for b in sorted(reopened):
+            self._absorb(b)
+
+    def _batch(self, eid):
+        b = self.loaded.get(eid)
+        if b is None:
+            self.c.execute("SELECT mov_day, envio_id, ref, qty, open_qty, item_id FROM recon_batches WHERE envio_id=?;", (eid,))
+            row = self.c.fetchone()
+            b = self.loaded[eid] = list(row) if row else None
+        return b
+
+    def flush(self):
+        c = self.c
+        c.executemany("DELETE FROM recon_batches WHERE envio_id=?;", [(eid,) for eid in self.dropped])
+        c.executemany("""INSERT INTO recon_batches(envio_id, item_id, mov_day, ref, qty, open_qty) VALUES (?,?,?,?,?,?)
+                         ON CONFLICT(envio_id) DO UPDATE SET open_qty=excluded.open_qty;""",
+                      [(b[1], b[5], b[0], b[2], b[3], b[4]) for b in self.batches.values()])
+        c.executemany("""INSERT INTO recon_matches(retorno_id, envio_id, qty) VALUES (?,?,?)
+                         ON CONFLICT(retorno_id, envio_id) DO UPDATE SET qty=qty+excluded.qty;""",
+                      [(rid, eid, q) for (rid, eid), q in self.matches.items() if q])
+        c.executemany("DELETE FROM recon_excess WHERE retorno_id=?;", [(rid,) for rid, e in self.excess.items() if not e[3]])
+        c.executemany("""INSERT INTO recon_excess(retorno_id, item_id, mov_day, ref, qty) VALUES (?,?,?,?,?)
+                         ON CONFLICT(retorno_id) DO UPDATE SET qty=excluded.qty;""",
+                      [(e[1], e[4], e[0], e[2], e[3]) for e in self.excess.values() if e[3]])
+        self.batches.clear(); self.matches.clear(); self.excess.clear(); self.dropped.clear()
+
+def recon_apply(c, after_id):
+    """Concilia os envios e retornos gravados com id > after_id, na transação do chamador."""
+    cur = c.connection.cursor(); cur.row_factory = None
+    cur.execute("""SELECT id, item_id, mov_type, mov_day, IFNULL(ref, ''), qty FROM movements
+                   WHERE id > ? AND mov_type IN ('envio','retorno') ORDER BY id;""", (after_id,))
+    rows = cur.fetchall(); cur.close()
+    if rows:
+        r = Reconciler(c)
+        for mid, iid, mov_type, day, ref, qty in rows:
+            (r.envio if mov_type == "envio" else r.retorno)(iid, mid, day, ref, qty)
+        r.flush()
+
+def recon_remove(c, mid, item_id, mov_type):
+    """Tira da conciliação um envio ou retorno que está sendo excluído, na transação do chamador."""
+    if mov_type in ("envio", "retorno"):
+        r = Reconciler(c)
+        (r.remove_envio if mov_type == "envio" else r.remove_retorno)(item_id, mid)
+        r.flush()
+
+def recon_rebuild(c):
+    """Refaz a conciliação do zero, em ordem de data (no cursor/transação do chamador). Retorna o nº de lotes abertos.
+
+    O que estava na lavanderia ao fim do último ano arquivado vira um lote (ou sobra) de abertura por item,
+    com id negativo e a data do último dia arquivado.
+    """
+    for table in ("recon_batches", "recon_matches", "recon_excess"):
+        c.execute(f"DELETE FROM {table};")
+    r = Reconciler(c, fresh=True); closed = closed_through(c)
+    for iid, (_, l) in sorted(stock_opening(c).items()):
+        if l > 0: r.envio(iid, -iid, closed, "", l)
+        elif l < 0: r.retorno(iid, -iid, closed, "", -l)
+    rows = c.connection.cursor(); rows.row_factory = None
+    rows.execute("""SELECT id, item_id, mov_type, mov_day, IFNULL(ref, ''), qty FROM movements
+                    WHERE mov_type IN ('envio','retorno') ORDER BY mov_day, id;""")
+    for mid, iid, mov_type, day, ref, qty in rows:
+        (r.envio if mov_type == "envio" else r.retorno)(iid, mid, day, ref, qty)
+    rows.close()
+    r.flush()
+    c.execute("SELECT COUNT(*) FROM recon_batches WHERE open_qty > 0;")
+    return c.fetchone()[0]
+
+def recon_verify(c):
+    """Confere, por item, peças em lotes abertos - sobras contra stock_balance.em_lavanderia. Retorna as divergências."""
+    c.execute("""
+        SELECT s.item_id, s.em_lavanderia,
+               (SELECT IFNULL(SUM(open_qty), 0) FROM recon_batches b WHERE b.item_id=s.item_id AND b.open_qty > 0)
+             - (SELECT IFNULL(SUM(qty), 0) FROM recon_excess e WHERE e.item_id=s.item_id)
+        FROM stock_balance s;
+    """)
+    return [dict(item_id=r[0], em_lavanderia=r[1], conciliado=r[2]) for r in c.fetchall() if r[1] != r[2]]
+
+def recon_aging_labels():
+    edges = RECON_AGING_DAYS
+    return [f"0-{edges[0]}"] + [f"{a + 1}-{b}" for a, b in zip(edges, edges[1:])] + [f"{edges[-1] + 1}+"]
+
+def recon_aging(today=None):
+    """Peças na lavanderia por item e faixa de idade do envio (RECON_AGING_DAYS), só dos lotes em aberto."""
+    if LEDGER.name != "sqlite":
+        raise RuntimeError("A conciliação envio/retorno só está disponível no livro SQLite local.")
+    today = today or date.today().isoformat()
+    bucket = "CASE " + " ".join(f"WHEN age <= {d} THEN {k}" for k, d in enumerate(RECON_AGING_DAYS)) + f" ELSE {len(RECON_AGING_DAYS)} END"
+    conn = db_connect(); c = conn.cursor()
+    try:
+        c.execute(f"""
+            SELECT item_id, {bucket} AS faixa, COUNT(*), SUM(open_qty), MIN(mov_day)
+            FROM (SELECT item_id, mov_day, open_qty, CAST(julianday(?) - julianday(mov_day) AS INTEGER) AS age
+                  FROM recon_batches WHERE open_qty > 0)
+            GROUP BY item_id, faixa;
+        """, (today,))
+        open_rows = c.fetchall()
+        c.execute("SELECT item_id, SUM(qty) FROM recon_excess GROUP BY item_id;")
+        excess = dict(c.fetchall())
+        c.execute("SELECT id, name FROM items ORDER BY name;")
+        names = c.fetchall()
+    finally:
+        conn.close()
+    acc = {}
+    for iid, faixa, lotes, pecas, first in open_rows:
+        a = acc.setdefault(iid, [0, 0, first, [0] * (len(RECON_AGING_DAYS) + 1)])
+        a[0] += lotes; a[1] += pecas; a[2] = min(a[2], first); a[3][faixa] += pecas
+    return [AgingRow(iid, name, *acc.get(iid, (0, 0, None, [0] * (len(RECON_AGING_DAYS) + 1))), excess.get(iid, 0))
+            for iid, name in names if iid in acc or iid in excess]
+
+def recon_shortfall(start, end, today=None):
+    """Envios de start a end que ainda não voltaram inteiros, por dia, item e ref. (lotes do mesmo dia somados)."""
+    if LEDGER.name != "sqlite":
+        raise RuntimeError("A conciliação envio/retorno só está disponível no livro SQLite local.")
+    conn = db_connect(); c = conn.cursor()
+    try:
+        # Os grupos com falta saem dos lotes abertos (índice parcial); só eles somam os lotes já devolvidos do dia
+        c.execute("""
+            WITH short AS MATERIALIZED (
+                SELECT DISTINCT mov_day, item_id, ref FROM recon_batches WHERE open_qty > 0 AND mov_day BETWEEN ?2 AND ?3
+            )
+            SELECT s.mov_day, s.item_id, i.name, s.ref, SUM(b.qty), SUM(b.qty - b.open_qty), SUM(b.open_qty),
+                   CAST(julianday(?1) - julianday(s.mov_day) AS INTEGER)
+            FROM short s
+            JOIN recon_batches b ON b.mov_day=s.mov_day AND b.item_id=s.item_id AND b.ref=s.ref
+            JOIN items i ON i.id=s.item_id
+            GROUP BY s.mov_day, s.item_id, s.ref
+            ORDER BY s.mov_day, i.name, s.ref;
+        """, (today or date.today().isoformat(), start, end))
+        return [ShortfallRow(*r) for r in c.fetchall()]
+    finally:
+        conn.close()
+
+# ------------- Catálogo de itens (cache) -------------
+# Itens ativos e derivados em memória, compartilhados pelas threads do processo.
+# Toda escrita em items/item_aliases chama items_changed(c) antes do commit, o que incrementa
+# app_meta.catalog_gen. Cada conexão só relê esse contador quando PRAGMA data_version indica
+# que outra conexão (de qualquer processo) gravou algo; se o contador mudou, o catálogo é recarregado.
+_catalog = dict(gen=None, data=None)
+_catalog_lock = threading.Lock()
+_catalog_stats = dict(hits=0, misses=0, gen_checks=0)
+
+def items_changed(c):
+    """Invalida o catálogo em todos os processos; chamar dentro da transação que alterou os itens."""
+    meta_bump(c, "catalog_gen")
+    c.connection.catalog_dv = None   # o próprio data_version não muda com commits desta conexão
+    ledger_changed(c)
+
+def _catalog_load(c, gen):
+    c.execute("SELECT id, name FROM items WHERE active=1 ORDER BY name;")
+    items = c.fetchall()
+    id_by_name = {r["name"]: r["id"] for r in items}
+    return dict(gen=gen, items=items, id_by_name=id_by_name,
+                default_ids=[id_by_name[name] for name in DEFAULT_MOV_NAMES if name in id_by_name],
+                ids=frozenset(id_by_name.values()))
+
+def catalog():
+    """Catálogo atual: dict(gen, items=[Row(id, name)] por nome, id_by_name, default_ids, ids). Não alterar."""
+    conn = db_connect(); c = conn.cursor()
+    try:
+        c.execute("PRAGMA data_version;"); dv = c.fetchone()[0]
+        data = _catalog["data"]
+        if data is not None and conn.catalog_dv == dv:
+            with _catalog_lock:
+                _catalog_stats["hits"] += 1
+            return data
+        gen = meta_get(c, "catalog_gen")
+        with _catalog_lock:
+            _catalog_stats["gen_checks"] += 1
+            data = _catalog["data"]
+            if data is None or _catalog["gen"] != gen:
+                data = _catalog_load(c, gen)
+                _catalog.update(gen=gen, data=data); _catalog_stats["misses"] += 1
+            else:
+                _catalog_stats["hits"] += 1
+        conn.catalog_dv = dv
+        return data
+    finally:
+        conn.close()
+
+def catalog_stats():
+    with _catalog_lock:
+        return dict(_catalog_stats, gen=_catalog["gen"])
+
+def active_item_ids():
+    return catalog()["ids"]
+
+# ------------- Versão do livro -------------
+# ledger_gen sobe a cada gravação de movimentações, saldo ou itens; ledger_at guarda quando (epoch, s).
+# É a chave dos ETags e do cache de páginas: mesma versão, mesmo resultado.
+_ledger_version = dict(gen=None, at=0)
+_ledger_version_lock = threading.Lock()
+
+def ledger_changed(c):
+    """Nova versão do livro; chamar dentro da transação que gravou (visível a todos no commit)."""
+    meta_bump(c, "ledger_gen")
+    c.execute("""INSERT INTO app_meta(key, value) VALUES ('ledger_at', CAST(strftime('%s','now') AS INTEGER))
+                 ON CONFLICT(key) DO UPDATE SET value=excluded.value;""")
+    c.connection.ledger_dv = None
+
+def ledger_version():
+    """(gen, at) da versão atual do livro. Só relê app_meta quando o PRAGMA data_version da conexão mudou."""
+    conn = db_connect(); c = conn.cursor()
+    try:
+        c.execute("PRAGMA data_version;"); dv = c.fetchone()[0]
+        if conn.ledger_dv == dv and _ledger_version["gen"] is not None:
+            return _ledger_version["gen"], _ledger_version["at"]
+        gen, at = meta_get(c, "ledger_gen"), meta_get(c, "ledger_at")
+        with _ledger_version_lock:
+            if _ledger_version["gen"] is None or gen >= _ledger_version["gen"]:
+                _ledger_version.update(gen=gen, at=at)
+        conn.ledger_dv = dv
+        return gen, at
+    finally:
+        conn.close()
+
+def column_type(c, table, column):
+    c.execute(f"PRAGMA table_info({table});")
+    return next((r[2].upper() for r in c.fetchall() if r[1] == column), None)
+
+def migrate_integer_qty(c):
+    """Quantidades em peças inteiras: refaz movements com qty INTEGER e recria saldo e fechamento (derivados).
+
+    Quantidades fracionadas são arredondadas; antes, cada uma vai para qty_rounding com o valor original e a
+    contagem vai para o log (e para 'flask --app app schema').
+    """
+    if column_type(c, "movements", "qty") != "INTEGER":
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS qty_rounding (
+                movement_id INTEGER PRIMARY KEY,
+                item_id INTEGER NOT NULL,
+                mov_day TEXT,
+                mov_type TEXT NOT NULL,
+                qty_original REAL NOT NULL,
+                qty_rounded INTEGER NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        c.execute("""
+            INSERT OR IGNORE INTO qty_rounding(movement_id, item_id, mov_day, mov_type, qty_original, qty_rounded)
+            SELECT id, item_id, mov_day, mov_type, qty, CAST(ROUND(qty) AS INTEGER) FROM movements WHERE qty <> ROUND(qty);
+        """)
+        if c.rowcount > 0:
+            logging.getLogger(__name__).warning(
+                "quantidades inteiras: %d movimentação(ões) com quantidade fracionada arredondada(s); "
+                "valores originais em qty_rounding", c.rowcount)
+        c.execute("SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name='movements' AND sql IS NOT NULL;")
+        indexes = [r[0] for r in c.fetchall()]
+        c.execute("SELECT seq FROM sqlite_sequence WHERE name='movements';")
+        seq = (c.fetchone() or (0,))[0]
+        c.execute("DROP TABLE IF EXISTS movements_new;")
+        c.execute(MOVEMENTS_DDL.format(table="movements_new"))
+        c.execute(f"""
+            INSERT INTO movements_new({MOVEMENTS_COLUMNS})
+            SELECT {MOVEMENTS_COLUMNS.replace("qty", "CAST(ROUND(qty) AS INTEGER)")} FROM movements ORDER BY id;
+        """)
+        c.execute("DROP TABLE movements;")
+        c.execute("ALTER TABLE movements_new RENAME TO movements;")
+        for sql in indexes:
+            c.execute(sql)
+        # Mantém a sequência do AUTOINCREMENT (ids de movimentações apagadas no fim não voltam)
+        c.execute("DELETE FROM sqlite_sequence WHERE name='movements';")
+        c.execute("INSERT INTO sqlite_sequence(name, seq) SELECT 'movements', MAX(?, IFNULL(MAX(id), 0)) FROM movements;", (seq,))
+    if column_type(c, "stock_balance", "no_hotel") != "INTEGER":
+        c.execute("DROP TABLE stock_balance;")
+        c.execute(STOCK_BALANCE_DDL)
+    stock_fill(c, opening=False)
+    if column_type(c, "stock_daily", "no_hotel") != "INTEGER":
+        c.execute("DROP TABLE stock_daily;")
+    migrate_rollup(c)
+
+# ------------- Migrações versionadas -------------
+# Cada passo roda uma única vez; a versão aplicada fica em schema_version.
+# Passos novos entram sempre no fim da lista, com o próximo número.
+MIGRATIONS = [
+    (1, "tabelas base", init_db),
+    (2, "users.active e movements.mov_day", migrate_db),
+    (3, "normaliza tipos e índices", migrate_data),
+    (4, "saldo materializado", migrate_stock),
+    (5, "itens padrão", preload_items),
+    (6, "usuário admin", create_default_user),
+    (7, "apelidos de itens", migrate_item_aliases),
+    (8, "índices do histórico de movimentações", migrate_history_indexes),
+    (9, "tabela app_meta", create_app_meta),
+    (10, "fechamento diário por item", migrate_rollup),
+    (11, "quantidades inteiras", migrate_integer_qty),
+    (12, "arquivo anual e saldos de abertura", migrate_archive),
+    (13, "conciliação envio/retorno", migrate_recon),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+SQLITE_MIN_VERSION = (3, 35, 0)   # o fechamento diário usa UPDATE ... FROM (3.33) e WITH ... AS MATERIALIZED (3.35)
+BOOTSTRAP_STATS = dict(seconds=0.0, version=0, applied=[])
+
+def schema_current_version(c):
+    try:
+        c.execute("SELECT MAX(version) FROM schema_version;")
+    except sqlite3.OperationalError:
+        return 0
+    return c.fetchone()[0] or 0
+
+def bootstrap():
+    """Aplica as migrações pendentes numa única transação. Com o schema em dia custa um SELECT."""
+    if sqlite3.sqlite_version_info < SQLITE_MIN_VERSION:
+        raise RuntimeError(f"SQLite {sqlite3.sqlite_version} é antigo demais: o app precisa do "
+                           f"{'.'.join(map(str, SQLITE_MIN_VERSION))} ou mais novo (atualize o Python; o 3.10+ já traz)")
+    t = time.perf_counter()
+    conn = db_connect(); c = conn.cursor(); applied = []
+    try:
+        version = schema_current_version(c)
+        if version < SCHEMA_VERSION:
+            c.execute("BEGIN IMMEDIATE;")
+            c.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+                             version INTEGER PRIMARY KEY,
+                             name TEXT NOT NULL,
+                             applied_at TEXT DEFAULT CURRENT_TIMESTAMP);""")
+            version = schema_current_version(c)   # outro processo pode ter migrado enquanto esperávamos o lock
+            for step_version, name, step in MIGRATIONS:
+                if step_version > version:
+                    step(c)
+                    c.execute("INSERT INTO schema_version(version, name) VALUES (?,?);", (step_version, name))
+                    applied.append(step_version)
+            if applied:
+                items_changed(c)
+            conn.commit()
+            version = SCHEMA_VERSION
+    except Exception:
+        conn.rollback(); raise
+    finally:
+        conn.close()
+    BOOTSTRAP_STATS.update(seconds=round(time.perf_counter() - t, 4), version=version, applied=applied)
+
+bootstrap()
+
+# ------------- Utils -------------
+def login_required(fn):
+    from functools import wraps
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if "user_id" not in session:
+            return redirect(url_for("login"))
+        return fn(*args, **kwargs)
+    return wrapper
+
+def admin_required(fn):
+    from functools import wraps
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if "user_id" not in session:
+            return redirect(url_for("login"))
+        if session.get("username") != "admin":
+            flash("Acesso restrito ao administrador.", "error")
+            return redirect(url_for("dashboard"))
+        return fn(*args, **kwargs)
+    return wrapper
+
+def parse_period(period:str, ref_str:str):
+    try:
+        ref = datetime.strptime(ref_str, "%Y-%m-%d").date()
+    except Exception:
+        ref = date.today()
+    if period == "semana":
+        start = ref - timedelta(days=ref.weekday())  # segunda
+        end = start + timedelta(days=6)              # domingo
+    elif period == "mes":
+        start = ref.replace(day=1)
+        last = calendar.monthrange(ref.year, ref.month)[1]
+        end = ref.replace(day=last)
+    else:
+        start = end = ref
+    return (start.isoformat(), end.isoformat())
+
+def period_from_args(args):
+    """Período das exportações: start/end explícitos (AAAA-MM-DD) ou o preset period/ref. Retorna (period, ref, start, end)."""
+    period = args.get("period","dia")
+    ref = args.get("ref") or date.today().isoformat()
+    try:
+        start = datetime.strptime(args.get("start",""), "%Y-%m-%d").date()
+        end = datetime.strptime(args.get("end",""), "%Y-%m-%d").date()
+    except ValueError:
+        return (period, ref) + parse_period(period, ref)
+    if start > end:
+        start, end = end, start
+    return ("intervalo", ref, start.isoformat(), end.isoformat())
+
+# Consultas de relatório: filtram por mov_day (indexada), nunca por date(mov_date).
+# Totais por dia vêm de stock_daily (dias x itens), não do livro de movimentos.
+# {db}: 'main' ou o arquivo anual anexado (ver ledger_dbs).
+REPORT_SQL = {
+    "agregado_periodo": f"""
+        SELECT day, {", ".join(f"SUM({t})" for t in MOV_TYPES)}, SUM(linhas)
+        FROM stock_daily WHERE day BETWEEN date(?) AND date(?)
+        GROUP BY day;
+    """,
+    "itens_periodo": "SELECT COUNT(DISTINCT item_id) FROM stock_daily WHERE day BETWEEN date(?) AND date(?);",
+    "movimentos_periodo": """
+        SELECT m.mov_date, m.mov_type, i.name as item, m.qty, m.ref, m.note, m.created_at
+        FROM {db}.movements m JOIN items i ON i.id=m.item_id
+        WHERE m.mov_day BETWEEN date(?) AND date(?)
+        ORDER BY m.mov_day ASC, m.id ASC;
+    """,
+    "romaneio_periodo": """
+        SELECT m.mov_day, m.mov_type, i.name, SUM(m.qty) as qty
+        FROM {db}.movements m JOIN items i ON i.id=m.item_id
+        WHERE m.mov_day BETWEEN date(?) AND date(?) AND m.mov_type IN ('envio','retorno')
+        GROUP BY m.mov_day, m.mov_type, i.name ORDER BY m.mov_day, i.name;
+    """,
+    "romaneio_dia": """
+        SELECT i.name, SUM(m.qty) as qty
+        FROM {db}.movements m JOIN items i ON i.id=m.item_id
+        WHERE m.mov_type=? AND m.mov_day=date(?)
+        GROUP BY i.name ORDER BY i.name;
+    """,
+}
+
+def report_query_plans():
+    """EXPLAIN QUERY PLAN das consultas de relatório. Retorna {nome: [detalhes]} e a lista das que varrem movements."""
+    conn = db_connect(); c = conn.cursor(); plans = {}; scans = []
+    for name, sql in REPORT_SQL.items():
+        sql = sql.format(db="main")
+        c.execute("EXPLAIN QUERY PLAN " + sql, [None] * sql.count("?"))
+        plans[name] = [r[3] for r in c.fetchall()]
+        if any(d.startswith(("SCAN m", "SCAN movements", "SCAN stock_daily")) for d in plans[name]):
+            scans.append(name)
+    conn.close()
+    return plans, scans
+
+# ------------- Relatórios (agregação em uma passada) -------------
+def period_report(start, end):
+    """Totais por tipo, linhas, itens distintos e série diária do período, em duas consultas ao fechamento diário.
+
+    Retorna dict(start, end, totals={tipo: qtd}, linhas, itens_distintos, days={'AAAA-MM-DD': {tipo: qtd}}).
+    """
+    rollup_update()
+    conn = db_connect(); c = conn.cursor()
+    c.execute(REPORT_SQL["agregado_periodo"], (start, end))
+    totals = dict.fromkeys(MOV_TYPES, 0); days = {}; linhas = 0
+    for day, *qtys, n in c.fetchall():
+        days[day] = dict(zip(MOV_TYPES, qtys))
+        for mov_type, qty in days[day].items():
+            totals[mov_type] += qty
+        linhas += n
+    c.execute(REPORT_SQL["itens_periodo"], (start, end))
+    itens_distintos = c.fetchone()[0]
+    conn.close()
+    return dict(start=start, end=end, totals=totals, linhas=linhas, itens_distintos=itens_distintos, days=days)
+
+def report_day(report, d):
+    """Totais por tipo de um dia do relatório (zeros se não houve movimento)."""
+    return report["days"].get(d) or dict.fromkeys(MOV_TYPES, 0)
+
+def last_7_range():
+    today = date.today()
+    return (today - timedelta(days=6)).isoformat(), today.isoformat()
+
+def kpis_range(start, end, report=None):
+    report = report or LEDGER.period_report(start, end)
+    return dict(report["totals"], linhas=report["linhas"], itens_distintos=report["itens_distintos"])
+
+def movements_in_range(start, end):
+    """Tuplas (mov_date, mov_type, item, qty, ref, note, created_at) do período, em ordem de data."""
+    return list(iter_ledger(REPORT_SQL["movimentos_periodo"], start, end, (start, end)))
+
+def iter_query(sql, params=(), size=500, plain=False):
+    """Itera o resultado em blocos de fetchmany, sem materializar a lista inteira (plain: tuplas em vez de Row)."""
+    conn = db_connect(); c = conn.cursor()
+    if plain:
+        c.row_factory = None
+    try:
+        c.execute(sql, params)
+        while True:
+            rows = c.fetchmany(size)
+            if not rows: break
+            yield from rows
+    finally:
+        conn.close()
+
+def iter_ledger(sql, start, end, params=(), size=500):
+    """Como iter_query(plain=True) para uma consulta com {db}, no banco principal e nos arquivos anuais de start a end."""
+    conn = db_connect(); c = conn.cursor(); c.row_factory = None
+    dbs = ledger_dbs(c, start, end)
+    try:
+        for db in dbs:
+            c.execute(sql.format(db=db), params)
+            while True:
+                rows = c.fetchmany(size)
+                if not rows: break
+                yield from rows
+    finally:
+        dbs.close()
+        conn.close()
+
+def stock_rows(items, balance):
+    """[StockRow] dos itens do catálogo com os saldos {item_id: (no_hotel, em_lavanderia)} (ausente = zero)."""
+    data = []
+    for iid, name in items:
+        no_hotel, em_lavanderia = balance.get(iid, (0, 0))
+        data.append(StockRow(iid, name, no_hotel, em_lavanderia, no_hotel + em_lavanderia))
+    return data
+
+def get_stock_summary():
+    """Estoque atual por item ativo: [StockRow(id, name, no_hotel, em_lavanderia, total)], em peças."""
+    items = catalog()["items"]
+    conn = db_connect(); c = conn.cursor(); c.row_factory = None
+    c.execute("SELECT item_id, no_hotel, em_lavanderia FROM stock_balance;")
+    balance = {iid: (h, l) for iid, h, l in c.fetchall()}; conn.close()
+    return stock_rows(items, balance)
+
+def stock_on(d):
+    """Estoque por item ativo ao fim do dia d (mesmo formato de get_stock_summary), lido do fechamento diário."""
+    rollup_update()
+    items = catalog()["items"]
+    conn = db_connect(); c = conn.cursor(); c.row_factory = None
+    c.execute("""
+        SELECT i.id,
+               (SELECT no_hotel FROM stock_daily WHERE item_id=i.id AND day<=date(?1) ORDER BY day DESC LIMIT 1),
+               (SELECT em_lavanderia FROM stock_daily WHERE item_id=i.id AND day<=date(?1) ORDER BY day DESC LIMIT 1)
+        FROM items i WHERE i.active=1;
+    """, (d,))
+    balance = {iid: (h or 0, l or 0) for iid, h, l in c.fetchall()}; conn.close()
+    return stock_rows(items, balance)
+
+def stock_trend(start, end, item_id=None):
+    """Série diária de start a end: [TrendDay(day, <tipos>, no_hotel, em_lavanderia)] com saldos no fim de cada dia.
+
+    Custa O(dias x itens): parte do saldo anterior a start e acumula as linhas de stock_daily do período.
+    """
+    rollup_update()
+    conn = db_connect(); c = conn.cursor()
+    c.execute(f"""
+        SELECT (SELECT no_hotel FROM stock_daily WHERE item_id=i.id AND day<date(?1) ORDER BY day DESC LIMIT 1),
+               (SELECT em_lavanderia FROM stock_daily WHERE item_id=i.id AND day<date(?1) ORDER BY day DESC LIMIT 1)
+        FROM items i {"WHERE i.id=?3" if item_id else ""};
+    """, (start, end, item_id) if item_id else (start,))
+    no_hotel = em_lavanderia = 0
+    for h, l in c.fetchall():
+        no_hotel += h or 0; em_lavanderia += l or 0
+    c.execute(f"""
+        SELECT day, {", ".join(f"SUM({t})" for t in MOV_TYPES)}
+        FROM stock_daily WHERE day BETWEEN date(?1) AND date(?2) {"AND item_id=?3" if item_id else ""}
+        GROUP BY day;
+    """, (start, end, item_id) if item_id else (start, end))
+    by_day = {r[0]: r[1:] for r in c.fetchall()}; conn.close()
+    TrendDay = trend_day(MOV_TYPES)
+    effect_h = [STOCK_EFFECT[t][0] for t in MOV_TYPES]; effect_l = [STOCK_EFFECT[t][1] for t in MOV_TYPES]
+    series = []; d = date.fromisoformat(start); last = date.fromisoformat(end)
+    zero = (0,) * len(MOV_TYPES)
+    while d <= last:
+        day = d.isoformat(); flows = by_day.get(day, zero)
+        no_hotel += sum(h * q for h, q in zip(effect_h, flows))
+        em_lavanderia += sum(l * q for l, q in zip(effect_l, flows))
+        series.append(TrendDay(day, *flows, no_hotel, em_lavanderia))
+        d += timedelta(days=1)
+    return series
+
+def kpis_for_day(d, report=None, itens=None):
+    report = report or LEDGER.period_report(d, d)
+    if itens is None:
+        itens = len(active_item_ids())
+    day = report_day(report, d)
+    return dict(itens=itens, envios=day['envio'], retornos=day['retorno'])
+
+def series_last_7(report=None):
+    days = [date.today()-timedelta(days=i) for i in range(6,-1,-1)]
+    report = report or LEDGER.period_report(*last_7_range())
+    series = []
+    for d in days:
+        day = report_day(report, d.isoformat())
+        series.append(SeriesDay(d.strftime('%d/%m'), day['envio'], day['retorno']))
+    return series
+
+def query_romaneio(d):
+    """Envio e retorno do dia: duas listas de RomaneioLine(name, qty) por nome de item."""
+    conn = db_connect(); c = conn.cursor(); c.row_factory = None; envio = []; retorno = []
+    dbs = ledger_dbs(c, d, d)
+    try:
+        for db in dbs:
+            sql = REPORT_SQL["romaneio_dia"].format(db=db)
+            c.execute(sql,('envio',d)); envio += map(RomaneioLine._make, c.fetchall())
+            c.execute(sql,('retorno',d)); retorno += map(RomaneioLine._make, c.fetchall())
+    finally:
+        dbs.close(); conn.close()
+    return envio, retorno
+
+def query_romaneio_range(start, end):
+    """Romaneios de vários dias numa consulta agrupada: [(dia, [RomaneioLine] envio, [RomaneioLine] retorno)], só dias com movimento."""
+    days = OrderedDict()
+    for day, mov_type, name, qty in iter_ledger(REPORT_SQL["romaneio_periodo"], start, end, (start, end)):
+        envio, retorno = days.setdefault(day, ([], []))
+        (envio if mov_type == 'envio' else retorno).append(RomaneioLine(name, qty))
+    return [(d, envio, retorno) for d, (envio, retorno) in days.items()]
+
+# ------------- Histórico paginado -------------
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+def encode_cursor(mov_day, mid):
+    return base64.urlsafe_b64encode(json.dumps([mov_day, mid]).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """(mov_day, id) do cursor opaco; ValueError se inválido."""
+    try:
+        mov_day, mid = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(mov_day), int(mid)
+    except Exception:
+        raise ValueError("cursor inválido")
+
+def history_rows(item_id=None, mov_type=None, ref=None, start=None, end=None, after=None, limit=HISTORY_PAGE_SIZE):
+    """Até limit linhas do histórico anteriores à chave after=(mov_day, id), mais recentes primeiro.
+
+    Cada filtro tem índice terminando em (mov_day, id), então qualquer página custa o mesmo que a primeira.
+    """
+    where, params = [], []
+    if item_id: where.append("m.item_id=?"); params.append(item_id)
+    if mov_type: where.append("m.mov_type=?"); params.append(mov_type)
+    if ref: where.append("m.ref=?"); params.append(ref)
+    if start: where.append("m.mov_day>=date(?)"); params.append(start)
+    if end: where.append("m.mov_day<=date(?)"); params.append(end)
+    if after:
+        where.append("(m.mov_day, m.id) < (?, ?)"); params += list(after)
+    else:
+        where.append("m.mov_day IS NOT NULL")
+    conn = db_connect(); c = conn.cursor(); rows = []
+    # Mais recentes primeiro: o banco principal e, se a página não encher, os anos arquivados do mais novo ao mais velho
+    dbs = ledger_dbs(c, start, after[0] if after else end, newest_first=True)
+    try:
+        for db in dbs:
+            c.execute(f"""
+                SELECT m.id, m.mov_date, m.mov_day, m.mov_type, m.qty, m.ref, m.note, m.created_at, i.name as item_name
+                FROM {db}.movements m JOIN items i ON i.id = m.item_id
+                WHERE {" AND ".join(where)}
+                ORDER BY m.mov_day DESC, m.id DESC
+                LIMIT ?;
+            """, params + [limit - len(rows)])
+            rows += c.fetchall()
+            if len(rows) >= limit: break
+    finally:
+        dbs.close()   # o break deixa o 'arq' anexado até o gerador fechar: DETACH agora, não no coletor de lixo
+        conn.close()
+    return rows
+
+def movements_page(item_id=None, mov_type=None, ref=None, start=None, end=None, cursor=None, limit=HISTORY_PAGE_SIZE):
+    """Página do histórico por chave (mov_day, id) em vez de OFFSET. Retorna (linhas, próximo_cursor ou None)."""
+    after = decode_cursor(cursor) if cursor else None
+    rows = LEDGER.history_rows(item_id, mov_type, ref, start, end, after, limit + 1)
+    next_cursor = encode_cursor(rows[limit - 1]["mov_day"], rows[limit - 1]["id"]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def history_filters(args):
+    """Filtros do histórico a partir da query string (item, tipo, ref, inicio, fim, cursor, limite)."""
+    try:
+        item_id = int(args.get("item") or 0) or None
+    except ValueError:
+        item_id = None
+    mov_type = (args.get("tipo") or "").strip().lower()
+    try:
+        limit = max(1, min(int(args.get("limite") or HISTORY_PAGE_SIZE), HISTORY_MAX_PAGE_SIZE))
+    except ValueError:
+        limit = HISTORY_PAGE_SIZE
+    return dict(item_id=item_id, mov_type=mov_type if mov_type in MOV_TYPES else None,
+                ref=(args.get("ref") or "").strip() or None,
+                start=args.get("inicio") or None, end=args.get("fim") or None,
+                cursor=args.get("cursor") or None, limit=limit)
+
+# ------------- Busca de itens -------------
+def fold_text(text):
+    """Forma de comparação: sem acentos, minúscula e com espaços simples ("Lençol  Casal" -> "lencol casal")."""
+    text = unicodedata.normalize("NFKD", text or "")
+    return " ".join("".join(ch for ch in text if not unicodedata.combining(ch)).casefold().split())
+
+def _trigrams(text):
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+class ItemSearchIndex:
+    """Índice em memória (trigramas + prefixos curtos) sobre nomes e apelidos dos itens ativos."""
+
+    def __init__(self, entries):
+        # entries: [(item_id, name, [termos já normalizados])]
+        self.entries = entries
+        self.grams = {}
+        for pos, (_, _, terms) in enumerate(entries):
+            keys = set()
+            for term in terms:
+                keys |= _trigrams(term)
+                for word in term.split():
+                    keys.add(word[:1]); keys.add(word[:2])
+            for k in keys:
+                self.grams.setdefault(k, set()).add(pos)
+
+    @staticmethod
+    def _rank(fq, words, terms):
+        best = None
+        for n, term in enumerate(terms):   # terms[0] é o nome; demais são apelidos
+            if term == fq: r = 0
+            elif term.startswith(fq): r = 1
+            elif any(w.startswith(fq) for w in term.split()): r = 2
+            elif fq in term: r = 3
+            elif len(words) > 1 and all(w in term if len(w) > 2 else any(tw.startswith(w) for tw in term.split()) for w in words): r = 4
+            else: continue
+            r = r * 2 + (n > 0)
+            best = r if best is None else min(best, r)
+        return best
+
+    def search(self, q, limit=10):
+        """[(item_id, name, rank)] do melhor para o pior; rank menor = melhor."""
+        fq = fold_text(q)
+        if not fq:
+            return []
+        # Cada palavra restringe os candidatos: trigramas (3+ letras) ou prefixo de palavra (1-2 letras)
+        words = fq.split(); postings = []
+        for w in words:
+            postings += [self.grams.get(w, set())] if len(w) < 3 else [self.grams.get(g, set()) for g in _trigrams(w)]
+        postings.sort(key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        hits = []
+        for pos in candidates:
+            item_id, name, terms = self.entries[pos]
+            r = self._rank(fq, words, terms)
+            if r is not None:
+                hits.append((r, len(name), name, item_id))
+        hits.sort()
+        return [(item_id, name, r) for r, _, name, item_id in hits[:limit]]
+
+_search_index = dict(gen=-1, index=None)
+
+def item_search_index():
+    """Índice de busca; reconstruído quando o catálogo muda (itens_add, itens_inativar, apelidos, migrações)."""
+    cat = LEDGER.catalog(); gen = cat["gen"]
+    if _search_index["gen"] != gen:
+        items = cat["items"]
+        aliases = {}
+        for iid, alias in LEDGER.item_aliases():
+            aliases.setdefault(iid, []).append(fold_text(alias))
+        entries = [(r["id"], r["name"], [fold_text(r["name"])] + aliases.get(r["id"], [])) for r in items]
+        _search_index.update(gen=gen, index=ItemSearchIndex(entries))
+    return _search_index["index"]
+
+# ------------- Fila de gravação (group commit) -------------
+# Um único thread grava movimentações: as requisições enfileiram a operação e esperam o commit.
+# O que chegar enquanto um commit está em andamento vai junto no próximo, numa só transação
+# (um SAVEPOINT por operação, para que uma falha não derrube as demais) e um só fsync; a espera
+# de cada requisição fica limitada ao commit em andamento mais o seu.
+# BBH_GROUP_COMMIT_MS (padrão 20) segura o lote por até N ms quando há concorrência, para juntar mais
+# operações no mesmo fsync; gravação sem concorrência não espera. 0 grava assim que o commit anterior
+# termina (melhor em SSD com cache de escrita). BBH_GROUP_COMMIT=0 volta a gravar na thread da requisição.
+GROUP_COMMIT = os.environ.get("BBH_GROUP_COMMIT", "1") != "0"
+GROUP_COMMIT_WAIT = float(os.environ.get("BBH_GROUP_COMMIT_MS", "20")) / 1000
+GROUP_COMMIT_MAX = 256        # operações por transação
+WRITE_TIMEOUT = 30            # segundos esperando a confirmação
+
+class WriteQueue:
+    """Fila write-behind com confirmação por requisição: submit() só retorna depois do commit (synchronous=FULL)."""
+
+    def __init__(self, max_wait=GROUP_COMMIT_WAIT, max_batch=GROUP_COMMIT_MAX):
+        self.max_wait = max_wait; self.max_batch = max_batch
+        self.jobs = queue.Queue(); self.thread = None; self.lock = threading.Lock()
+        self.stats = dict(operacoes=0, commits=0, maior_lote=0, segundos_commit=0.0, erros=0)
+
+    def submit(self, op, *args, timeout=WRITE_TIMEOUT):
+        """Executa op(c, *args) dentro de uma transação de gravação e devolve o resultado (ou levanta o erro)."""
+        if not GROUP_COMMIT:
+            return self._direct(op, args)
+        job = dict(op=op, args=args, done=threading.Event(), result=None, error=None)
+        self._start()
+        self.jobs.put(job)
+        if not job["done"].wait(timeout):
+            raise RuntimeError("gravação não confirmada a tempo")
+        if job["error"] is not None:
+            raise job["error"]
+        return job["result"]
+
+    def _direct(self, op, args):
+        conn = db_connect(); c = conn.cursor(); conn.after_commit = []
+        try:
+            c.execute("BEGIN IMMEDIATE;")
+            result = op(c, *args)
+            conn.commit()
+            self._after_commit(conn.after_commit)
+            return result
+        except Exception:
+            conn.rollback(); raise
+        finally:
+            conn.after_commit = None
+            conn.close()
+
+    def _after_commit(self, callbacks):
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:
+                app.logger.exception("falha em callback pós-commit")
+
+    def _start(self):
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self._run, name="bbh-writer", daemon=True)
+                    self.thread.start()
+
+    def _next_batch(self):
+        # Bloqueia pela primeira e leva tudo o que já estiver na fila; com max_wait > 0 e
+        # concorrência (mais de uma), espera até max_wait por mais alguma antes de gravar.
+        batch = [self.jobs.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.jobs.get_nowait()); continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if len(batch) == 1 or remaining <= 0:
+                break
+            try:
+                batch.append(self.jobs.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = None
+        while True:
+            batch = self._next_batch()
+            if conn is None or _pool.path != DB_PATH:   # como no db_connect: DB_PATH trocado reabre a conexão
+                conn = db_connect(); c = conn.cursor()
+                c.execute("PRAGMA synchronous=FULL;")   # confirmação = dado no disco; o custo é dividido pelo lote
+            t = time.perf_counter(); conn.after_commit = []
+            try:
+                c.execute("BEGIN IMMEDIATE;")
+                for job in batch:
+                    c.execute("SAVEPOINT op;"); mark = len(conn.after_commit)
+                    try:
+                        job["result"] = job["op"](c, *job["args"])
+                        c.execute("RELEASE op;")
+                    except Exception as e:
+                        c.execute("ROLLBACK TO op;"); c.execute("RELEASE op;")
+                        del conn.after_commit[mark:]
+                        job["error"] = e
+                conn.commit()
+                self._after_commit(conn.after_commit)
+            except Exception as e:
+                if conn.in_transaction: conn.rollback()
+                for job in batch:
+                    if job["error"] is None: job["error"] = e
+            finally:
+                conn.after_commit = None
+                st = self.stats
+                st["operacoes"] += len(batch); st["commits"] += 1
+                st["maior_lote"] = max(st["maior_lote"], len(batch))
+                st["segundos_commit"] += time.perf_counter() - t
+                st["erros"] += sum(job["error"] is not None for job in batch)
+                for job in batch:
+                    job["done"].set()
+
+    def info(self):
+        st = dict(self.stats, ativo=GROUP_COMMIT, espera_ms=self.max_wait * 1000, pendentes=self.jobs.qsize())
+        st["media_lote"] = round(st["operacoes"] / st["commits"], 2) if st["commits"] else 0
+        return st
+
+WRITE_QUEUE = WriteQueue()
+
+def after_commit(c, fn):
+    """Agenda fn() para logo após o commit da gravação de c (descartado se a operação falhar).
+
+    Só vale dentro da WRITE_QUEUE; em outras transações fn não é chamado.
+    """
+    if c.connection.after_commit is not None:
+        c.connection.after_commit.append(fn)
+
+# ------------- Painel ao vivo (Server-Sent Events) -------------
+# Cada gravação de movimentações publica, depois do commit, um evento 'delta' montado só com as linhas
+# gravadas: saldo por item e totais por dia e tipo. O LiveHub serializa o evento uma vez e o entrega na
+# fila de cada painel aberto; o id do evento é a versão do livro (ledger_gen), o que permite retomar
+# de onde parou (Last-Event-ID). Mudanças que não passam por aqui (itens, outro processo, PostgreSQL)
+# aparecem como buraco na sequência de versões e viram 'recarregar'.
+LIVE_PING = 15          # segundos entre comentários de keep-alive (abaixo do channel_timeout do waitress)
+LIVE_POLL = 0.5         # segundos entre checagens da versão do livro enquanto há painéis conectados
+LIVE_BACKLOG = 512      # eventos guardados para reconexão
+LIVE_QUEUE_MAX = 256    # eventos pendentes por painel antes de mandá-lo recarregar
+SERVER_THREADS = int(os.environ.get("BBH_THREADS", "32"))   # waitress: cada painel em streaming segura um thread
+# Painéis em streaming ao mesmo tempo (padrão: um quarto dos threads). Os demais recebem o que perderam e a
+# conexão fecha; o EventSource reconecta sozinho a cada LIVE_POLL_RETRY segundos com Last-Event-ID (consulta).
+LIVE_MAX_CLIENTS = max(1, int(os.environ.get("BBH_LIVE_MAX", SERVER_THREADS // 4)))
+LIVE_POLL_RETRY = 5
+
+def live_delta(rows, sign=1):
+    """Evento do painel a partir das linhas gravadas (mov_day, mov_type, item_id, qty); sign=-1 para exclusões."""
+    rows = list(rows); days = {}
+    for day, mov_type, iid, qty in rows:
+        d = days.setdefault(day, dict(dict.fromkeys(MOV_TYPES, 0), linhas=0))
+        d[mov_type] += sign * qty; d["linhas"] += sign
+    deltas = stock_deltas(((iid, mov_type, qty) for _, mov_type, iid, qty in rows), sign)
+    return dict(estoque={str(iid): [h, l] for iid, (h, l) in deltas.items()}, dias=days)
+
+def live_notify(c, rows, sign=1):
+    """Publica o delta das linhas no painel ao vivo após o commit; chamar depois de ledger_changed(c)."""
+    gen = meta_get(c, "ledger_gen"); delta = live_delta(rows, sign)
+    after_commit(c, lambda: LIVE.publish(gen, "delta", dict(delta, versao=gen)))
+
+def sse_message(gen, kind, data):
+    return f"id: {gen}\nevent: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+class LiveHub:
+    """Um produtor, vários painéis: publish() entrega a mesma mensagem pronta na fila de cada cliente."""
+
+    def __init__(self):
+        self.lock = threading.Lock(); self.clients = set(); self.recent = deque(maxlen=LIVE_BACKLOG)
+        self.gen = None; self.thread = None; self.behind = None
+        self.stats = dict(eventos=0, entregas=0, recargas=0, conexoes=0, consultas=0)
+
+    def _start(self):
+        # Chamar com self.lock; a versão de partida é a atual do livro
+        if self.gen is None:
+            self.gen = LEDGER.version()[0]
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._watch, name="bbh-live", daemon=True)
+            self.thread.start()
+
+    def _push(self, gen, msg):
+        # Chamar com self.lock
+        self.gen = gen; self.recent.append((gen, msg)); self.stats["eventos"] += 1
+        for q in list(self.clients):
+            q.put(msg); self.stats["entregas"] += 1
+            if q.qsize() > LIVE_QUEUE_MAX:   # painel que não está lendo: recarrega quando voltar
+                self.clients.discard(q); q.put(sse_message(gen, "recarregar", dict(versao=gen)))
+
+    def publish(self, gen, kind, data):
+        with self.lock:
+            if self.gen is None or gen <= self.gen:
+                return                        # ninguém ouvindo ainda, ou já coberto por uma recarga
+            if gen != self.gen + 1:           # houve gravação sem evento no meio
+                kind, data = "recarregar", dict(versao=gen); self.stats["recargas"] += 1
+            self._push(gen, sse_message(gen, kind, data))
+
+    def _missed(self, since):
+        # Chamar com self.lock: eventos posteriores à versão since, ou 'recarregar' se o backlog não os cobre
+        if 0 <= since < self.gen:
+            missed = [msg for g, msg in self.recent if g > since]
+            if self.recent and self.recent[0][0] <= since + 1 and len(missed) <= LIVE_QUEUE_MAX:
+                return missed
+        elif since >= 0:
+            return []
+        return [sse_message(self.gen, "recarregar", dict(versao=self.gen))]
+
+    def subscribe(self, since):
+        """Fila do painel já com o que ele perdeu desde since; None se LIVE_MAX_CLIENTS já estão conectados."""
+        with self.lock:
+            self._start()
+            if len(self.clients) >= LIVE_MAX_CLIENTS:
+                return None
+            q = queue.Queue(); self.stats["conexoes"] += 1
+            for msg in self._missed(since): q.put(msg)
+            self.clients.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.clients.discard(q)
+
+    def stream(self, since):
+        """Corpo text/event-stream de um painel: eventos desde a versão since, com keep-alive."""
+        q = self.subscribe(since)
+        if q is None:
+            # Lotado: entrega o que houver e fecha, sem segurar um thread do waitress; o navegador volta
+            # em LIVE_POLL_RETRY segundos e, se houver vaga, fica em streaming.
+            with self.lock:
+                self.stats["consultas"] += 1; missed = self._missed(since)
+            yield f"retry: {LIVE_POLL_RETRY * 1000}\n\n"
+            yield from missed
+            return
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    msg = q.get(timeout=LIVE_PING)
+                except queue.Empty:
+                    msg = ": ping\n\n"
+                yield msg
+                if "\nevent: recarregar\n" in msg:
+                    return
+        finally:
+            self.unsubscribe(q)
+
+    def _watch(self):
+        # Gravações que não publicaram evento (itens, outros processos, PostgreSQL): se a versão do livro
+        # segue à frente do último evento por dois ciclos seguidos, manda todos recarregarem.
+        while True:
+            time.sleep(LIVE_POLL)
+            if not self.clients:
+                self.behind = None; continue
+            try:
+                gen = LEDGER.version()[0]
+            except Exception:
+                app.logger.exception("painel ao vivo: falha ao ler a versão do livro"); continue
+            finally:
+                db_release()
+            with self.lock:
+                if gen <= self.gen:
+                    self.behind = None
+                elif self.behind == (self.gen, gen):
+                    self.stats["recargas"] += 1; self.behind = None
+                    self._push(gen, sse_message(gen, "recarregar", dict(versao=gen)))
+                else:
+                    self.behind = (self.gen, gen)
+
+    def info(self):
+        with self.lock:
+            return dict(self.stats, clientes=len(self.clients), versao=self.gen)
+
+LIVE = LiveHub()
+
+# ------------- Movimentações (gravação) -------------
+INSERT_MOVEMENT_SQL = """INSERT INTO movements(mov_date,mov_day,mov_type,item_id,qty,ref,note)
+                         VALUES (?,date(?),?,?,?,?,?);"""
+MOV_QTY_MAX = 1_000_000   # peças por lançamento: acima disso é erro de digitação (e 2**63 nem cabe no SQLite)
+
+def batch_text(value):
+    """Campo de texto do lote (tipo, ref., obs.): texto ou número viram str; listas/objetos -> ValueError."""
+    if value is None:
+        return ""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(value)
+    return str(value).strip()
+
+def movements_insert_batch(rows, mov_date=None, mov_type=None, ref="", note=""):
+    """Valida um lote em memória e grava as linhas válidas com um único executemany, numa transação.
+
+    rows: dicts com item_id e qty (mov_date, mov_type, ref e note opcionais sobrepõem os padrões).
+    Retorna dict(inserted=n, rows=[dict(linha=1.., ok=bool, erro=str|None)]).
+    """
+    active = LEDGER.catalog()["ids"]; today = date.today().isoformat(); closed = LEDGER.closed_through()
+    valid = []; results = []
+    for n, r in enumerate(rows, 1):
+        erro = None
+        try:
+            t = batch_text(r.get("mov_type") or mov_type).lower()
+            rf = batch_text(r.get("ref") or ref); nt = batch_text(r.get("note") or note)
+        except ValueError:
+            t = rf = nt = None; erro = "tipo, ref. ou observação inválidos"
+        try:
+            iid = int(r.get("item_id")); qty = float(r.get("qty") or 0)
+        except (TypeError, ValueError):
+            iid = qty = None; erro = erro or "item ou quantidade inválidos"
+        if erro is None and not qty.is_integer():
+            erro = "quantidade deve ser um número inteiro de peças"
+        elif erro is None:
+            qty = int(qty)
+        if erro is None:
+            # data inteira em AAAA-MM-DD: o que o date() do SQLite não entende viraria mov_day NULL
+            try:
+                d = date.fromisoformat(str(r.get("mov_date") or mov_date or today).strip()).isoformat()
+            except ValueError:
+                erro = "data inválida"
+        if erro is None and d <= closed:
+            erro = f"data em ano arquivado (até {closed[:4]})"
+        if erro is None:
+            if t not in MOV_TYPES: erro = "tipo de movimentação inválido"
+            elif iid not in active: erro = "item inexistente ou inativo"
+            elif qty <= 0: erro = "quantidade deve ser maior que zero"
+            elif qty > MOV_QTY_MAX: erro = f"quantidade acima do limite ({MOV_QTY_MAX} peças)"
+        if erro is None:
+            valid.append((d, d, t, iid, qty, rf, nt))
+        results.append(dict(linha=n, ok=erro is None, erro=erro))
+    if valid:
+        LEDGER.write_movements(valid)
+    return dict(inserted=len(valid), rows=results)
+
+def movements_write_op(c, valid):
+    archive_guard(c, (v[0][:10] for v in valid))
+    c.execute("SELECT IFNULL(MAX(id), 0) FROM movements;"); last = c.fetchone()[0]
+    c.executemany(INSERT_MOVEMENT_SQL, valid)
+    stock_apply(c, stock_deltas((v[3], v[2], v[4]) for v in valid))
+    rollup_mark(c, (v[0] for v in valid))
+    recon_apply(c, last)
+    ledger_changed(c)
+    live_notify(c, ((v[0][:10], v[2], v[3], v[4]) for v in valid))
+    return len(valid)
+
+def movements_write(valid):
+    """Grava linhas já validadas (mov_date, mov_date, tipo, item_id, qty, ref, note), saldo e dias do fechamento."""
+    return WRITE_QUEUE.submit(movements_write_op, valid)
+
+def movement_delete_op(c, mid):
+    c.execute("SELECT item_id, mov_type, qty, mov_day FROM movements WHERE id=?;", (mid,))
+    mov = c.fetchone()
+    if mov:
+        c.execute("DELETE FROM movements WHERE id=?;", (mid,))
+        stock_apply(c, stock_deltas([tuple(mov)[:3]], sign=-1))
+        rollup_mark(c, [mov["mov_day"]])
+        recon_remove(c, mid, mov["item_id"], mov["mov_type"])
+        ledger_changed(c)
+        live_notify(c, [(mov["mov_day"], mov["mov_type"], mov["item_id"], mov["qty"])], sign=-1)
+    return mov is not None
+
+def movement_delete(mid):
+    """Remove uma movimentação e desfaz seu efeito no saldo. False se não existir."""
+    return WRITE_QUEUE.submit(movement_delete_op, mid)
+
+def movements_in_range_iter(start, end):
+    return iter_ledger(REPORT_SQL["movimentos_periodo"], start, end, (start, end))
+
+def recent_movements(limit=50):
+    conn = db_connect(); c = conn.cursor()
+    c.execute("""
+        SELECT m.id, m.mov_date, m.mov_type, m.qty, m.ref, m.note, i.name as item_name
+        FROM movements m JOIN items i ON i.id = m.item_id
+        ORDER BY m.id DESC LIMIT ?;
+    """, (limit,))
+    rows = c.fetchall(); conn.close()
+    return rows
+
+# ---- Itens (escrita) ----
+def item_aliases():
+    conn = db_connect(); c = conn.cursor()
+    c.execute("SELECT item_id, alias FROM item_aliases;")
+    rows = c.fetchall(); conn.close()
+    return rows
+
+def items_list(ids=None):
+    """Itens ativos por nome, ou os itens de ids na ordem dada."""
+    conn = db_connect(); c = conn.cursor()
+    if ids is not None:
+        c.execute(f"SELECT * FROM items WHERE id IN ({','.join('?' * len(ids))});", list(ids))
+        by_id = {r["id"]: r for r in c.fetchall()}; conn.close()
+        return [by_id[i] for i in ids if i in by_id]
+    c.execute("SELECT * FROM items WHERE active=1 ORDER BY name;")
+    rows = c.fetchall(); conn.close()
+    return rows
+
+def item_add(name, aliases=()):
+    """Cadastra o item (e apelidos). False se já existe."""
+    conn = db_connect(); c = conn.cursor()
+    try:
+        c.execute("INSERT INTO items(name) VALUES (?);", (name,))
+        c.executemany("INSERT OR IGNORE INTO item_aliases(item_id, alias) VALUES (?,?);", [(c.lastrowid, a) for a in aliases])
+        items_changed(c); conn.commit()
+        return True
+    except sqlite3.IntegrityError:
+        return False
+    finally:
+        conn.close()
+
+def item_add_aliases(item_id, aliases):
+    """False se o item não existe."""
+    conn = db_connect(); c = conn.cursor()
+    try:
+        c.executemany("INSERT OR IGNORE INTO item_aliases(item_id, alias) VALUES (?,?);", [(item_id, a) for a in aliases])
+        items_changed(c); conn.commit()
+        return True
+    except sqlite3.IntegrityError:
+        return False
+    finally:
+        conn.close()
+
+def item_deactivate(item_id):
+    conn = db_connect(); c = conn.cursor()
+    c.execute("UPDATE items SET active=0 WHERE id=?;", (item_id,))
+    items_changed(c); conn.commit(); conn.close()
+
+# ------------- Importação de histórico (CSV/XLSX) -------------
+# Planilhas antigas no layout de /export/movimentos.csv: ';' e cabeçalho Data;Tipo;Item;Quantidade;Ref;Observação;Criado em
+# (o que vem antes do cabeçalho é ignorado e ele pode se repetir, p.ex. em exportações concatenadas). O arquivo é lido
+# linha a linha e gravado em lotes de ~IMPORT_CHUNK linhas (cortados na virada do dia), cada lote uma operação da
+# WRITE_QUEUE: as linhas vão para uma tabela temporária e entram em movements num único INSERT ... SELECT.
+# Duplicatas: a k-ésima linha igual (data, tipo, item, quantidade, ref) de um dia no arquivo só entra se o livro ainda
+# não tem k linhas assim (idx_mov_day acha as candidatas). Linhas repetidas de verdade entram todas e reimportar o mesmo
+# arquivo não grava nada; com o arquivo agrupado por dia (como a exportação) a contagem é exata.
+# Itens desconhecidos (comparados sem acento/caixa) são cadastrados de uma vez por lote.
+IMPORT_CHUNK = 50000          # linhas por transação
+IMPORT_MAX_ERRORS = 50        # linhas inválidas detalhadas no relatório (a contagem segue)
+IMPORT_FIELDS = ("data", "tipo", "item", "quantidade", "ref", "observacao", "criado em")
+IMPORT_TYPES = {t.upper(): t for t in MOV_TYPES}   # como a exportação grava o tipo
+# Índices do histórico que a carga pode adiar (recriados no fim); idx_mov_day fica, é o da deduplicação
+IMPORT_DEFERRABLE_INDEXES = ("idx_mov_seek", "idx_mov_item_day", "idx_mov_type_day", "idx_mov_ref_day")
+
+def import_file_rows(stream, filename, encoding="utf-8-sig"):
+    """Linhas (sequências de células) de um CSV ';' ou de um XLSX (todas as abas), lidas sob demanda de um arquivo binário."""
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        return _xlsx_rows(stream)
+    return csv.reader(TextIOWrapper(stream, encoding=encoding, newline=""), delimiter=";")
+
+def _xlsx_rows(stream):
+    # openpyxl é opcional (pip install openpyxl) e pesado: importado só quando chega um XLSX
+    try:
+        from openpyxl import load_workbook
+    except Exception:
+        raise RuntimeError("Importar XLSX requer a dependência 'openpyxl': pip install openpyxl") from None
+    wb = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            yield from ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+def import_records(rows):
+    """(nº da linha, (data, tipo, item, quantidade, ref, observação, criado em)) de cada linha de dados."""
+    get = None
+    for n, row in enumerate(rows, 1):
+        if not row or not any(row):
+            continue
+        first = row[0]
+        if isinstance(first, str) and first.strip().casefold() == "data":
+            keys = [fold_text(str(v or "")) for v in row]
+            missing = [f for f in IMPORT_FIELDS[:4] if f not in keys]
+            if missing:
+                raise ValueError(f"linha {n}: cabeçalho sem a(s) coluna(s) {', '.join(missing)}")
+            width = len(keys) + 1   # colunas opcionais ausentes apontam para a célula extra (vazia)
+            get = itemgetter(*(keys.index(f) if f in keys else width - 1 for f in IMPORT_FIELDS))
+            continue
+        if get is None:
+            continue
+        cells = list(row); cells += [None] * (width - len(cells))
+        yield n, get(cells)
+
+def _import_day(value):
+    if isinstance(value, datetime): return value.date().isoformat()
+    if isinstance(value, date): return value.isoformat()
+    text = str(value or "").strip()[:10]
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d/%m/%y"):
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            pass
+    raise ValueError("data inválida")
+
+def _import_text(value):
+    if value is None: return ""
+    if isinstance(value, float) and value.is_integer(): value = int(value)   # ref numérica vinda do XLSX
+    return str(value).strip()
+
+def import_parse(rec, days):
+    """Valida uma linha de import_records(); days é o cache de datas já convertidas. Levanta ValueError."""
+    d, t, item, qty, ref, note, created = rec
+    day = days.get(d) if isinstance(d, str) else _import_day(d)
+    if day is None:
+        day = days[d] = _import_day(d)
+    mov_type = IMPORT_TYPES.get(t) if isinstance(t, str) else None
+    if mov_type is None:
+        mov_type = fold_text(str(t or ""))
+        if mov_type not in MOV_TYPES: raise ValueError("tipo de movimentação inválido")
+    name = _import_text(item)
+    if not name: raise ValueError("item vazio")
+    if isinstance(qty, str) and "," in qty:   # "1.234,0" de planilha em português
+        qty = qty.replace(".", "").replace(",", ".")
+    try:
+        q = int(qty) if isinstance(qty, (int, str)) else float(qty)
+    except (TypeError, ValueError):
+        try:
+            q = float(qty)
+        except (TypeError, ValueError):
+            raise ValueError("quantidade inválida") from None
+    if isinstance(q, float):
+        if not q.is_integer(): raise ValueError("quantidade deve ser um número inteiro de peças")
+        q = int(q)
+    if q <= 0: raise ValueError("quantidade deve ser maior que zero")
+    if q > MOV_QTY_MAX: raise ValueError(f"quantidade acima do limite ({MOV_QTY_MAX} peças)")
+    if isinstance(created, datetime): created = created.strftime("%Y-%m-%d %H:%M:%S")
+    else: created = _import_text(created) or None
+    return (day, mov_type, name, q, _import_text(ref), _import_text(note), created)
+
+def import_items_op(c, names):
+    c.executemany("INSERT OR IGNORE INTO items(name) VALUES (?);", [(n,) for n in names])
+    c.execute(f"SELECT id, name FROM items WHERE name IN ({','.join('?' * len(names))});", names)
+    found = {r[1]: r[0] for r in c.fetchall()}
+    items_changed(c)
+    return found
+
+def import_chunk_op(c, rows):
+    """Grava um lote [(mov_day, mov_type, item_id, qty, ref, note, created_at, k)] sem o que já está no livro.
+
+    k é a ocorrência da linha entre as iguais do mesmo dia no arquivo. Retorna o nº de linhas novas.
+    """
+    c.execute("""CREATE TEMP TABLE IF NOT EXISTS import_stage (mov_day TEXT, mov_type TEXT, item_id INTEGER, qty INTEGER,
+                                                              ref TEXT, note TEXT, created_at TEXT, k INTEGER);""")
+    archive_guard(c, (r[0] for r in rows))
+    c.execute("DELETE FROM import_stage;")
+    c.executemany("INSERT INTO import_stage VALUES (?,?,?,?,?,?,?,?);", rows)
+    c.execute("SELECT IFNULL(MAX(id), 0) FROM movements;"); last = c.fetchone()[0]
+    # O SELECT lê movements antes de qualquer linha do lote entrar (o SQLite o materializa por ler a tabela de destino)
+    c.execute("""
+        INSERT INTO movements(mov_date, mov_day, mov_type, item_id, qty, ref, note, created_at)
+        SELECT mov_day, mov_day, mov_type, item_id, qty, ref, note, IFNULL(created_at, CURRENT_TIMESTAMP)
+        FROM import_stage s
+        WHERE s.k > (SELECT COUNT(*) FROM movements m WHERE m.mov_day=s.mov_day AND m.mov_type=s.mov_type
+                     AND m.item_id=s.item_id AND m.qty=s.qty AND IFNULL(m.ref, '')=s.ref);
+    """)
+    n = c.rowcount
+    if n:
+        c.execute("SELECT item_id, mov_type, SUM(qty) FROM movements WHERE id > ? GROUP BY item_id, mov_type;", (last,))
+        stock_apply(c, stock_deltas(c.fetchall()))
+        rollup_mark(c, (r[0] for r in rows))
+        recon_apply(c, last)
+        ledger_changed(c)   # sem evento do painel ao vivo: a versão pula e os painéis recarregam
+    return n
+
+def import_indexes_op(c, restore):
+    if restore:
+        migrate_history_indexes(c)
+    else:
+        for name in IMPORT_DEFERRABLE_INDEXES:
+            c.execute(f"DROP INDEX IF EXISTS {name};")
+
+def import_movements(rows, chunk=IMPORT_CHUNK, defer_indexes=False, progress=None):
+    """Importa as linhas de import_file_rows() e devolve o relatório da carga.
+
+    defer_indexes tira os índices do histórico durante a carga e os recria no fim (cargas grandes, fora do
+    expediente: a paginação do histórico fica lenta enquanto isso). progress(relatorio) roda após cada lote.
+    Lotes já gravados ficam se a leitura falhar no meio; importar de novo o mesmo arquivo só grava o que falta.
+    """
+    if LEDGER.name != "sqlite":
+        raise RuntimeError("A importação de histórico só está disponível no livro SQLite local.")
+    t = time.perf_counter()
+    report = dict(lidas=0, inseridas=0, duplicadas=0, invalidas=0, itens_criados=[], erros=[])
     conn = db_connect(); c = conn.cursor()
+    c.execute("SELECT id, name FROM items ORDER BY id;")   # inativos também: o histórico pode citá-los
+    known = {}
+    for iid, name in c.fetchall():
+        known.setdefault(fold_text(name), iid)
+    conn.close()
+    folded = {}; days = {}   # nome como veio no arquivo -> forma sem acento/caixa; data como veio -> AAAA-MM-DD
+    closed = LEDGER.closed_through()
+
+    def flush(batch):
+        missing = {}
+        for r in batch:
+            if r[2] not in known:
+                missing.setdefault(r[2], r[8])
+        if missing:
+            names = [" ".join(name.split()) for name in missing.values()]
+            created = WRITE_QUEUE.submit(import_items_op, names)
+            for key, name in zip(missing, names):
+                known[key] = created[name]
+            report["itens_criados"] += names
+        n = WRITE_QUEUE.submit(import_chunk_op, [(d, mt, known[key], q, ref, note, ca, k) for d, mt, key, q, ref, note, ca, k, _ in batch],
+                               timeout=None)
+        report["inseridas"] += n; report["duplicadas"] += len(batch) - n
+        if progress: progress(report)
+
+    if defer_indexes:
+        WRITE_QUEUE.submit(import_indexes_op, False)
     try:
-        c.execute("PRAGMA table_info(users);")
-        cols = [r[1] for r in c.fetchall()]
-        if "active" not in cols:
-            c.execute("ALTER TABLE users ADD COLUMN active INTEGER DEFAULT 1;")
-            conn.commit()
-            c.execute("UPDATE users SET active=1 WHERE active IS NULL;")
-            conn.commit()
-    except Exception:
-        pass
+        batch = []; day = None; seen = {}
+        for n, rec in import_records(rows):
+            report["lidas"] += 1
+            try:
+                d, mt, name, q, ref, note, ca = import_parse(rec, days)
+                if d <= closed: raise ValueError(f"data em ano arquivado (até {closed[:4]})")
+            except ValueError as e:
+                report["invalidas"] += 1
+                if len(report["erros"]) < IMPORT_MAX_ERRORS: report["erros"].append(dict(linha=n, erro=str(e)))
+                continue
+            if d != day:   # lotes só terminam na virada do dia: as ocorrências de um dia ficam no mesmo lote
+                if len(batch) >= chunk:
+                    flush(batch); batch = []
+                day = d; seen = {}
+            key = folded.get(name)
+            if key is None:
+                key = folded[name] = fold_text(name)
+            k = seen[d, mt, key, q, ref] = seen.get((d, mt, key, q, ref), 0) + 1
+            batch.append((d, mt, key, q, ref, note, ca, k, name))
+        if batch:
+            flush(batch)
     finally:
-        conn.close()
+        if defer_indexes:
+            WRITE_QUEUE.submit(import_indexes_op, True, timeout=None)
+    rollup_update()
+    seconds = time.perf_counter() - t
+    report.update(segundos=round(seconds, 2), linhas_por_segundo=round(report["lidas"] / seconds) if seconds else 0)
+    return report
 
+# ------------- Arquivo anual -------------
+# Anos fechados saem de movements para um SQLite por ano em ARCHIVE_DIR (lavanderia_AAAA.db: movements com os
+# mesmos índices, mais uma cópia de items para o arquivo ser legível sozinho). O saldo de cada item no início do
+# ano seguinte vai para opening_balances, então o estoque atual e a conferência do saldo não dependem dos
+# arquivos. O fechamento diário (stock_daily) dos anos arquivados fica no banco principal — é pequeno, uma linha
+# por item e dia com movimento — e continua servindo painel, resumos e estoque em data passada. Só o que lê as
+# linhas (histórico, exportação de movimentos, romaneios) anexa arquivos, e só os anos que o intervalo alcança.
+ARCHIVE_DIR = os.environ.get("BBH_ARCHIVE_DIR") or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "arquivo")
+ARCHIVE_KEEP_YEARS = 1   # anos fechados que o comando arquivar mantém no banco principal, além do atual
 
-def migrate_data():
-    """Normaliza dados existentes (tipos e índices)."""
-    conn = db_connect(); c = conn.cursor()
+def _year_of(d, default):
     try:
-        # Normaliza tipos para minúsculo e sem acentos comuns
-        c.execute("UPDATE movements SET mov_type=LOWER(TRIM(mov_type)) WHERE mov_type IS NOT NULL;")
-        # Corrige possíveis variações com acento
-        c.execute("UPDATE movements SET mov_type='saida' WHERE mov_type IN ('saída');")
-        # Garante só valores válidos (se houver algo estranho, mapeia para 'saida' para não quebrar)
-        c.execute("UPDATE movements SET mov_type='saida' WHERE mov_type NOT IN ('entrada','saida','envio','retorno','perda');")
-        # Índices para desempenho e filtros por data/tipo
-        c.execute("CREATE INDEX IF NOT EXISTS idx_mov_date ON movements(mov_date);")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_mov_type ON movements(mov_type);")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_mov_item ON movements(item_id);")
-        conn.commit()
-    except Exception:
-        pass
-    finally:
-        conn.close()
-def preload_items():
-    # Garante itens padrão
-    conn = db_connect(); c = conn.cursor()
-    for name in DEFAULT_MOV_NAMES:
-        c.execute("INSERT OR IGNORE INTO items(name) VALUES (?);", (name,))
-    # Também garante alguns itens extras usados antes
-    extras = ["TRAVESSEIRO","VIP COLCHA","VIP FRONHA","VIP LENÇOL","BLACK OUT"]
-    for name in extras:
-        c.execute("INSERT OR IGNORE INTO items(name) VALUES (?);", (name,))
-    conn.commit(); conn.close()
+        return date.fromisoformat(str(d)[:10]).year
+    except ValueError:
+        return default
 
-def create_default_user():
-    conn = db_connect(); c = conn.cursor()
-    c.execute("SELECT 1 FROM users WHERE username='admin'")
-    if not c.fetchone():
-        c.execute("INSERT INTO users(username,password,active) VALUES (?,?,1)", ("admin", generate_password_hash("1234")))
-        conn.commit()
-    conn.close()
+def ledger_dbs(c, start=None, end=None, newest_first=False):
+    """Bancos com as movimentações de start a end (None = sem limite), na ordem das datas: 'arq' e 'main'.
 
-def bootstrap():
-    init_db()
-    migrate_db()
-    migrate_data()
-    preload_items()
-    create_default_user()
+    Cada ano arquivado do intervalo é anexado à conexão de c como 'arq' e desanexado quando o chamador pede o
+    próximo (um arquivo por vez). Intervalos só do banco principal não anexam nada.
+    """
+    lo, hi = _year_of(start, 0), _year_of(end, 9999)
+    c.execute("SELECT year, file FROM archives WHERE year BETWEEN ? AND ? ORDER BY year;", (lo, hi))
+    dbs = [tuple(r) for r in c.fetchall()]
+    if hi > meta_get(c, "archived_year"):
+        dbs.append((None, "main"))
+    for year, file in (reversed(dbs) if newest_first else dbs):
+        if year is None:
+            yield file; continue
+        path = archive_path(file)
+        if not os.path.exists(path):   # ATTACH criaria um banco vazio no lugar
+            raise RuntimeError(f"Arquivo do ano {year} não encontrado: {path}")
+        c.execute("ATTACH DATABASE ? AS arq;", (path,))
+        try:
+            yield "arq"
+        finally:
+            c.execute("DETACH DATABASE arq;")
 
-bootstrap()
+def archive_path(file):
+    return os.path.join(ARCHIVE_DIR, file)
 
-# ------------- Utils -------------
-def login_required(fn):
-    from functools import wraps
-    @wraps(fn)
-    def wrapper(*args, **kwargs):
-        if "user_id" not in session:
-            return redirect(url_for("login"))
-        return fn(*args, **kwargs)
-    return wrapper
+def archive_guard(c, days):
+    """Recusa gravar em ano arquivado (na transação de gravação, onde a fronteira não muda)."""
+    closed = closed_through(c)
+    if closed and min(days, default="9999") <= closed:
+        raise ValueError(f"data em ano arquivado (até {closed[:4]})")
 
-def admin_required(fn):
-    from functools import wraps
-    @wraps(fn)
-    def wrapper(*args, **kwargs):
-        if "user_id" not in session:
-            return redirect(url_for("login"))
-        if session.get("username") != "admin":
-            flash("Acesso restrito ao administrador.", "error")
-            return redirect(url_for("dashboard"))
-        return fn(*args, **kwargs)
-    return wrapper
+def archived_through():
+    conn = db_connect(); c = conn.cursor()
+    try:
+        return closed_through(c)
+    finally:
+        conn.close()
 
-def parse_period(period:str, ref_str:str):
+def archive_copy(year):
+    """Grava as movimentações do ano num arquivo novo, sem tirá-las do livro. Retorna (arquivo, resumo das linhas)."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    file = f"lavanderia_{year}.db"; tmp = archive_path(file) + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)   # sobra de uma execução interrompida
+    arq = sqlite3.connect(tmp)
     try:
-        ref = datetime.strptime(ref_str, "%Y-%m-%d").date()
-    except Exception:
-        ref = date.today()
-    if period == "semana":
-        start = ref - timedelta(days=ref.weekday())  # segunda
-        end = start + timedelta(days=6)              # domingo
-    elif period == "mes":
-        start = ref.replace(day=1)
-        last = calendar.monthrange(ref.year, ref.month)[1]
-        end = ref.replace(day=last)
-    else:
-        start = end = ref
-    return (start.isoformat(), end.isoformat())
+        arq.execute("ATTACH DATABASE ? AS livro;", (DB_PATH,))
+        arq.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL);")
+        arq.execute(MOVEMENTS_DDL.format(table="movements"))
+        arq.execute("INSERT INTO items(id, name) SELECT id, name FROM livro.items;")
+        arq.execute(f"""INSERT INTO movements({MOVEMENTS_COLUMNS}) SELECT {MOVEMENTS_COLUMNS} FROM livro.movements
+                        WHERE mov_day BETWEEN ? AND ? ORDER BY id;""", (f"{year}-01-01", f"{year}-12-31"))
+        summary = arq.execute("SELECT COUNT(*), IFNULL(SUM(qty), 0), MIN(id), MAX(id) FROM movements;").fetchone()
+        arq.commit()
+        arq.execute("DETACH DATABASE livro;")
+        c = arq.cursor()
+        c.execute("CREATE INDEX IF NOT EXISTS idx_mov_day ON movements(mov_day, mov_type, item_id);")
+        migrate_history_indexes(c)
+        arq.commit()
+    finally:
+        arq.close()
+    os.replace(tmp, archive_path(file))
+    return file, summary
 
-def kpis_range(start, end):
-    conn = db_connect(); c = conn.cursor()
-    def sum_type(t):
-        c.execute("SELECT IFNULL(SUM(qty),0) FROM movements WHERE mov_type=? AND date(mov_date) BETWEEN date(?) AND date(?)", (t, start, end))
-        return float(c.fetchone()[0])
-    entrada = sum_type('entrada'); saida = sum_type('saida')
-    envio = sum_type('envio'); retorno = sum_type('retorno'); perda = sum_type('perda')
-    c.execute("SELECT COUNT(*) FROM movements WHERE date(mov_date) BETWEEN date(?) AND date(?)", (start,end))
-    linhas = c.fetchone()[0]
-    c.execute("""SELECT COUNT(DISTINCT item_id)
-                 FROM movements WHERE date(mov_date) BETWEEN date(?) AND date(?)""", (start,end))
-    itens_distintos = c.fetchone()[0]
-    conn.close()
-    return dict(entrada=entrada, saida=saida, envio=envio, retorno=retorno, perda=perda,
-                linhas=linhas, itens_distintos=itens_distintos)
+def archive_commit_op(c, year, file, summary):
+    """Confere o ano contra a cópia, grava o saldo de abertura do ano seguinte e tira o ano do livro."""
+    start, end = f"{year}-01-01", f"{year}-12-31"
+    if meta_get(c, "archived_year") >= year:
+        raise ValueError(f"o ano {year} já está arquivado")
+    c.execute("SELECT MIN(mov_day) FROM movements WHERE mov_day < ?;", (start,))
+    first = c.fetchone()[0]
+    if first:
+        raise ValueError(f"há movimentações de {first[:4]} no banco: arquive os anos em ordem")
+    c.execute("SELECT COUNT(*), IFNULL(SUM(qty), 0), MIN(id), MAX(id) FROM movements WHERE mov_day BETWEEN ? AND ?;", (start, end))
+    if tuple(c.fetchone()) != tuple(summary):
+        raise ValueError(f"as movimentações de {year} mudaram durante a cópia; rode de novo")
+    rollup_refresh(c)   # o fechamento dos dias pendentes precisa das linhas que vão sair
+    opening = stock_opening(c)
+    c.execute("SELECT item_id, mov_type, SUM(qty) FROM movements WHERE mov_day BETWEEN ? AND ? GROUP BY item_id, mov_type;", (start, end))
+    for iid, (h, l) in stock_deltas(c.fetchall()).items():
+        oh, ol = opening.get(iid, (0, 0)); opening[iid] = (oh + h, ol + l)
+    c.executemany("INSERT INTO opening_balances(year, item_id, no_hotel, em_lavanderia) VALUES (?,?,?,?);",
+                  [(year + 1, iid, h, l) for iid, (h, l) in opening.items()])
+    # Retornos arquivados não podem mais ser excluídos: o que abateram dos lotes não precisa ser desfeito
+    c.execute("""DELETE FROM recon_matches WHERE retorno_id IN
+                 (SELECT id FROM movements WHERE mov_type='retorno' AND mov_day BETWEEN ? AND ?);""", (start, end))
+    c.execute("DELETE FROM movements WHERE mov_day BETWEEN ? AND ?;", (start, end))
+    c.execute("INSERT INTO archives(year, file, rows, qty, first_id, last_id) VALUES (?,?,?,?,?,?);", (year, file, *summary))
+    meta_set(c, "archived_year", year)
+    ledger_changed(c)
+    return summary[0]
 
-def movements_in_range(start, end):
-    conn = db_connect(); c = conn.cursor()
-    c.execute("""
-        SELECT m.mov_date, m.mov_type, i.name as item, m.qty, m.ref, m.note, m.created_at
-        FROM movements m JOIN items i ON i.id=m.item_id
-        WHERE date(m.mov_date) BETWEEN date(?) AND date(?)
-        ORDER BY date(m.mov_date) ASC, m.id ASC;
-    """, (start, end))
-    rows = c.fetchall(); conn.close()
-    return rows
+def archive_year(year):
+    """Arquiva um ano fechado (o mais antigo ainda no banco). Retorna dict(ano, arquivo, linhas, segundos)."""
+    if LEDGER.name != "sqlite":
+        raise RuntimeError("O arquivo anual só está disponível no livro SQLite local.")
+    if year >= date.today().year:
+        raise ValueError("só anos já encerrados podem ser arquivados")
+    if _year_of(archived_through(), 0) >= year:
+        raise ValueError(f"o ano {year} já está arquivado")
+    t = time.perf_counter()
+    file, summary = archive_copy(year)
+    try:
+        rows = WRITE_QUEUE.submit(archive_commit_op, year, file, summary, timeout=None)
+    except Exception:
+        os.remove(archive_path(file)); raise
+    return dict(ano=year, arquivo=archive_path(file), linhas=rows, segundos=round(time.perf_counter() - t, 2))
 
-def get_stock_summary():
+def archives_info():
+    """Anos arquivados com linhas, peças e tamanho do arquivo (None se o arquivo sumiu)."""
     conn = db_connect(); c = conn.cursor()
-    c.execute("""
-        SELECT i.id, i.name,
-               IFNULL(SUM(CASE WHEN m.mov_type='entrada' THEN m.qty
-                               WHEN m.mov_type='retorno' THEN m.qty
-                               WHEN m.mov_type='envio' THEN -m.qty
-                               WHEN m.mov_type='saida' THEN -m.qty
-                               WHEN m.mov_type='perda' THEN -m.qty
-                               ELSE 0 END),0) as no_hotel,
-               IFNULL(SUM(CASE WHEN m.mov_type='envio' THEN m.qty
-                               WHEN m.mov_type='retorno' THEN -m.qty
-                               ELSE 0 END),0) as em_lavanderia
-        FROM items i
-        LEFT JOIN movements m ON m.item_id = i.id
-        WHERE i.active=1
-        GROUP BY i.id, i.name
-        ORDER BY i.name;
-    """)
+    c.execute("SELECT year, file, rows, qty, archived_at FROM archives ORDER BY year;")
     rows = c.fetchall(); conn.close()
-    data = []
-    for r in rows:
-        total = (r['no_hotel'] or 0) + (r['em_lavanderia'] or 0)
-        data.append(dict(id=r['id'], name=r['name'],
-                         no_hotel=round(r['no_hotel'] or 0,2),
-                         em_lavanderia=round(r['em_lavanderia'] or 0,2),
-                         total=round(total,2)))
-    return data
+    return [dict(ano=r["year"], arquivo=r["file"], linhas=r["rows"], pecas=r["qty"], arquivado_em=r["archived_at"],
+                 bytes=os.path.getsize(archive_path(r["file"])) if os.path.exists(archive_path(r["file"])) else None)
+            for r in rows]
 
-def kpis_for_day(d):
-    conn = db_connect(); c = conn.cursor()
-    c.execute("SELECT IFNULL(SUM(qty),0) FROM movements WHERE mov_type='envio' AND date(mov_date)=date(?);",(d,)); envios = c.fetchone()[0]
-    c.execute("SELECT IFNULL(SUM(qty),0) FROM movements WHERE mov_type='retorno' AND date(mov_date)=date(?);",(d,)); retornos = c.fetchone()[0]
-    c.execute("SELECT COUNT(*) FROM items WHERE active=1;"); itens = c.fetchone()[0]
-    conn.close(); return dict(itens=itens, envios=envios, retornos=retornos)
+# ------------- Repositório (backend do livro) -------------
+# As rotas leem e gravam itens, movimentações, saldo e relatórios por LEDGER.
+# Padrão: SQLite local (funções acima). Com BBH_DATABASE_URL=postgresql://... o livro vai para um
+# PostgreSQL central compartilhado por vários hotéis (ledger_pg.py, pool de conexões psycopg_pool).
+class SqliteLedger:
+    name = "sqlite"
+    catalog = staticmethod(catalog)
+    item_aliases = staticmethod(item_aliases)
+    items_list = staticmethod(items_list)
+    add_item = staticmethod(item_add)
+    add_aliases = staticmethod(item_add_aliases)
+    deactivate_item = staticmethod(item_deactivate)
+    write_movements = staticmethod(movements_write)
+    delete_movement = staticmethod(movement_delete)
+    recent_movements = staticmethod(recent_movements)
+    history_rows = staticmethod(history_rows)
+    iter_movements = staticmethod(movements_in_range_iter)
+    period_report = staticmethod(period_report)
+    stock_summary = staticmethod(get_stock_summary)
+    stock_on = staticmethod(stock_on)
+    stock_trend = staticmethod(stock_trend)
+    romaneio = staticmethod(query_romaneio)
+    romaneio_range = staticmethod(query_romaneio_range)
+    version = staticmethod(ledger_version)
+    closed_through = staticmethod(archived_through)
 
-def series_last_7():
-    days = [date.today()-timedelta(days=i) for i in range(6,-1,-1)]
-    conn = db_connect(); c = conn.cursor(); series = []
-    for d in days:
-        ds = d.isoformat()
-        c.execute("SELECT IFNULL(SUM(qty),0) FROM movements WHERE mov_type='envio' AND date(mov_date)=date(?);",(ds,)); env = float(c.fetchone()[0])
-        c.execute("SELECT IFNULL(SUM(qty),0) FROM movements WHERE mov_type='retorno' AND date(mov_date)=date(?);",(ds,)); ret = float(c.fetchone()[0])
-        series.append(dict(day=d.strftime('%d/%m'), env=env, ret=ret))
-    conn.close(); return series
+    def stats(self):
+        return dict(backend=self.name, **db_pool_stats())
 
-def query_romaneio(d):
-    conn = db_connect(); c = conn.cursor()
-    c.execute("""
-        SELECT i.name, SUM(m.qty) as qty
-        FROM movements m JOIN items i ON i.id=m.item_id
-        WHERE m.mov_type='envio' AND date(m.mov_date)=date(?)
-        GROUP BY i.name ORDER BY i.name;
-    """,(d,)); envio = c.fetchall()
-    c.execute("""
-        SELECT i.name, SUM(m.qty) as qty
-        FROM movements m JOIN items i ON i.id=m.item_id
-        WHERE m.mov_type='retorno' AND date(m.mov_date)=date(?)
-        GROUP BY i.name ORDER BY i.name;
-    """,(d,)); retorno = c.fetchall()
-    conn.close(); return envio, retorno
+def make_ledger():
+    url = os.environ.get("BBH_DATABASE_URL", "")
+    if url.startswith(("postgres://", "postgresql://")):
+        import ledger_pg
+        return ledger_pg.PostgresLedger(url, MOV_TYPES, STOCK_EFFECT, DEFAULT_MOV_NAMES,
+                                        pool_size=int(os.environ.get("BBH_PG_POOL", "10")))
+    return SqliteLedger()
+
+LEDGER = make_ledger()
 
 # ------------- Flask app -------------
 app = Flask(__name__)
 app.secret_key = "bbh-lavanderia-secret"
 
+@app.teardown_appcontext
+def teardown_db(exc):
+    db_release()
+
+# ---- Métricas por rota (admin: /metrics) ----
+# Histograma de latência, nº de comandos SQL e tempo de SQL por rota. Com BBH_SERVER_TIMING=1
+# cada resposta leva o cabeçalho Server-Timing (aparece na aba Rede do navegador).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+app.config["SERVER_TIMING"] = os.environ.get("BBH_SERVER_TIMING") == "1"
+_route_metrics = {}
+_route_metrics_lock = threading.Lock()
+
+@app.before_request
+def metrics_start():
+    request.metrics_t0 = time.perf_counter()
+    _sql_trace.active = dict(count=0, seconds=0.0, last=None,
+                             route=request.url_rule.rule if request.url_rule else "(404)")
+
+@app.after_request
+def metrics_finish(response):
+    trace = getattr(_sql_trace, "active", None); _sql_trace.active = None
+    t0 = getattr(request, "metrics_t0", None)
+    if trace is None or t0 is None:
+        return response
+    seconds = time.perf_counter() - t0
+    key = (trace["route"], request.method)
+    with _route_metrics_lock:
+        m = _route_metrics.get(key)
+        if m is None:
+            m = _route_metrics[key] = dict(count=0, seconds=0.0, buckets=[0]*len(LATENCY_BUCKETS), sql_count=0, sql_seconds=0.0)
+        m["count"] += 1; m["seconds"] += seconds
+        m["sql_count"] += trace["count"]; m["sql_seconds"] += trace["seconds"]
+        for i, le in enumerate(LATENCY_BUCKETS):
+            if seconds <= le: m["buckets"][i] += 1
+    if app.config["SERVER_TIMING"]:
+        response.headers["Server-Timing"] = (f'sql;dur={trace["seconds"]*1000:.1f};desc="{trace["count"]} consultas", '
+                                             f'app;dur={seconds*1000:.1f}')
+    return response
+
+def metrics_text():
+    """Métricas no formato de texto do Prometheus."""
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+    with _route_metrics_lock:
+        routes = {k: dict(v, buckets=list(v["buckets"])) for k, v in sorted(_route_metrics.items())}
+    out = ["# HELP bbh_request_duration_seconds Latência das requisições por rota.",
+           "# TYPE bbh_request_duration_seconds histogram"]
+    for (route, method), m in routes.items():
+        labels = f'route="{esc(route)}",method="{method}"'
+        for le, n in zip(LATENCY_BUCKETS, m["buckets"]):
+            out.append(f'bbh_request_duration_seconds_bucket{{{labels},le="{le}"}} {n}')
+        out.append(f'bbh_request_duration_seconds_bucket{{{labels},le="+Inf"}} {m["count"]}')
+        out.append(f'bbh_request_duration_seconds_sum{{{labels}}} {m["seconds"]:.6f}')
+        out.append(f'bbh_request_duration_seconds_count{{{labels}}} {m["count"]}')
+    out += ["# HELP bbh_sql_statements_total Comandos SQL executados, por rota.", "# TYPE bbh_sql_statements_total counter"]
+    out += [f'bbh_sql_statements_total{{route="{esc(r)}",method="{mt}"}} {m["sql_count"]}' for (r, mt), m in routes.items()]
+    out += ["# HELP bbh_sql_seconds_total Tempo em SQL (execute + fetch), por rota.", "# TYPE bbh_sql_seconds_total counter"]
+    out += [f'bbh_sql_seconds_total{{route="{esc(r)}",method="{mt}"}} {m["sql_seconds"]:.6f}' for (r, mt), m in routes.items()]
+    pool = db_pool_stats(); cat = catalog_stats(); pdf = pdf_cache_stats()
+    out += ["# TYPE bbh_db_pool_total counter"] + [f'bbh_db_pool_total{{result="{k}"}} {pool[k]}' for k in ("hits", "misses")]
+    out += ["# TYPE bbh_catalog_cache_total counter"] + [f'bbh_catalog_cache_total{{result="{k}"}} {cat[k]}' for k in ("hits", "misses")]
+    wq = WRITE_QUEUE.info()
+    out += ["# TYPE bbh_write_queue_total counter"] + [f'bbh_write_queue_total{{kind="{k}"}} {wq[k]}' for k in ("operacoes", "commits", "erros")]
+    out += ["# TYPE bbh_pdf_cache_total counter"] + [f'bbh_pdf_cache_total{{result="{k}"}} {pdf[k]}' for k in ("hits", "misses")]
+    views = view_cache_stats(); live = LIVE.info()
+    out += ["# TYPE bbh_live_clients gauge", f"bbh_live_clients {live['clientes']}"]
+    out += ["# TYPE bbh_live_events_total counter"] + [f'bbh_live_events_total{{kind="{k}"}} {live[k]}' for k in ("eventos", "entregas", "recargas", "consultas")]
+    out += ["# TYPE bbh_view_cache_total counter"] + [f'bbh_view_cache_total{{result="{k}"}} {views[k]}'
+                                                      for k in ("hits", "misses", "not_modified", "bypass")]
+    out += ["# HELP bbh_sql_slow_seconds Pior tempo dos comandos mais lentos (plano nos comentários abaixo).",
+            "# TYPE bbh_sql_slow_seconds gauge"]
+    for e in slow_sql_report():
+        out.append(f'bbh_sql_slow_seconds{{sql="{esc(e["sql"][:200])}",route="{esc(e["route"])}"}} {e["max_ms"]/1000:.6f}')
+        out += [f"#   plano: {line}" for line in e["plan"] or ()]
+    return "\n".join(out) + "\n"
+
+# ---- Arquivos estáticos (build_assets.py) ----
+# static/dist/ tem CSS e imagens com o hash do conteúdo no nome (mapa em static/dist/manifest.json): são servidos
+# com cache imutável de um ano e, se o navegador aceitar, na variante pré-comprimida (.br/.gz) gerada no build.
+# Sem o build, asset_url aponta para as fontes (static/src, static/img) com o cache padrão do Flask.
+ASSET_MAX_AGE = 365 * 24 * 3600
+ASSET_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+_asset_manifest = dict(mtime=None, paths={})
+_asset_manifest_lock = threading.Lock()
+
+def asset_manifest():
+    """{origem: arquivo gerado}, relidos quando o build grava outro manifest.json."""
+    path = os.path.join(app.static_folder, "dist", "manifest.json")
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    with _asset_manifest_lock:
+        if mtime != _asset_manifest["mtime"]:
+            paths = {}
+            if mtime is not None:
+                with open(path, encoding="utf-8") as f:
+                    paths = json.load(f)
+            _asset_manifest.update(mtime=mtime, paths=paths)
+        return _asset_manifest["paths"]
+
+def asset_url(name):
+    """URL de static/<name> pelo manifest (versão com hash) ou a própria fonte; None se nenhuma das duas existe."""
+    built = asset_manifest().get(name)
+    if built is None:
+        if not os.path.isfile(os.path.join(app.static_folder, name)):
+            return None
+        built = name
+    return url_for("static", filename=built)
+
+def static_file(filename):
+    """/static/: arquivos de dist/ com cache imutável e variante .br/.gz conforme o Accept-Encoding."""
+    if not filename.startswith("dist/") or filename.endswith("manifest.json"):
+        return app.send_static_file(filename)
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, ext in ASSET_ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(app.static_folder, filename + ext)):
+            rv = send_from_directory(app.static_folder, filename + ext, mimetype=mimetype, max_age=ASSET_MAX_AGE,
+                                     download_name=os.path.basename(filename))
+            rv.headers["Content-Encoding"] = encoding
+            break
+    else:
+        rv = send_from_directory(app.static_folder, filename, max_age=ASSET_MAX_AGE)
+    rv.vary.add("Accept-Encoding")
+    rv.cache_control.immutable = True
+    return rv
+
+app.view_functions["static"] = static_file
+
 @app.context_processor
 def inject_globals():
-    return dict(APP_TITLE=APP_TITLE, current_user=session.get("username"))
+    return dict(APP_TITLE=APP_TITLE, current_user=session.get("username"), asset_url=asset_url)
+
+# ---- Cache de páginas por versão do livro ----
+# Painel, romaneio e relatórios só mudam quando o livro muda (ou o dia vira). A resposta leva
+# ETag de (rota, parâmetros, usuário, dia, versão) e Last-Modified da última gravação; o navegador
+# revalida (Cache-Control: no-cache) e recebe 304 sem nenhuma agregação. Corpos prontos ficam num
+# LRU em memória, para o mesmo painel aberto em vários computadores da recepção.
+VIEW_CACHE_MAX_ITEMS = 128
+VIEW_CACHE_MAX_BYTES = 16 * 1024 * 1024
+_view_cache = OrderedDict()
+_view_cache_lock = threading.Lock()
+_view_cache_stats = dict(hits=0, misses=0, not_modified=0, bypass=0, bytes=0)
+
+def view_cache_get(key):
+    with _view_cache_lock:
+        entry = _view_cache.get(key)
+        if entry is None:
+            _view_cache_stats["misses"] += 1
+        else:
+            _view_cache.move_to_end(key); _view_cache_stats["hits"] += 1
+        return entry
+
+def view_cache_put(key, entry):
+    with _view_cache_lock:
+        if key in _view_cache:
+            return
+        _view_cache[key] = entry; _view_cache_stats["bytes"] += len(entry[0])
+        while _view_cache and (len(_view_cache) > VIEW_CACHE_MAX_ITEMS or _view_cache_stats["bytes"] > VIEW_CACHE_MAX_BYTES):
+            _, old = _view_cache.popitem(last=False); _view_cache_stats["bytes"] -= len(old[0])
+
+def view_cache_count(key):
+    with _view_cache_lock:
+        _view_cache_stats[key] += 1
+
+def view_cache_stats():
+    with _view_cache_lock:
+        return dict(_view_cache_stats, items=len(_view_cache))
+
+def ledger_cached(fn):
+    """GET condicionado à versão do livro: 304 se o ETag bate, senão corpo do cache ou da view (guardado se 200).
+
+    Mensagens flash pendentes ignoram o cache: a página precisa exibi-las (e consumi-las da sessão). Respostas em
+    streaming (exportações CSV) levam o ETag mas não são guardadas: o arquivo inteiro iria para a memória.
+    """
+    from functools import wraps
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if request.method != "GET" or session.get("_flashes"):
+            view_cache_count("bypass")
+            return fn(*args, **kwargs)
+        gen, at = LEDGER.version()
+        key = repr((request.endpoint, sorted(request.args.items(multi=True)), session.get("user_id"), date.today().isoformat(), gen))
+        etag = f"v{gen}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}"
+        if etag in request.if_none_match:
+            view_cache_count("not_modified")
+            rv = Response(status=304)
+        else:
+            entry = view_cache_get(etag)
+            if entry is None:
+                rv = app.make_response(fn(*args, **kwargs))
+                if rv.status_code != 200:
+                    return rv
+                if not rv.is_streamed:
+                    entry = (rv.get_data(), [(k, v) for k, v in rv.headers if k in ("Content-Type", "Content-Disposition")])
+                    view_cache_put(etag, entry)
+            if entry is not None:
+                rv = Response(entry[0], headers=entry[1])
+        rv.set_etag(etag)
+        rv.cache_control.no_cache = True; rv.cache_control.private = True
+        if at:
+            rv.last_modified = at
+        return rv
+    return wrapper
 
 # ---- Auth ----
-LOGIN_TEMPLATE = """
-<!doctype html>
-<html lang="pt-BR">
-<head>
-  <meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1">
-  <script src="https://cdn.tailwindcss.com"></script>
-  <title>Login — Bessa Beach Hotel</title>
-  <style>
-    .bg-slide{background-size:cover;background-position:center;filter:contrast(1.05) saturate(1.1);}
-  </style>
-</head>
-<body class="min-h-screen">
-  <!-- Carousel de fundo -->
-  <div id="bg" class="fixed inset-0 bg-slide transition-opacity duration-700"></div>
-  <div class="fixed inset-0 bg-slate-900/45"></div>
-
-  <!-- Card de login -->
-  <div class="relative min-h-screen flex items-center justify-center p-4">
-    <div class="w-full max-w-sm bg-white/95 backdrop-blur shadow-xl rounded-2xl p-6">
-      <div class="text-center mb-4">
-        <div class="text-xl font-semibold text-slate-900">Bessa Beach Hotel</div>
-        <div class="text-xs text-slate-500">Sistema de Lavanderia</div>
-      </div>
-      {% with messages = get_flashed_messages(with_categories=true) %}
-        {% if messages %}
-        <div class="space-y-2 mb-2">
-          {% for cat,msg in messages %}
-            <div class="px-3 py-2 rounded-lg text-sm {% if cat=='ok' %}bg-green-50 text-green-800{% elif cat=='error' %}bg-rose-50 text-rose-700{% else %}bg-amber-50 text-amber-700{% endif %}">{{ msg }}</div>
-          {% endfor %}
-        </div>
-        {% endif %}
-      {% endwith %}
-      <form method="post" class="grid gap-3">
-        <input name="username" placeholder="Usuário" class="px-3 py-2 rounded-xl border" required>
-        <input type="password" name="password" placeholder="Senha" class="px-3 py-2 rounded-xl border" required>
-        <button class="px-4 py-2 rounded-xl bg-slate-900 text-white hover:bg-slate-800">Entrar</button>
-      </form>
-      <div class="text-[11px] text-slate-500 mt-3 text-center">Padrão: <b>admin</b> / <b>1234</b></div>
-      <div class="text-[11px] text-slate-500 mt-1 text-center">Criado por <b>André Vinicius</b></div>
-    </div>
-  </div>
-
-  <script>
-    const imgs = [
-      "{{ url_for('static', filename='img/hotel1.jpg') }}",
-      "{{ url_for('static', filename='img/hotel2.jpg') }}",
-      "{{ url_for('static', filename='img/hotel3.jpg') }}",
-    ];
-    const bg = document.getElementById('bg');
-    let idx = 0;
-    function setBg(url){
-      bg.style.opacity = 0;
-      setTimeout(()=>{
-        bg.style.backgroundImage = `url('${url}')`;
-        bg.style.opacity = 1;
-      }, 250);
-    }
-    function nextBg(){
-      idx = (idx + 1) % imgs.length;
-      setBg(imgs[idx]);
-    }
-    setBg(imgs[0]);
-    setInterval(nextBg, 6000);
-  </script>
-</body>
-</html>
-"""
+LOGIN_BACKGROUNDS = ("img/hotel1", "img/hotel2", "img/hotel3")   # carrossel da tela de login
 
 @app.route("/login", methods=["GET","POST"])
 def login():
@@ -363,7 +2477,8 @@ def login():
             flash(f"Bem-vindo, {u['username']}! Tenha um ótimo dia de trabalho. 🌞", "ok")
             return redirect(url_for("dashboard"))
         flash("Usuário/senha incorretos ou usuário inativo.", "error")
-    return render_template_string(LOGIN_TEMPLATE)
+    backgrounds = [dict(jpg=asset_url(f"{b}.jpg"), webp=asset_url(f"{b}.webp")) for b in LOGIN_BACKGROUNDS]
+    return render_template("login.html", backgrounds=backgrounds)
 
 @app.route("/logout")
 def logout():
@@ -421,99 +2536,214 @@ def usuarios_toggle(uid):
 # ---- Páginas principais ----
 @app.route("/")
 @login_required
+@ledger_cached
 def dashboard():
     # Filtros de período
     period = request.args.get("period","dia")
     ref = request.args.get("ref") or date.today().isoformat()
     start, end = parse_period(period, ref)
 
-    stock = get_stock_summary()
-    kpis = kpis_for_day(date.today().isoformat())
-    series = series_last_7()
-    k_range = kpis_range(start, end)
+    # Versão do livro em que o painel foi montado: o painel ao vivo aplica só os eventos posteriores
+    versao = LEDGER.version()[0]
+
+    # Semana corrente e período filtrado: duas agregações no total (reaproveita se coincidirem)
+    stock = LEDGER.stock_summary()
+    week = LEDGER.period_report(*last_7_range())
+    report = week if (start, end) == (week["start"], week["end"]) else LEDGER.period_report(start, end)
+    kpis = kpis_for_day(date.today().isoformat(), report=week, itens=len(stock))
+    series = series_last_7(report=week)
+    k_range = kpis_range(start, end, report=report)
 
     # Arrays seguros para o Chart.js
-    series_labels = [s.get('day') for s in series] if series else []
-    series_envios = [float(s.get('env',0) or 0) for s in series] if series else []
-    series_retornos = [float(s.get('ret',0) or 0) for s in series] if series else []
+    series_labels = [s.day for s in series]
+    series_envios = [s.env for s in series]
+    series_retornos = [s.ret for s in series]
+    if LEDGER.version()[0] != versao:
+        versao = -1   # gravação durante a montagem: o painel ao vivo pede recarga ao conectar
 
     return render_template("dashboard.html",
                            stock=stock, kpis=kpis, series=series,
                            series_labels=series_labels, series_envios=series_envios, series_retornos=series_retornos,
-                           period=period, ref=ref, start=start, end=end, k_range=k_range)
+                           period=period, ref=ref, start=start, end=end, k_range=k_range, versao=versao)
 
 @app.route("/itens")
 @login_required
 def itens():
     q = request.args.get("q","").strip()
-    conn = db_connect(); c = conn.cursor()
     if q:
-        c.execute("SELECT * FROM items WHERE active=1 AND name LIKE ? ORDER BY name;", (f"%{q}%",))
+        # Busca sem acento/caixa via índice; mantém a ordem por relevância
+        items = LEDGER.items_list([iid for iid, _, _ in item_search_index().search(q, limit=500)])
     else:
-        c.execute("SELECT * FROM items WHERE active=1 ORDER BY name;")
-    items = c.fetchall(); conn.close()
+        items = LEDGER.items_list()
     return render_template("itens.html", items=items, q=q)
 
+@app.route("/api/itens/busca")
+@login_required
+def api_itens_busca():
+    """Autocompletar: ?q=texto&limite=10 -> itens ativos por relevância (nome ou apelido, sem acento/caixa)."""
+    q = request.args.get("q","")
+    try:
+        limit = max(1, min(int(request.args.get("limite", 10)), 50))
+    except ValueError:
+        limit = 10
+    hits = item_search_index().search(q, limit=limit)
+    return jsonify(itens=[dict(id=iid, name=name, rank=r) for iid, name, r in hits])
+
 @app.route("/itens/add", methods=["POST"])
 @login_required
 def itens_add():
     name = request.form.get("name","").strip()
+    aliases = [a.strip() for a in request.form.get("aliases","").split(",") if a.strip()]
     if not name:
         flash("Nome do item é obrigatório.", "error")
         return redirect(url_for("itens"))
-    conn = db_connect(); c = conn.cursor()
-    try:
-        c.execute("INSERT INTO items(name) VALUES (?);", (name,))
-        conn.commit(); flash("Item cadastrado.", "ok")
-    except sqlite3.IntegrityError:
+    if LEDGER.add_item(name, aliases):
+        flash("Item cadastrado.", "ok")
+    else:
         flash("Item já existe.", "warn")
-    finally:
-        conn.close()
+    return redirect(url_for("itens"))
+
+@app.route("/itens/<int:item_id>/apelidos", methods=["POST"])
+@login_required
+def itens_apelidos(item_id):
+    aliases = [a.strip() for a in request.form.get("aliases","").split(",") if a.strip()]
+    if not aliases:
+        flash("Informe ao menos um apelido.", "error"); return redirect(url_for("itens"))
+    if LEDGER.add_aliases(item_id, aliases):
+        flash("Apelido(s) salvo(s).", "ok")
+    else:
+        flash("Item inexistente.", "error")
     return redirect(url_for("itens"))
 
 @app.route("/itens/<int:item_id>/inativar", methods=["POST"])
 @login_required
 def itens_inativar(item_id):
-    conn = db_connect(); c = conn.cursor()
-    c.execute("UPDATE items SET active=0 WHERE id=?;", (item_id,))
-    conn.commit(); conn.close()
+    LEDGER.deactivate_item(item_id)
     flash("Item inativado.", "ok")
     return redirect(url_for("itens"))
 
 @app.route("/movimentos")
 @login_required
 def movimentos():
-    conn = db_connect(); c = conn.cursor()
-    c.execute("SELECT id, name FROM items WHERE active=1 ORDER BY name;")
-    items = c.fetchall()
-    # ids padrão
-    id_map = {row['name']: row['id'] for row in items}
-    default_ids = [id_map[name] for name in DEFAULT_MOV_NAMES if name in id_map]
-    c.execute("""
-        SELECT m.id, m.mov_date, m.mov_type, m.qty, m.ref, m.note, i.name as item_name
-        FROM movements m JOIN items i ON i.id = m.item_id
-        ORDER BY m.id DESC LIMIT 50;
-    """); movs = c.fetchall(); conn.close()
-    return render_template("movimentos.html", items=items, movs=movs, today=date.today().isoformat(), default_ids=default_ids)
+    cat = LEDGER.catalog()
+    movs = LEDGER.recent_movements(50)
+    return render_template("movimentos.html", items=cat["items"], movs=movs, today=date.today().isoformat(), default_ids=cat["default_ids"])
+
+@app.route("/movimentos/historico")
+@login_required
+def movimentos_historico():
+    filters = history_filters(request.args)
+    try:
+        movs, next_cursor = movements_page(**filters)
+    except ValueError:
+        flash("Página inválida; voltando ao início.", "warn")
+        return redirect(url_for("movimentos_historico"))
+    items = LEDGER.catalog()["items"]
+    next_args = {k: v for k, v in request.args.items() if k != "cursor"}
+    next_url = url_for("movimentos_historico", cursor=next_cursor, **next_args) if next_cursor else None
+    return render_template("historico.html", movs=movs, items=items, filters=filters, next_url=next_url,
+                           mov_types=MOV_TYPES)
+
+@app.route("/api/movimentos/historico")
+@login_required
+def api_movimentos_historico():
+    """JSON do histórico: mesmos filtros de /movimentos/historico; siga 'proximo' até vir null."""
+    filters = history_filters(request.args)
+    try:
+        movs, next_cursor = movements_page(**filters)
+    except ValueError as e:
+        return jsonify(erro=str(e)), 400
+    return jsonify(movimentos=[dict(id=m["id"], data=m["mov_day"], tipo=m["mov_type"], item=m["item_name"],
+                                    qty=m["qty"], ref=m["ref"], note=m["note"], criado_em=m["created_at"]) for m in movs],
+                   proximo=next_cursor)
+
+@app.route("/api/painel/eventos")
+@login_required
+def api_painel_eventos():
+    """Painel ao vivo (text/event-stream): 'delta' a cada gravação e 'recarregar' quando é preciso refazer a página.
+
+    ?desde=<versão do painel> na primeira conexão; nas reconexões o navegador manda Last-Event-ID.
+    """
+    try:
+        since = int(request.headers.get("Last-Event-ID") or request.args.get("desde") or -1)
+    except ValueError:
+        since = -1
+    return Response(LIVE.stream(since), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/estoque/historico")
+@login_required
+@ledger_cached
+def api_estoque_historico():
+    """Estoque por item ao fim de ?data=AAAA-MM-DD (padrão: hoje)."""
+    d = request.args.get("data") or date.today().isoformat()
+    try:
+        d = date.fromisoformat(d).isoformat()
+    except ValueError:
+        return jsonify(erro="data inválida (use AAAA-MM-DD)"), 400
+    return jsonify(data=d, itens=as_dicts(LEDGER.stock_on(d)))
+
+@app.route("/api/estoque/tendencia")
+@login_required
+@ledger_cached
+def api_estoque_tendencia():
+    """Série diária (totais por tipo e saldos) do período; ?item=<id> restringe a um item."""
+    period, ref, start, end = period_from_args(request.args)
+    try:
+        item_id = int(request.args.get("item") or 0) or None
+    except ValueError:
+        return jsonify(erro="item inválido"), 400
+    return jsonify(inicio=start, fim=end, item=item_id, dias=as_dicts(LEDGER.stock_trend(start, end, item_id)))
+
+@app.route("/api/conciliacao/envelhecimento")
+@login_required
+@ledger_cached
+def api_conciliacao_envelhecimento():
+    """Peças ainda na lavanderia por item e faixa de dias desde o envio (lotes de envio em aberto)."""
+    try:
+        rows = recon_aging()
+    except RuntimeError as e:
+        return jsonify(erro=str(e)), 400
+    total = [sum(r.faixas[k] for r in rows) for k in range(len(RECON_AGING_DAYS) + 1)]
+    return jsonify(data=date.today().isoformat(), faixas=recon_aging_labels(), total=total, itens=as_dicts(rows))
+
+def shortfall_args(args):
+    # Faltas olham para trás: sem period/start/end, o mês de ref
+    args = args.to_dict()
+    args.setdefault("period", "mes")
+    return period_from_args(args)
+
+@app.route("/api/conciliacao/faltas")
+@login_required
+@ledger_cached
+def api_conciliacao_faltas():
+    """Por dia de envio do período (padrão: o mês), o que ainda não voltou por item e ref."""
+    period, ref, start, end = shortfall_args(request.args)
+    try:
+        rows = recon_shortfall(start, end)
+    except RuntimeError as e:
+        return jsonify(erro=str(e)), 400
+    days = {}
+    for r in rows:
+        d = days.setdefault(r.day, dict(dia=r.day, dias=r.dias, enviado=0, devolvido=0, faltando=0, itens=[]))
+        d["enviado"] += r.enviado; d["devolvido"] += r.devolvido; d["faltando"] += r.faltando
+        d["itens"].append(dict(item_id=r.item_id, item=r.name, ref=r.ref, enviado=r.enviado, devolvido=r.devolvido, faltando=r.faltando))
+    return jsonify(inicio=start, fim=end, faltando=sum(r.faltando for r in rows), dias=list(days.values()))
 
 @app.route("/movimentos/add", methods=["POST"])
 @login_required
 def movimentos_add():
     mov_date = request.form.get("mov_date") or date.today().isoformat()
     mov_type = (request.form.get("mov_type") or '').strip().lower()
-    if mov_type not in ('entrada','saida','envio','retorno','perda'):
+    if mov_type not in MOV_TYPES:
         flash('Tipo de movimentação inválido.', 'error'); return redirect(url_for('movimentos'))
-    item_id = int(request.form.get("item_id"))
-    qty = float(request.form.get("qty") or 0)
-    ref = request.form.get("ref","").strip()
-    note = request.form.get("note","").strip()
-    if qty <= 0:
-        flash("Quantidade deve ser maior que zero.", "error")
+    row = dict(item_id=request.form.get("item_id"), qty=request.form.get("qty"),
+               ref=request.form.get("ref",""), note=request.form.get("note",""))
+    result = movements_insert_batch([row], mov_date=mov_date, mov_type=mov_type)
+    if not result["inserted"]:
+        erro = result["rows"][0]["erro"]
+        flash(erro[0].upper() + erro[1:] + ".", "error")
         return redirect(url_for("movimentos"))
-    conn = db_connect(); c = conn.cursor()
-    c.execute("""INSERT INTO movements(mov_date,mov_type,item_id,qty,ref,note)
-                 VALUES (?,?,?,?,?,?);""",(mov_date, mov_type, item_id, qty, ref, note))
-    conn.commit(); conn.close()
     flash("Movimentação registrada.", "ok")
     return redirect(url_for("movimentos"))
 
@@ -522,7 +2752,7 @@ def movimentos_add():
 def movimentos_bulk_add():
     mov_date = request.form.get("mov_date") or date.today().isoformat()
     mov_type = (request.form.get("mov_type") or '').strip().lower()
-    if mov_type not in ('entrada','saida','envio','retorno','perda'):
+    if mov_type not in MOV_TYPES:
         flash('Tipo de movimentação inválido.', 'error'); return redirect(url_for('movimentos'))
     ref = request.form.get("ref","").strip()
     note = request.form.get("note","").strip()
@@ -531,154 +2761,441 @@ def movimentos_bulk_add():
     if not item_ids or not qtys:
         flash("Inclua pelo menos um item.", "error")
         return redirect(url_for("movimentos"))
-    conn = db_connect(); c = conn.cursor(); inserted = 0
-    for i, q in zip(item_ids, qtys):
-        try:
-            iid = int(i); qty = float(q or 0)
-            if qty <= 0: continue
-            c.execute("""INSERT INTO movements(mov_date,mov_type,item_id,qty,ref,note)
-                         VALUES (?,?,?,?,?,?);""", (mov_date, mov_type, iid, qty, ref, note))
-            inserted += 1
-        except Exception:
-            pass
-    conn.commit(); conn.close()
-    flash(f"{inserted} movimentação(ões) registradas." if inserted else "Nenhuma linha válida.", "ok" if inserted else "warn")
+    # Linhas com quantidade vazia/zero são as sugestões não preenchidas do formulário
+    rows = [dict(item_id=i, qty=q) for i, q in zip(item_ids, qtys) if (q or "").strip() not in ("", "0")]
+    result = movements_insert_batch(rows, mov_date=mov_date, mov_type=mov_type, ref=ref, note=note)
+    inserted = result["inserted"]; rejected = len(rows) - inserted
+    if inserted:
+        flash(f"{inserted} movimentação(ões) registradas." + (f" {rejected} linha(s) inválida(s) ignorada(s)." if rejected else ""), "ok")
+    else:
+        flash("Nenhuma linha válida.", "warn")
     return redirect(url_for("movimentos"))
 
+@app.route("/api/movimentos/lote", methods=["POST"])
+@login_required
+def api_movimentos_lote():
+    """Lote em JSON (coletores/scanners): {mov_date, mov_type, ref, note, itens: [{item_id, qty, ...}]}."""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("itens"), list) or not payload["itens"]:
+        return jsonify(erro="Envie um objeto JSON com a lista 'itens'."), 400
+    if not all(isinstance(r, dict) for r in payload["itens"]):
+        return jsonify(erro="Cada linha de 'itens' deve ser um objeto."), 400
+    result = movements_insert_batch(payload["itens"], mov_date=payload.get("mov_date"), mov_type=payload.get("mov_type"),
+                                    ref=payload.get("ref") or "", note=payload.get("note") or "")
+    return jsonify(result), (200 if result["inserted"] else 422)
+
 @app.route("/movimentos/<int:mid>/delete", methods=["POST"])
 @login_required
 def movimentos_delete(mid):
-    conn = db_connect(); c = conn.cursor()
-    c.execute("DELETE FROM movements WHERE id=?;", (mid,))
-    conn.commit(); conn.close()
+    LEDGER.delete_movement(mid)
     flash("Movimentação removida.", "ok")
     return redirect(url_for("movimentos"))
 
+def romaneio_day(args):
+    """Dia do romaneio em ?data=AAAA-MM-DD (padrão: hoje), já canônico; ValueError se não for uma data."""
+    return date.fromisoformat(args.get("data") or date.today().isoformat()).isoformat()
+
+def bad_day():
+    return Response("data inválida (use AAAA-MM-DD)", status=400, mimetype="text/plain")
+
 @app.route("/romaneio")
 @login_required
+@ledger_cached
 def romaneio():
-    d = request.args.get("data") or date.today().isoformat()
-    envio, retorno = query_romaneio(d)
-    tot_env = int(round(sum([(r['qty'] or 0) for r in envio])))
-    tot_ret = int(round(sum([(r['qty'] or 0) for r in retorno])))
+    try:
+        d = romaneio_day(request.args)
+    except ValueError:
+        return bad_day()
+    envio, retorno = LEDGER.romaneio(d)
+    tot_env = sum(r.qty for r in envio)
+    tot_ret = sum(r.qty for r in retorno)
     return render_template("romaneio.html", data=d, envio=envio, retorno=retorno, tot_env=tot_env, tot_ret=tot_ret)
 
+@app.route("/admin/estatisticas")
+@admin_required
+def admin_estatisticas():
+    return jsonify(db_pool=db_pool_stats(), ledger=LEDGER.stats(), pdf_cache=pdf_cache_stats(), catalog=catalog_stats(),
+                   write_queue=WRITE_QUEUE.info(), view_cache=view_cache_stats(), ledger_version=LEDGER.version(), live=LIVE.info(),
+                   archives=archives_info(),
+                   bootstrap=BOOTSTRAP_STATS, slow_sql=slow_sql_report())
+
+@app.route("/admin/importar", methods=["GET", "POST"])
+@admin_required
+def admin_importar():
+    """Upload de planilha de histórico; responde com o relatório da carga em JSON."""
+    if request.method == "GET":
+        return render_template("importar.html")
+    f = request.files.get("arquivo")
+    if not f or not f.filename:
+        return jsonify(erro="Envie o arquivo no campo 'arquivo'."), 400
+    try:
+        report = import_movements(import_file_rows(f.stream, f.filename), defer_indexes=request.form.get("adiar_indices") == "1")
+    except UnicodeDecodeError:
+        return jsonify(erro="O CSV não está em UTF-8: salve como 'CSV UTF-8' ou use flask --app app importar --codificacao cp1252."), 400
+    except (RuntimeError, ValueError) as e:
+        return jsonify(erro=str(e)), 400
+    return jsonify(report)
+
+@app.route("/metrics")
+@admin_required
+def metrics():
+    return Response(metrics_text(), mimetype="text/plain; version=0.0.4")
+
 # ---- Exportações ----
+# Cache LRU dos PDFs de romaneio, chaveado pela data + conteúdo do dia (muda sozinho quando o dia muda)
+PDF_CACHE_MAX_ITEMS = 64
+PDF_CACHE_MAX_BYTES = 32 * 1024 * 1024
+_pdf_cache = OrderedDict()
+_pdf_cache_lock = threading.Lock()
+_pdf_cache_stats = dict(hits=0, misses=0, bytes=0)
+
+def romaneio_fingerprint(d, envio, retorno):
+    h = hashlib.sha1(repr((d, envio, retorno)).encode("utf-8"))
+    return f"rom-{d}-{h.hexdigest()[:16]}"
+
+def pdf_cache_get(key):
+    with _pdf_cache_lock:
+        pdf = _pdf_cache.get(key)
+        if pdf is None:
+            _pdf_cache_stats["misses"] += 1
+        else:
+            _pdf_cache.move_to_end(key); _pdf_cache_stats["hits"] += 1
+        return pdf
+
+def pdf_cache_put(key, pdf):
+    with _pdf_cache_lock:
+        if key in _pdf_cache:
+            return
+        _pdf_cache[key] = pdf; _pdf_cache_stats["bytes"] += len(pdf)
+        while _pdf_cache and (len(_pdf_cache) > PDF_CACHE_MAX_ITEMS or _pdf_cache_stats["bytes"] > PDF_CACHE_MAX_BYTES):
+            _, old = _pdf_cache.popitem(last=False); _pdf_cache_stats["bytes"] -= len(old)
+
+def pdf_cache_stats():
+    with _pdf_cache_lock:
+        return dict(_pdf_cache_stats, items=len(_pdf_cache))
+
+class _CsvLine:
+    """Destino do csv.writer que apenas devolve a linha formatada."""
+    def write(self, value):
+        return value
+
+def csv_response(rows, download_name, chunk_rows=200):
+    """CSV (UTF-8 com BOM, separador ';') enviado aos poucos enquanto as linhas são geradas."""
+    def generate():
+        cw = csv.writer(_CsvLine(), delimiter=';'); buf = ["\ufeff"]
+        for row in rows:
+            buf.append(cw.writerow(row))
+            if len(buf) >= chunk_rows:
+                yield "".join(buf); buf = []
+        if buf:
+            yield "".join(buf)
+    return Response(stream_with_context(generate()), mimetype="text/csv",
+                    headers={"Content-Disposition": f"attachment; filename={download_name}"})
+
 @app.route("/export/romaneio.csv")
 @login_required
+@ledger_cached
 def export_romaneio_csv():
-    d = request.args.get("data") or date.today().isoformat()
-    envio, retorno = query_romaneio(d)
-    si = StringIO(); cw = csv.writer(si, delimiter=';')
-    cw.writerow(["Data", d]); cw.writerow([]); cw.writerow(["Tipo","Item","Quantidade"])
-    for r in envio: cw.writerow(["ENVIO", r["name"], r["qty"] or 0])
-    for r in retorno: cw.writerow(["RETORNO", r["name"], r["qty"] or 0])
-    output = BytesIO(si.getvalue().encode('utf-8-sig')); output.seek(0)
-    return send_file(output, mimetype="text/csv", as_attachment=True, download_name=f"romaneio_{d}.csv")
+    try:
+        d = romaneio_day(request.args)
+    except ValueError:
+        return bad_day()
+    envio, retorno = LEDGER.romaneio(d)
+    return csv_response(romaneio_csv_rows(d, envio, retorno), f"romaneio_{d}.csv")
 
 @app.route("/export/romaneio.pdf")
 @login_required
 def export_romaneio_pdf():
-    d = request.args.get("data") or date.today().isoformat()
+    try:
+        d = romaneio_day(request.args)
+    except ValueError:
+        return bad_day()
 
-    if A4 is None:
+    if not romaneio_pdf.available():
         output = BytesIO()
         output.write(("Instale a dependência 'reportlab': pip install reportlab").encode("utf-8"))
         output.seek(0)
         return send_file(output, mimetype="text/plain", as_attachment=True, download_name="instalar_reportlab.txt")
 
-    envio, retorno = query_romaneio(d)
-    total_env = int(round(sum((row_get(r,'qty',0) or 0) for r in envio)))
-    total_ret = int(round(sum((row_get(r,'qty',0) or 0) for r in retorno)))
-
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, title=f"Romaneio {d}", leftMargin=2*cm, rightMargin=2*cm, topMargin=1.6*cm, bottomMargin=1.6*cm)
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name="Small", fontSize=9, textColor=colors.grey))
-    title_style = styles["Title"]; title_style.textColor = colors.HexColor("#0f172a")
-
-    elements = []
-    logo_path = os.path.join(BASE_DIR, "static", "logo.png")
-    if os.path.exists(logo_path):
-        elements.append(RLImage(logo_path, width=3.2*cm, height=3.2*cm))
-        elements.append(Spacer(1, 6))
-
-    when = datetime.strptime(d, "%Y-%m-%d").strftime("%d/%m/%Y (%A)").title()
-    elements.append(Paragraph("BBH — Romaneio de Lavanderia", title_style))
-    elements.append(Paragraph(f"Data: <b>{when}</b>", styles["Normal"]))
-    elements.append(Paragraph("Criado por André Vinicius · Bessa Beach Hotel — Solicitado por Helbo Moura (Diretor)", styles["Small"]))
-    elements.append(Paragraph("Responsável: Micheline Moura", styles["Small"]))
-    elements.append(Spacer(1, 14))
-
-    # Envios
-    elements.append(Paragraph("<b>Envios</b>", styles["Heading2"]))
-    data_env = [["Item","Quantidade"]] + [[row_get(r,"name","—"), int(round(row_get(r,"qty",0) or 0))] for r in envio]
-    if len(data_env) == 1: data_env.append(["—", 0])
-    tbl_env = Table(data_env, hAlign="LEFT", colWidths=[340, 110])
-    tbl_env.setStyle(TableStyle([
-        ("BACKGROUND",(0,0),(-1,0), colors.HexColor("#0f172a")),
-        ("TEXTCOLOR",(0,0),(-1,0), colors.white),
-        ("FONTNAME",(0,0),(-1,0),"Helvetica-Bold"),
-        ("FONTSIZE",(0,0),(-1,0),10),
-        ("ALIGN",(1,1),(1,-1),"RIGHT"),
-        ("GRID",(0,0),(-1,-1),0.25, colors.grey),
-        ("ROWBACKGROUNDS",(0,1),(-1,-1), [colors.whitesmoke, colors.HexColor("#eef2ff")]),
-        ("BOTTOMPADDING",(0,0),(-1,0),6),
-    ]))
-    elements.append(tbl_env)
-    elements.append(Paragraph(f"<br/><b>Total de Envios:</b> {total_env}", styles["Normal"]))
-    elements.append(Spacer(1, 12))
-
-    # Retornos
-    elements.append(Paragraph("<b>Retornos</b>", styles["Heading2"]))
-    data_ret = [["Item","Quantidade"]] + [[row_get(r,"name","—"), int(round(row_get(r,"qty",0) or 0))] for r in retorno]
-    if len(data_ret) == 1: data_ret.append(["—", 0])
-    tbl_ret = Table(data_ret, hAlign="LEFT", colWidths=[340, 110])
-    tbl_ret.setStyle(TableStyle([
-        ("BACKGROUND",(0,0),(-1,0), colors.HexColor("#0f172a")),
-        ("TEXTCOLOR",(0,0),(-1,0), colors.white),
-        ("FONTNAME",(0,0),(-1,0),"Helvetica-Bold"),
-        ("FONTSIZE",(0,0),(-1,0),10),
-        ("ALIGN",(1,1),(1,-1),"RIGHT"),
-        ("GRID",(0,0),(-1,-1),0.25, colors.grey),
-        ("ROWBACKGROUNDS",(0,1),(-1,-1), [colors.whitesmoke, colors.HexColor("#eef2ff")]),
-        ("BOTTOMPADDING",(0,0),(-1,0),6),
-    ]))
-    elements.append(tbl_ret)
-    elements.append(Paragraph(f"<br/><b>Total de Retornos:</b> {total_ret}", styles["Normal"]))
-    elements.append(Spacer(1, 18))
-    elements.append(Paragraph("<br/>Conferido por: ____________________________", styles["Normal"]))
-    elements.append(Paragraph("Recebido por: ____________________________", styles["Normal"]))
-
-    doc.build(elements)
-    buffer.seek(0)
-    return send_file(buffer, mimetype="application/pdf", as_attachment=True, download_name=f"romaneio_{d}.pdf")
+    envio, retorno = LEDGER.romaneio(d)
+    etag = romaneio_fingerprint(d, envio, retorno)
+    if etag in request.if_none_match:
+        rv = Response(status=304); rv.set_etag(etag); rv.cache_control.no_cache = True
+        return rv
+    pdf = pdf_cache_get(etag)
+    if pdf is None:
+        pdf = romaneio_pdf.render(d, envio, retorno, BASE_DIR)
+        pdf_cache_put(etag, pdf)
+    return send_file(BytesIO(pdf), mimetype="application/pdf", as_attachment=True,
+                     download_name=f"romaneio_{d}.pdf", etag=etag, conditional=True)
+
+def romaneio_csv_rows(d, envio, retorno):
+    yield ["Data", d]; yield []; yield ["Tipo","Item","Quantidade"]
+    for name, qty in envio: yield ["ENVIO", name, qty]
+    for name, qty in retorno: yield ["RETORNO", name, qty]
+
+def romaneio_batch(start, end, formato="pdf", workers=None, progress=None):
+    """Romaneios do período: um PDF único ("pdf") ou ZIP com PDF e CSV por dia ("zip"). Retorna (bytes, mimetype, nome)."""
+    days = LEDGER.romaneio_range(start, end)
+    if formato == "zip":
+        pdfs = romaneio_pdf.render_batch(days, BASE_DIR, workers=workers, progress=progress)
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            for d, envio, retorno in days:
+                zf.writestr(f"romaneio_{d}.pdf", pdfs[d])
+                cw = csv.writer(_CsvLine(), delimiter=';')
+                zf.writestr(f"romaneio_{d}.csv", ("\ufeff" + "".join(cw.writerow(r) for r in romaneio_csv_rows(d, envio, retorno))).encode("utf-8"))
+        return buffer.getvalue(), "application/zip", f"romaneios_{start}_a_{end}.zip"
+    merged = None
+    if romaneio_pdf.can_merge() and len(days) > 1:
+        pdfs = romaneio_pdf.render_batch(days, BASE_DIR, workers=workers, progress=progress)
+        merged = romaneio_pdf.merge_pdfs(pdfs.values())
+    if merged is None:
+        merged = romaneio_pdf.render_merged(days or [(start, [], [])], BASE_DIR)
+    return merged, "application/pdf", f"romaneios_{start}_a_{end}.pdf"
+
+@app.route("/export/romaneios")
+@login_required
+def export_romaneios():
+    """Romaneios de um intervalo (start/end ou period/ref): ?formato=pdf (único arquivo) ou zip."""
+    if not romaneio_pdf.available():
+        return export_romaneio_pdf()
+    period, ref, start, end = period_from_args(request.args)
+    formato = "zip" if request.args.get("formato") == "zip" else "pdf"
+    def progress(done, total, d):
+        app.logger.info("romaneios %s a %s: %d/%d (%s)", start, end, done, total, d)
+    data, mimetype, name = romaneio_batch(start, end, formato, progress=progress)   # pool de processos compartilhado
+    return send_file(BytesIO(data), mimetype=mimetype, as_attachment=True, download_name=name)
 
 @app.route("/export/movimentos.csv")
 @login_required
 def export_mov_period_csv():
-    period = request.args.get("period","dia")
-    ref = request.args.get("ref") or date.today().isoformat()
-    start, end = parse_period(period, ref)
-    rows = movements_in_range(start, end)
-    si = StringIO(); cw = csv.writer(si, delimiter=';')
-    cw.writerow(["Período", period, "Referência", ref, "Início", start, "Fim", end])
-    cw.writerow([]); cw.writerow(["Data","Tipo","Item","Quantidade","Ref","Observação","Criado em"])
-    for r in rows:
-        cw.writerow([r["mov_date"][:10], r["mov_type"].upper(), r["item"], r["qty"], r["ref"] or "", r["note"] or "", r["created_at"]])
-    output = BytesIO(si.getvalue().encode('utf-8-sig')); output.seek(0)
-    return send_file(output, mimetype="text/csv", as_attachment=True,
-                     download_name=f"movimentos_{period}_{start}_a_{end}.csv")
+    period, ref, start, end = period_from_args(request.args)
+    def rows():
+        yield ["Período", period, "Referência", ref, "Início", start, "Fim", end]
+        yield []; yield ["Data","Tipo","Item","Quantidade","Ref","Observação","Criado em"]
+        for mov_date, mov_type, item, qty, mov_ref, note, created_at in LEDGER.iter_movements(start, end):
+            yield [mov_date[:10], mov_type.upper(), item, qty, mov_ref or "", note or "", created_at]
+    return csv_response(rows(), f"movimentos_{period}_{start}_a_{end}.csv")
+
+@app.route("/export/resumo.csv")
+@login_required
+@ledger_cached
+def export_resumo_csv():
+    period, ref, start, end = period_from_args(request.args)
+    report = LEDGER.period_report(start, end)
+    def rows():
+        yield ["Período", period, "Referência", ref, "Início", start, "Fim", end]
+        yield ["Linhas", report["linhas"], "Itens distintos", report["itens_distintos"]]
+        yield []; yield ["Data"] + [t.upper() for t in MOV_TYPES]
+        for d in sorted(report["days"]):
+            yield [d] + [report["days"][d][t] for t in MOV_TYPES]
+        yield ["TOTAL"] + [report["totals"][t] for t in MOV_TYPES]
+    return csv_response(rows(), f"resumo_{period}_{start}_a_{end}.csv")
 
 @app.route("/export/estoque.csv")
 @login_required
+@ledger_cached
 def export_estoque_csv():
-    data = get_stock_summary()
-    si = StringIO(); cw = csv.writer(si, delimiter=';')
-    cw.writerow(["Item","No Hotel","Em Lavanderia","Total"])
-    for r in data: cw.writerow([r['name'], r['no_hotel'], r['em_lavanderia'], r['total']])
-    output = BytesIO(si.getvalue().encode('utf-8-sig')); output.seek(0)
-    return send_file(output, mimetype="text/csv", as_attachment=True, download_name="inventario_atual.csv")
+    # ?data=AAAA-MM-DD exporta o estoque ao fim daquele dia (fechamento diário)
+    d = request.args.get("data")
+    try:
+        d = d and date.fromisoformat(d).isoformat()
+    except ValueError:
+        flash("Data inválida (use AAAA-MM-DD).", "error"); return redirect(url_for("dashboard"))
+    data = LEDGER.stock_on(d) if d else LEDGER.stock_summary()
+    def rows():
+        yield ["Item","No Hotel","Em Lavanderia","Total"]
+        for _, name, no_hotel, em_lavanderia, total in data: yield [name, no_hotel, em_lavanderia, total]
+    return csv_response(rows(), f"inventario_{d}.csv" if d else "inventario_atual.csv")
+
+@app.route("/export/faltas.csv")
+@login_required
+@ledger_cached
+def export_faltas_csv():
+    period, ref, start, end = shortfall_args(request.args)
+    try:
+        data = recon_shortfall(start, end)
+    except RuntimeError as e:
+        flash(str(e), "error"); return redirect(url_for("dashboard"))
+    def rows():
+        yield ["Período", period, "Referência", ref, "Início", start, "Fim", end]
+        yield []; yield ["Data do envio","Item","Ref","Enviado","Devolvido","Faltando","Dias"]
+        for r in data:
+            yield [r.day, r.name, r.ref, r.enviado, r.devolvido, r.faltando, r.dias]
+    return csv_response(rows(), f"faltas_{period}_{start}_a_{end}.csv")
+
+# ---- Comandos (flask --app app <comando>) ----
+@app.cli.command("estoque-verificar")
+@click.option("--corrigir", is_flag=True, help="Reconstrói o saldo materializado a partir das movimentações.")
+def cli_estoque_verificar(corrigir):
+    """Confere stock_balance contra o livro de movimentos e relata divergências."""
+    drift = stock_rebuild(fix=corrigir)
+    for d in drift:
+        click.echo(f"item {d['item_id']}: esperado no_hotel/em_lavanderia={d['esperado']} atual={d['atual']}")
+    if not drift:
+        click.echo("Saldo materializado consistente.")
+    elif corrigir:
+        click.echo(f"{len(drift)} item(ns) corrigido(s).")
+    else:
+        click.echo(f"{len(drift)} divergência(s). Rode com --corrigir para reconstruir."); sys.exit(1)
+
+@app.cli.command("fechamento")
+@click.option("--refazer", is_flag=True, help="Recalcula o fechamento diário de todo o histórico.")
+def cli_fechamento(refazer):
+    """Atualiza stock_daily (dias pendentes ou tudo) e confere o último saldo contra stock_balance."""
+    conn = db_connect(); c = conn.cursor()
+    try:
+        t = time.perf_counter()
+        c.execute("BEGIN IMMEDIATE;")
+        n = rollup_rebuild(c) if refazer else rollup_refresh(c)
+        conn.commit()
+        click.echo(f"{n} dia(s) recalculado(s) em {time.perf_counter() - t:.2f}s.")
+        c.execute("""
+            SELECT b.item_id, b.no_hotel, b.em_lavanderia, s.no_hotel, s.em_lavanderia
+            FROM stock_balance b
+            LEFT JOIN stock_daily s ON s.item_id=b.item_id
+                 AND s.day=(SELECT MAX(day) FROM stock_daily WHERE item_id=b.item_id);
+        """)
+        drift = [r for r in c.fetchall() if abs(r[1]-(r[3] or 0)) > 1e-6 or abs(r[2]-(r[4] or 0)) > 1e-6]
+    finally:
+        conn.close()
+    for r in drift:
+        click.echo(f"item {r[0]}: saldo atual=({r[1]}, {r[2]}) fechamento=({r[3]}, {r[4]})")
+    if drift:
+        click.echo(f"{len(drift)} divergência(s) entre fechamento e saldo. Rode com --refazer."); sys.exit(1)
+    click.echo("Fechamento consistente com o saldo atual.")
+
+@app.cli.command("conciliacao")
+@click.option("--refazer", is_flag=True, help="Refaz o casamento de envios e retornos de todo o histórico.")
+def cli_conciliacao(refazer):
+    """Confere os lotes de envio em aberto contra o saldo em lavanderia e mostra o envelhecimento."""
+    conn = db_connect(); c = conn.cursor()
+    try:
+        if refazer:
+            t = time.perf_counter()
+            c.execute("BEGIN IMMEDIATE;")
+            n = recon_rebuild(c)
+            conn.commit()
+            click.echo(f"Conciliação refeita em {time.perf_counter() - t:.2f}s: {n} lote(s) de envio em aberto.")
+        drift = recon_verify(c)
+    finally:
+        conn.close()
+    for d in drift:
+        click.echo(f"item {d['item_id']}: em lavanderia={d['em_lavanderia']} lotes abertos - sobras={d['conciliado']}")
+    if drift:
+        click.echo(f"{len(drift)} divergência(s) entre conciliação e saldo. Rode com --refazer."); sys.exit(1)
+    click.echo("Conciliação consistente com o saldo em lavanderia.")
+    labels = recon_aging_labels()
+    click.echo(f"  {'item':<24} {'lotes':>6} " + " ".join(f"{l:>7}" for l in labels) + f" {'sobras':>7}  envio mais antigo")
+    for r in recon_aging():
+        click.echo(f"  {r.name[:24]:<24} {r.lotes:>6} " + " ".join(f"{q:>7}" for q in r.faixas) + f" {r.sobras:>7}  {r.mais_antigo or '-'}")
+
+@app.cli.command("schema")
+def cli_schema():
+    """Versão do schema, migrações aplicadas e tempo da inicialização do banco."""
+    conn = db_connect(); c = conn.cursor()
+    c.execute("SELECT version, name, applied_at FROM schema_version ORDER BY version;")
+    for r in c.fetchall():
+        click.echo(f"{r['version']:>3}  {r['applied_at']}  {r['name']}")
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='qty_rounding';")
+    if c.fetchone():
+        c.execute("SELECT COUNT(*) FROM qty_rounding;")
+        click.echo(f"Quantidades fracionadas arredondadas na conversão para inteiros: {c.fetchone()[0]} (ver tabela qty_rounding)")
+    conn.close()
+    click.echo(f"Versão atual: {BOOTSTRAP_STATS['version']} (esperada {SCHEMA_VERSION}); "
+               f"bootstrap em {BOOTSTRAP_STATS['seconds']*1000:.1f} ms, aplicadas agora: {BOOTSTRAP_STATS['applied'] or 'nenhuma'}")
+
+@app.cli.command("plano-consultas")
+def cli_plano_consultas():
+    """Mostra o plano das consultas de relatório e falha se alguma varrer a tabela movements."""
+    plans, scans = report_query_plans()
+    for name, details in plans.items():
+        click.echo(f"{name}:")
+        for d in details: click.echo(f"    {d}")
+    if scans:
+        click.echo("SCAN em movements: " + ", ".join(scans)); sys.exit(1)
+
+@app.cli.command("importar")
+@click.argument("arquivos", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--lote", type=int, default=IMPORT_CHUNK, show_default=True, help="Linhas por transação.")
+@click.option("--adiar-indices", is_flag=True, help="Remove os índices do histórico durante a carga e os recria no fim.")
+@click.option("--codificacao", default="utf-8-sig", show_default=True, help="Codificação dos CSV (ex.: cp1252 para planilhas antigas do Excel).")
+def cli_importar(arquivos, lote, adiar_indices, codificacao):
+    """Importa movimentações de CSV (layout de /export/movimentos.csv) ou XLSX, sem duplicar as já gravadas."""
+    def progress(rep):
+        click.echo(f"  {rep['lidas']} linha(s) lida(s), {rep['inseridas']} nova(s), {rep['duplicadas']} já gravada(s)")
+    failed = False
+    for path in arquivos:
+        click.echo(f"{path}:")
+        try:
+            with open(path, "rb") as f:
+                rep = import_movements(import_file_rows(f, path, codificacao), chunk=lote, defer_indexes=adiar_indices, progress=progress)
+        except (RuntimeError, ValueError) as e:
+            if isinstance(e, UnicodeDecodeError): e = f"o arquivo não está em {codificacao} (tente --codificacao cp1252)"
+            click.echo(f"  erro: {e} (lotes anteriores ficaram gravados; importar de novo só grava o que falta)"); failed = True
+            continue
+        for e in rep["erros"]:
+            click.echo(f"  linha {e['linha']}: {e['erro']}")
+        if rep["itens_criados"]:
+            click.echo(f"  itens cadastrados: {', '.join(rep['itens_criados'])}")
+        click.echo(f"  {rep['inseridas']} inserida(s), {rep['duplicadas']} duplicada(s), {rep['invalidas']} inválida(s) "
+                   f"em {rep['segundos']:.2f}s ({rep['linhas_por_segundo']} linhas/s).")
+    if failed:
+        sys.exit(1)
+
+@app.cli.command("arquivar")
+@click.option("--ate", type=int, default=None, help="Último ano a arquivar (padrão: ano atual - 1 - ARCHIVE_KEEP_YEARS).")
+@click.option("--vacuum", is_flag=True, help="Compacta o banco principal no fim (VACUUM) para devolver o espaço ao disco.")
+def cli_arquivar(ate, vacuum):
+    """Move anos encerrados de movimentações para arquivos anuais (ARCHIVE_DIR) e lista os anos arquivados."""
+    ate = ate or date.today().year - 1 - ARCHIVE_KEEP_YEARS
+    conn = db_connect(); c = conn.cursor()
+    c.execute("SELECT MIN(mov_day) FROM movements WHERE mov_day IS NOT NULL;"); first = c.fetchone()[0]
+    conn.close()
+    for year in range(int(first[:4]) if first else ate + 1, ate + 1):
+        try:
+            r = archive_year(year)
+        except (RuntimeError, ValueError) as e:
+            click.echo(f"{year}: {e}"); sys.exit(1)
+        click.echo(f"{year}: {r['linhas']} movimentação(ões) -> {r['arquivo']} em {r['segundos']:.2f}s")
+    if vacuum:
+        size = os.path.getsize(DB_PATH); conn = db_connect()
+        try:
+            conn.execute("VACUUM;"); conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        finally:
+            conn.close()
+        click.echo(f"VACUUM: {size // 1024} KB -> {os.path.getsize(DB_PATH) // 1024} KB")
+    for a in archives_info():
+        click.echo(f"  {a['ano']}  {a['linhas']:>9} linhas  {a['arquivo']}  " + (f"{a['bytes'] // 1024} KB" if a["bytes"] is not None else "ARQUIVO AUSENTE"))
+
+@app.cli.command("romaneios")
+@click.option("--inicio", required=True, help="Primeiro dia (AAAA-MM-DD).")
+@click.option("--fim", required=True, help="Último dia (AAAA-MM-DD).")
+@click.option("--formato", type=click.Choice(["pdf", "zip"]), default="pdf", show_default=True)
+@click.option("--saida", type=click.Path(dir_okay=False), help="Arquivo de saída (padrão: romaneios_<inicio>_a_<fim>.<formato>).")
+@click.option("--workers", type=int, default=None, help="Processos de renderização (padrão: nº de núcleos).")
+@click.option("--bench", is_flag=True, help="Só mede páginas/s com 1, 2, 4… processos, sem gravar arquivo.")
+def cli_romaneios(inicio, fim, formato, saida, workers, bench):
+    """Gera os romaneios de um intervalo de datas (PDF único ou ZIP com PDF/CSV por dia)."""
+    if not romaneio_pdf.available():
+        click.echo("Instale a dependência 'reportlab': pip install reportlab"); sys.exit(1)
+    if bench:
+        days = LEDGER.romaneio_range(inicio, fim)
+        if not days:
+            click.echo("Nenhum romaneio no período."); sys.exit(1)
+        counts = [1]
+        while counts[-1] * 2 <= (workers or os.cpu_count() or 1):
+            counts.append(counts[-1] * 2)
+        for r in romaneio_pdf.benchmark(days, BASE_DIR, counts):
+            click.echo(f"workers={r['workers']:>2}  páginas={r['pages']}  {r['seconds']:.2f}s  {r['pages_per_sec']} páginas/s")
+        return
+    def progress(done, total, d):
+        click.echo(f"[{done}/{total}] {d}")
+    data, _, name = romaneio_batch(inicio, fim, formato, workers=workers, progress=progress)
+    with open(saida or name, "wb") as f:
+        f.write(data)
+    click.echo(f"Gravado {saida or name} ({len(data)} bytes).")
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
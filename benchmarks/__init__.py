@@ -0,0 +1,6 @@
+# benchmarks - Livro sintético e medições de desempenho do app
+#
+#   python -m benchmarks.run --movimentos 100000 --saida resultados.json
+#   python -m benchmarks.compare antes.json depois.json
+#
+# O banco sintético fica num arquivo temporário (BBH_DB_PATH); o lavanderia.db nunca é tocado.
@@ -0,0 +1,29 @@
+# compare.py - Compara dois resultados de benchmarks.run ou benchmarks.startup (medianas; > 1,00x = mais lento no segundo)
+#
+#   python -m benchmarks.compare antes.json depois.json [--limite 1.10]
+import argparse, json, sys
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compara dois JSON de benchmarks.run (ou de benchmarks.startup).")
+    ap.add_argument("antes"); ap.add_argument("depois")
+    ap.add_argument("--limite", type=float, default=1.10, help="razão acima da qual a medição conta como regressão")
+    args = ap.parse_args(argv)
+    with open(args.antes, encoding="utf-8") as f: before = json.load(f)
+    with open(args.depois, encoding="utf-8") as f: after = json.load(f)
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    regressions = 0
+    for section in ("funcoes", "rotas", "partida"):   # partida: benchmarks.startup
+        for name, b in before.get(section, {}).items():
+            a = after.get(section, {}).get(name)
+            if not a or "erro" in a or "erro" in b:
+                continue
+            ratio = a["mediana"] / b["mediana"] if b["mediana"] else float("inf")
+            flag = "  <-- regressão" if ratio > args.limite else ""
+            regressions += bool(flag)
+            print(f"  {name:<45} {b['mediana']:>9.3f} -> {a['mediana']:>9.3f} ms  {ratio:5.2f}x{flag}")
+    if "carga" in before and "carga" in after:
+        print(f"  carga: {before['carga']['req_por_segundo']} -> {after['carga']['req_por_segundo']} req/s")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# ledger.py - Gerador de livro de movimentações sintético e reprodutível (mesma semente, mesmo banco)
+import random, sqlite3, time
+from datetime import date, timedelta
+
+# Proporção aproximada de cada tipo num hotel em operação: envios e retornos dominam
+TYPE_WEIGHTS = dict(entrada=0.04, saida=0.02, envio=0.46, retorno=0.45, perda=0.03)
+CHUNK = 50000
+
+def synthetic_rows(n, items, end=None, years=3, seed=42):
+    """Gera n linhas (mov_date, mov_day, mov_type, item_id, qty, ref, note) espalhadas por years anos até end."""
+    rng = random.Random(seed)
+    end = end or date.today()
+    first = end - timedelta(days=365 * years - 1)
+    days = (end - first).days + 1
+    types = list(TYPE_WEIGHTS); weights = list(TYPE_WEIGHTS.values())
+    per_day = n / days; done = 0
+    for k in range(days):
+        d = (first + timedelta(days=k)).isoformat()
+        count = int(round(per_day * (k + 1))) - done
+        done += count
+        for t in rng.choices(types, weights, k=count):
+            qty = rng.randint(1, 40) if t in ("envio", "retorno") else rng.randint(1, 10)
+            yield (d, d, t, rng.choice(items), qty, f"ROM-{d}" if t in ("envio", "retorno") else "", "")
+
+def build(db_path, n, years=3, seed=42, end=None, log=print):
+    """Preenche o banco (já migrado pelo app) com n movimentações e recalcula saldo, fechamento e conciliação.
+
+    Os índices de movements são removidos durante a carga e recriados no fim (bem mais rápido em milhões de linhas).
+    Retorna dict(movimentos, segundos, linhas_por_segundo).
+    """
+    import app
+    conn = sqlite3.connect(db_path); c = conn.cursor()
+    c.execute("PRAGMA journal_mode=WAL;"); c.execute("PRAGMA synchronous=OFF;")
+    c.execute("SELECT id FROM items WHERE name IN (%s);" % ",".join("?" * len(app.DEFAULT_MOV_NAMES)), app.DEFAULT_MOV_NAMES)
+    items = [r[0] for r in c.fetchall()]
+    c.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name='movements' AND sql IS NOT NULL;")
+    indexes = c.fetchall()
+    t = time.perf_counter()
+    c.execute("BEGIN;")
+    for name, _ in indexes:
+        c.execute(f"DROP INDEX {name};")
+    rows = synthetic_rows(n, items, end=end, years=years, seed=seed); loaded = 0
+    while True:
+        chunk = [r for _, r in zip(range(CHUNK), rows)]
+        if not chunk: break
+        c.executemany(app.INSERT_MOVEMENT_SQL, chunk); loaded += len(chunk)
+        if log and loaded % (CHUNK * 20) == 0: log(f"  {loaded} movimentações...")
+    for _, sql in indexes:
+        c.execute(sql)
+    app.stock_fill(c)
+    app.rollup_rebuild(c)
+    app.recon_rebuild(c)
+    conn.commit(); conn.close()
+    seconds = time.perf_counter() - t
+    return dict(movimentos=loaded, segundos=round(seconds, 2), linhas_por_segundo=round(loaded / seconds) if seconds else 0)
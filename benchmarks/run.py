@@ -0,0 +1,154 @@
+# run.py - Mede funções e rotas do app sobre um livro sintético e grava o resultado em JSON
+#
+#   python -m benchmarks.run [--movimentos 100000] [--anos 3] [--repeticoes 20]
+#                            [--carga-segundos 10] [--carga-clientes 8] [--saida resultados.json]
+import argparse, json, os, platform, socket, sqlite3, statistics, subprocess, sys, tempfile, threading, time
+import urllib.request, urllib.parse, http.cookiejar
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def summarize(samples):
+    """Tempos em segundos -> dict em milissegundos (mín, mediana, p95, média)."""
+    ms = sorted(s * 1000 for s in samples)
+    return dict(n=len(ms), min=round(ms[0], 3), mediana=round(statistics.median(ms), 3),
+                p95=round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3), media=round(statistics.fmean(ms), 3))
+
+def timeit(fn, repeat):
+    fn()   # aquecimento (caches de página do SQLite, catálogo, ReportLab)
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter(); fn(); samples.append(time.perf_counter() - t)
+    return summarize(samples)
+
+def bench_functions(app, repeat):
+    today = date.today(); d = (today - timedelta(days=1)).isoformat()
+    month = app.parse_period("mes", today.isoformat())
+    year = (today.replace(month=1, day=1).isoformat(), today.replace(month=12, day=31).isoformat())
+    cases = {
+        "get_stock_summary": lambda: app.get_stock_summary(),
+        "kpis_range_mes": lambda: app.kpis_range(*month),
+        "kpis_range_ano": lambda: app.kpis_range(*year),
+        "series_last_7": lambda: app.series_last_7(),
+        "query_romaneio": lambda: app.query_romaneio(d),
+        "movements_in_range_mes": lambda: app.movements_in_range(*month),
+        "movements_page_item": lambda: app.movements_page(item_id=3, limit=50),
+        "stock_on_ano_passado": lambda: app.stock_on((today - timedelta(days=365)).isoformat()),
+    }
+    return {name: timeit(fn, repeat) for name, fn in cases.items()}
+
+ROUTES = [
+    "/", "/?period=mes", "/export/resumo.csv?start={ano}-01-01&end={ano}-12-31", "/movimentos", "/movimentos/historico?tipo=envio",
+    "/romaneio?data={ontem}", "/export/romaneio.pdf?data={ontem}", "/export/movimentos.csv?period=mes",
+    "/export/estoque.csv", "/api/itens/busca?q=lencol", "/login",
+]
+
+def route_urls():
+    ontem = (date.today() - timedelta(days=1)).isoformat()
+    return [u.format(ontem=ontem, ano=date.today().year) for u in ROUTES]
+
+def bench_routes(app, repeat):
+    """Rotas pelo test client do Flask (sem rede). Rotas que falham ficam com 'erro' (ex.: templates ausentes)."""
+    client = app.app.test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = 1; s["username"] = "admin"
+    results = {}
+    for url in route_urls():
+        def get():
+            r = client.get(url); r.get_data(); r.close()
+            if r.status_code != 200:
+                raise RuntimeError(f"HTTP {r.status_code}")
+        try:
+            results[url] = timeit(get, repeat)
+        except Exception as e:
+            results[url] = dict(erro=str(e))
+    return results
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+def bench_load(app, seconds, clients, threads):
+    """Carga concorrente contra o waitress: cada cliente faz login e percorre as rotas em ciclo."""
+    from waitress.server import create_server
+    port = free_port()
+    server = create_server(app.app, host="127.0.0.1", port=port, threads=threads)
+    threading.Thread(target=server.run, daemon=True).start()
+    base = f"http://127.0.0.1:{port}"
+    urls = [u for u in route_urls() if "pdf" not in u]
+    latencies = []; errors = [0]; lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def client(n):
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        opener.open(base + "/login", urllib.parse.urlencode(dict(username="admin", password="1234")).encode()).read()
+        mine = []; k = n
+        while time.perf_counter() < stop_at:
+            t = time.perf_counter()
+            try:
+                opener.open(base + urls[k % len(urls)]).read()
+                mine.append(time.perf_counter() - t)
+            except Exception:
+                with lock: errors[0] += 1
+            k += 1
+        with lock: latencies.extend(mine)
+
+    t = time.perf_counter()
+    workers = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for w in workers: w.start()
+    for w in workers: w.join()
+    elapsed = time.perf_counter() - t
+    server.close()
+    return dict(clientes=clients, threads_waitress=threads, segundos=round(elapsed, 2), requisicoes=len(latencies),
+                erros=errors[0], req_por_segundo=round(len(latencies) / elapsed, 1),
+                latencia=summarize(latencies) if latencies else None)
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmarks do BBH Lavanderia sobre um livro sintético.")
+    ap.add_argument("--movimentos", type=int, default=100000)
+    ap.add_argument("--anos", type=int, default=3)
+    ap.add_argument("--semente", type=int, default=42)
+    ap.add_argument("--repeticoes", type=int, default=20)
+    ap.add_argument("--carga-segundos", type=float, default=10, help="0 desliga o teste de carga")
+    ap.add_argument("--carga-clientes", type=int, default=8)
+    ap.add_argument("--threads", type=int, default=8, help="threads do waitress no teste de carga")
+    ap.add_argument("--banco", help="reaproveita/cria o banco sintético neste caminho (padrão: temporário)")
+    ap.add_argument("--saida", default="benchmark.json")
+    args = ap.parse_args(argv)
+
+    db_path = args.banco or os.path.join(tempfile.mkdtemp(prefix="bbh-bench-"), "bench.db")
+    fresh = not os.path.exists(db_path)
+    os.environ["BBH_DB_PATH"] = db_path
+    sys.path.insert(0, ROOT)
+    import app   # cria/migra o banco sintético
+    from benchmarks import ledger
+
+    result = dict(meta=dict(commit=git_commit(), data=date.today().isoformat(), python=platform.python_version(),
+                            sqlite=sqlite3.sqlite_version, plataforma=platform.platform(), cpus=os.cpu_count(),
+                            movimentos=args.movimentos, anos=args.anos, semente=args.semente, repeticoes=args.repeticoes))
+    if fresh:
+        print(f"Gerando {args.movimentos} movimentações em {db_path}...")
+        result["carga_livro"] = ledger.build(db_path, args.movimentos, years=args.anos, seed=args.semente)
+        print(f"  {result['carga_livro']}")
+    print("Funções..."); result["funcoes"] = bench_functions(app, args.repeticoes)
+    print("Rotas (test client)..."); result["rotas"] = bench_routes(app, args.repeticoes)
+    if args.carga_segundos > 0:
+        print(f"Carga concorrente ({args.carga_clientes} clientes, {args.carga_segundos}s)...")
+        result["carga"] = bench_load(app, args.carga_segundos, args.carga_clientes, args.threads)
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    for section in ("funcoes", "rotas"):
+        for name, r in result[section].items():
+            print(f"  {name:<45} " + (f"mediana {r['mediana']:>9.3f} ms  p95 {r['p95']:>9.3f} ms" if "erro" not in r else r["erro"]))
+    if "carga" in result:
+        print(f"  carga: {result['carga']['req_por_segundo']} req/s, erros {result['carga']['erros']}")
+    print(f"Resultado em {args.saida}")
+
+if __name__ == "__main__":
+    main()
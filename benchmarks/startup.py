@@ -0,0 +1,83 @@
+# startup.py - Mede a partida do desktop em processos novos: janela (tela de carregamento), app importado,
+# servidor ouvindo e primeira página (/login), em ms desde o início do processo
+#
+#   python -m benchmarks.startup [--repeticoes 5] [--exe dist\BBH-Lavanderia-GUI.exe] [--saida partida.json]
+#
+# Sem --exe roda "python -X importtime desktop.py --medir-inicio" e guarda também o tempo de import dos módulos
+# mais caros. Com --exe mede o executável do BBH-Lavanderia-GUI.spec (launcher.py), extração do onefile incluída.
+# A primeira execução cria e migra o banco (temporário) e fica fora das estatísticas.
+# Compare dois resultados com python -m benchmarks.compare antes.json depois.json.
+import argparse, json, os, platform, statistics, subprocess, sys, tempfile, time
+from datetime import date
+
+from benchmarks.run import ROOT, summarize, git_commit
+
+STAGES = ("janela", "app", "servidor", "pagina")
+
+def import_times(stderr):
+    """Linhas de -X importtime -> {módulo de primeiro nível: acumulado em s}."""
+    top = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if name.startswith("  ") or not cumulative.strip().isdigit():   # submódulo ou cabeçalho
+            continue
+        top[name.strip()] = int(cumulative) / 1e6
+    return top
+
+def launch(cmd, env):
+    out = env["BBH_PARTIDA_JSON"]
+    if os.path.exists(out):
+        os.remove(out)
+    t0 = time.time()
+    proc = subprocess.run(cmd, env=env, cwd=ROOT, capture_output=True, text=True, timeout=120)
+    if proc.returncode != 0 or not os.path.exists(out):
+        raise RuntimeError(f"partida falhou (código {proc.returncode}): {(proc.stderr or proc.stdout)[-500:]}")
+    with open(out, encoding="utf-8") as f:
+        marks = json.load(f)
+    if marks.get("erro"):
+        raise RuntimeError(marks["erro"])
+    return {k: marks[k] - t0 for k in STAGES + ("processo",) if marks.get(k) is not None}, import_times(proc.stderr)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Tempo de partida do desktop (janela, app, servidor, primeira página).")
+    ap.add_argument("--repeticoes", type=int, default=5)
+    ap.add_argument("--exe", help="executável do BBH-Lavanderia-GUI.spec (padrão: python desktop.py)")
+    ap.add_argument("--banco", help="banco usado nas partidas (padrão: temporário, criado na primeira)")
+    ap.add_argument("--modulos", type=int, default=15, help="módulos mais caros no resultado")
+    ap.add_argument("--saida", default="partida.json")
+    args = ap.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="bbh-partida-")
+    env = dict(os.environ, BBH_DB_PATH=args.banco or os.path.join(tmp, "partida.db"), BBH_PARTIDA_JSON=os.path.join(tmp, "etapas.json"))
+    cmd = [args.exe, "--medir-inicio"] if args.exe else [sys.executable, "-X", "importtime", os.path.join(ROOT, "desktop.py"), "--medir-inicio"]
+    print("Primeira partida (cria/migra o banco)...")
+    first, _ = launch(cmd, env)
+    samples = {}; imports = {}
+    for n in range(args.repeticoes):
+        stages, mods = launch(cmd, env)
+        for k, v in stages.items(): samples.setdefault(k, []).append(v)
+        for k, v in mods.items(): imports.setdefault(k, []).append(v)
+        print(f"  {n + 1}: " + "  ".join(f"{k} {v * 1000:.0f} ms" for k, v in stages.items()))
+
+    result = dict(meta=dict(commit=git_commit(), data=date.today().isoformat(), python=platform.python_version(),
+                            plataforma=platform.platform(), cpus=os.cpu_count(), repeticoes=args.repeticoes,
+                            alvo=args.exe or "desktop.py"),
+                  primeira_partida={k: round(v * 1000, 1) for k, v in first.items()},
+                  partida={k: summarize(v) for k, v in samples.items()})
+    if imports:
+        slowest = sorted(imports.items(), key=lambda kv: statistics.median(kv[1]), reverse=True)[:args.modulos]
+        result["imports_ms"] = {name: round(statistics.median(v) * 1000, 1) for name, v in slowest}
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    for name, r in result["partida"].items():
+        print(f"  {name:<10} mediana {r['mediana']:>9.1f} ms  p95 {r['p95']:>9.1f} ms")
+    if not samples.get("janela"):
+        print("  (sem pywebview: sem janela, mede só app, servidor e primeira página)")
+    for name, ms in result.get("imports_ms", {}).items():
+        print(f"  import {name:<30} {ms:>8.1f} ms")
+    print(f"Resultado em {args.saida}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# build_assets.py - Gera os arquivos estáticos de produção em static/dist/ (rode antes de empacotar com o PyInstaller)
+#
+#   python build_assets.py [--largura 1920] [--qualidade 80]
+#
+# - CSS: static/src/*.css sem as regras de classes que nenhum template (templates/) ou script (static/js/) usa,
+#   minificado e com o hash do conteúdo no nome (app.3f9c0a1b2d.css);
+# - imagens: static/img/*.jpg|png reduzidas à largura máxima, recomprimidas e também em WebP (requer Pillow);
+# - .gz (e .br com 'pip install brotli') ao lado dos arquivos de texto, servidos conforme o Accept-Encoding;
+# - static/dist/manifest.json: nome de origem (relativo a static/) -> arquivo gerado, lido por asset_url() no app.
+#
+# Como o nome muda junto com o conteúdo, o app serve static/dist/ com cache imutável de um ano. Sem o build, o app
+# aponta para as fontes (static/src, static/img) e tudo continua funcionando, só sem minificação e sem cache longo.
+import argparse, gzip, hashlib, json, os, re, sys, time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC = os.path.join(ROOT, "static")
+DIST = os.path.join(STATIC, "dist")
+MANIFEST = os.path.join(DIST, "manifest.json")
+SCAN_DIRS = (os.path.join(ROOT, "templates"), os.path.join(STATIC, "js"))   # onde as classes aparecem
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+COMPRESS_EXTS = (".css", ".js", ".svg", ".json")
+HASH_LEN = 10
+
+# ---- CSS ----
+CLASS_RE = re.compile(r"\.((?:\\.|[\w-])+)")
+TOKEN_RE = re.compile(r"[^\s\"'`<>{}=]+")
+
+def used_classes(dirs=SCAN_DIRS):
+    """Todos os tokens dos templates e scripts (superconjunto das classes usadas: sobra nunca quebra a página)."""
+    tokens = set()
+    for d in dirs:
+        for base, _, files in os.walk(d):
+            for name in files:
+                if name.endswith((".html", ".js")):
+                    with open(os.path.join(base, name), encoding="utf-8") as f:
+                        tokens.update(TOKEN_RE.findall(f.read()))
+    return tokens
+
+def css_blocks(css):
+    """Blocos de primeiro nível: [(prelúdio, corpo)]; corpo de @media/@supports volta como texto para recursão."""
+    blocks, depth, start, head = [], 0, 0, None
+    for i, ch in enumerate(css):
+        if ch == "{":
+            if depth == 0:
+                head, start = css[start:i].strip(), i + 1
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                blocks.append((head, css[start:i])); start = i + 1
+            elif depth < 0:
+                raise ValueError("CSS com '}' sobrando")
+    if depth:
+        raise ValueError("CSS com '{' sem fechamento")
+    return blocks
+
+def selector_used(selector, used):
+    """Seletor sem classe (base) sempre fica; com classes, só se todas aparecem nos templates."""
+    classes = [re.sub(r"\\(.)", r"\1", c) for c in CLASS_RE.findall(selector)]
+    return all(c in used for c in classes)
+
+def minify_declarations(body):
+    decls = [d.strip() for d in body.split(";") if d.strip()]
+    return ";".join(re.sub(r"\s*:\s*", ":", d, count=1) for d in decls)
+
+def build_css(css, used):
+    """Purga e minifica: devolve (css, regras mantidas, regras removidas)."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    out, kept, dropped = [], 0, 0
+    for head, body in css_blocks(css):
+        head = " ".join(head.split())
+        if head.startswith(("@media", "@supports")):
+            inner, k, d = build_css(body, used)
+            kept += k; dropped += d
+            if inner:
+                out.append(f"{head}{{{inner}}}")
+        elif head.startswith("@"):   # @keyframes, @font-face: sem classes, ficam como estão
+            out.append(f"{head}{{{' '.join(body.split())}}}"); kept += 1
+        else:
+            selectors = [s for s in (" ".join(s.split()) for s in head.split(",")) if selector_used(s, used)]
+            if not selectors:
+                dropped += 1; continue
+            out.append(f"{','.join(selectors)}{{{minify_declarations(body)}}}"); kept += 1
+    return "".join(out), kept, dropped
+
+# ---- Imagens (Pillow opcional) ----
+def build_image(path, width, quality):
+    """Imagem reduzida -> [(extensão, bytes)] no formato original e em WebP."""
+    from PIL import Image
+    with Image.open(path) as im:
+        im.load()
+        if im.width > width:
+            im = im.resize((width, round(im.height * width / im.width)), Image.LANCZOS)
+        out = []
+        buf = BytesIO()
+        if path.lower().endswith(".png"):
+            im.save(buf, "PNG", optimize=True); out.append((".png", buf.getvalue()))
+        else:
+            im.convert("RGB").save(buf, "JPEG", quality=quality, optimize=True, progressive=True)
+            out.append((".jpg", buf.getvalue()))
+        buf = BytesIO()
+        im.save(buf, "WEBP", quality=quality - 5, method=6); out.append((".webp", buf.getvalue()))
+    return out
+
+# ---- Saída ----
+def compressors():
+    out = [(".gz", lambda b: gzip.compress(b, 9, mtime=0))]
+    try:
+        import brotli
+        out.append((".br", lambda b: brotli.compress(b, quality=11)))
+    except ImportError:
+        pass
+    return out
+
+def write_hashed(data, stem, ext, written, compress):
+    name = f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LEN]}{ext}"
+    with open(os.path.join(DIST, name), "wb") as f:
+        f.write(data)
+    written.add(name)
+    if ext in COMPRESS_EXTS:
+        for suffix, fn in compress:
+            packed = fn(data)
+            if len(packed) < len(data):
+                with open(os.path.join(DIST, name + suffix), "wb") as f:
+                    f.write(packed)
+                written.add(name + suffix)
+    return "dist/" + name
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="CSS purgado/minificado, imagens reduzidas/WebP e variantes .gz/.br em static/dist/.")
+    ap.add_argument("--largura", type=int, default=1920, help="largura máxima das imagens (px)")
+    ap.add_argument("--qualidade", type=int, default=80, help="qualidade JPEG (WebP usa 5 a menos)")
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    os.makedirs(DIST, exist_ok=True)
+    manifest, written, compress = {}, set(), compressors()
+    used = used_classes()
+
+    src = os.path.join(STATIC, "src")
+    for name in sorted(os.listdir(src)) if os.path.isdir(src) else ():
+        if not name.endswith(".css"):
+            continue
+        with open(os.path.join(src, name), encoding="utf-8") as f:
+            raw = f.read()
+        css, kept, dropped = build_css(raw, used)
+        data = css.encode("utf-8")
+        manifest[f"src/{name}"] = write_hashed(data, name[:-4], ".css", written, compress)
+        print(f"  {name}: {len(raw.encode('utf-8'))} -> {len(data)} bytes ({kept} regras, {dropped} sem uso removidas)")
+
+    img = os.path.join(STATIC, "img")
+    images = sorted(n for n in os.listdir(img) if n.lower().endswith(IMAGE_EXTS)) if os.path.isdir(img) else []
+    if images:
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            print("  imagens: Pillow não instalado (pip install pillow); ficam as originais de static/img")
+            images = []
+    for name in images:
+        stem = os.path.splitext(name)[0]
+        size = os.path.getsize(os.path.join(img, name))
+        for ext, data in build_image(os.path.join(img, name), args.largura, args.qualidade):
+            manifest[f"img/{stem}{ext}"] = write_hashed(data, stem, ext, written, compress)
+            print(f"  {name} -> {stem}{ext}: {size} -> {len(data)} bytes")
+
+    data = json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8")
+    with open(MANIFEST, "wb") as f:
+        f.write(data)
+    written.add(os.path.basename(MANIFEST))
+    for name in os.listdir(DIST):   # versões antigas
+        if name not in written:
+            os.remove(os.path.join(DIST, name))
+    if not any(s == ".br" for s, _ in compress):
+        print("  (sem .br: pip install brotli)")
+    print(f"{len(manifest)} arquivos em {os.path.relpath(DIST, ROOT)} em {time.perf_counter() - t0:.1f} s")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,9 @@ echo Instalando dependencias...
 py -m pip install -r requirements.txt
 py -m pip install pywebview waitress
 
+echo Gerando static\dist (CSS, imagens, .gz)...
+py build_assets.py
+
 echo Limpando SPEC antigo (se existir)...
 del *.spec 2>nul
 
@@ -1,6 +1,7 @@
 @echo off
 setlocal
 pip install -U pyinstaller pyinstaller-hooks-contrib
+python build_assets.py
 pyinstaller --clean --noconfirm --onefile --windowed --noupx --name BBH-Lavanderia-GUI ^
   --add-data "templates;templates" ^
   --add-data "static;static" ^
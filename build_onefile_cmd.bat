@@ -4,6 +4,7 @@ REM Atenção: em ONEFILE o banco pode nao persistir sem ajuste de caminho.
 REM Veja README_PACKAGE.txt (Opcao A) para forcar o DB ao lado do .exe.
 
 py -m pip install pywebview waitress
+py build_assets.py
 del *.spec 2>nul
 
 py -m PyInstaller --onefile --noconsole --name "BBH-Lavanderia" --icon app.ico ^
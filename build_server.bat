@@ -1,6 +1,7 @@
 @echo off
 setlocal
 pip install -U pyinstaller pyinstaller-hooks-contrib
+python build_assets.py
 pyinstaller --clean --noconfirm --onefile --name BBH-Lavanderia ^
   --add-data "templates;templates" ^
   --add-data "static;static" ^
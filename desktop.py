@@ -1,61 +1,139 @@
 # desktop.py - Wrapper para abrir o app Flask em janela nativa (sem navegador)
-import threading
-import socket
+#
+# Partida rápida: a janela abre na hora com uma tela de carregamento (SPLASH_HTML) enquanto uma thread importa o app
+# (Flask, migrações do banco) e sobe o servidor. O servidor avisa por um Event quando o socket já está ouvindo, e só
+# então a janela troca para /login — sem sondar a porta. Este módulo importa só a biblioteca padrão no topo: os
+# processos de renderização dos romaneios o reimportam (ver a guarda no fim).
+#
+#   python desktop.py [--medir-inicio]
+#
+# --medir-inicio grava uma linha JSON com os instantes (epoch, s) de cada etapa em BBH_PARTIDA_JSON (ou na saída
+# padrão; o .exe sem console não tem) e encerra. Usado por python -m benchmarks.startup, também com o .exe do
+# BBH-Lavanderia-GUI.spec (via launcher.py).
+import json
+import multiprocessing
 import os
 import sys
+import threading
 import time
 
-# Importa o app Flask do projeto
-import app as webapp
+STARTED_AT = time.time()
+TITLE = "BBH — Lavanderia PRO"   # o mesmo APP_TITLE do app.py (importá-lo aqui atrasaria a janela)
 
-# Ajuste opcional do caminho do banco quando empacotado
-# Em modo "onedir", __file__ já aponta para a pasta do app dentro de dist.
-# Se quiser forçar a persistência ao lado do executável, descomente abaixo:
+# Persistência do banco ao lado do executável (onefile): descomente. Precisa valer antes do import do app,
+# que abre e migra o banco em BBH_DB_PATH.
 # if getattr(sys, "frozen", False):
-#     base_dir = os.path.dirname(sys.executable)
-#     webapp.BASE_DIR = base_dir
-#     webapp.DB_PATH = os.path.join(base_dir, "lavanderia.db")
-
-# Escolhe uma porta livre
-def get_free_port():
-    s = socket.socket()
-    s.bind(("127.0.0.1", 0))
-    port = s.getsockname()[1]
-    s.close()
-    return port
-
-PORT = get_free_port()
-
-# Sobe o servidor Flask em uma thread
-def run_server():
-    # Se preferir, instale waitress e use:
-    #   from waitress import serve
-    #   serve(webapp.app, host="127.0.0.1", port=PORT, threads=4)
-    webapp.app.run(host="127.0.0.1", port=PORT, debug=False, use_reloader=False, threaded=True)
-
-server_thread = threading.Thread(target=run_server, daemon=True)
-server_thread.start()
-
-# Aguarda o servidor ficar de pé
-for _ in range(60):
+#     os.environ.setdefault("BBH_DB_PATH", os.path.join(os.path.dirname(sys.executable), "lavanderia.db"))
+
+SPLASH_HTML = """<!doctype html>
+<html lang="pt-BR"><head><meta charset="utf-8"><title>%(title)s</title>
+<style>
+  html,body{height:100%%;margin:0;font-family:system-ui,"Segoe UI",sans-serif;background:#f8fafc;color:#0f172a}
+  body{display:flex;align-items:center;justify-content:center;flex-direction:column;gap:18px}
+  .spin{width:38px;height:38px;border:4px solid #cbd5e1;border-top-color:#0f172a;border-radius:50%%;animation:r .8s linear infinite}
+  @keyframes r{to{transform:rotate(360deg)}}
+  small{color:#64748b}
+</style></head>
+<body><div class="spin"></div><div>%(title)s</div><small>%(message)s</small></body></html>"""
+
+def splash(message="Abrindo o sistema..."):
+    from html import escape
+    return SPLASH_HTML % dict(title=TITLE, message=escape(message))
+
+class ServerThread(threading.Thread):
+    """Importa o app e serve em host:port (0 = porta livre). ready é sinalizado com o socket já ouvindo
+    (url preenchida) ou com a falha (error preenchido)."""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__(daemon=True)
+        self.host, self.port = host, port
+        self.ready = threading.Event()
+        self.url = self.error = None
+        self.marks = {}   # etapa -> instante (epoch, s)
+
+    def run(self):
+        try:
+            import app as webapp
+            self.marks["app"] = time.time()
+            serve = self._bind(webapp)
+            self.marks["servidor"] = time.time()
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.ready.set()
+        serve()
+
+    def _bind(self, webapp):
+        """Abre o socket (já ouvindo ao retornar) e devolve a função que atende as requisições."""
+        try:
+            from waitress.server import create_server
+        except ImportError:
+            # Sem waitress: servidor do werkzeug (cada painel aberto mantém uma conexão de eventos e um thread)
+            from werkzeug.serving import make_server
+            server = make_server(self.host, self.port, webapp.app, threaded=True)
+            self.url = f"http://{self.host}:{server.server_port}"
+            return server.serve_forever
+        server = create_server(webapp.app, host=self.host, port=self.port, threads=webapp.SERVER_THREADS)
+        self.url = f"http://{self.host}:{server.effective_port}"
+        return server.run
+
+def measure(server, marks):
+    """--medir-inicio: espera o servidor, pede /login uma vez e imprime os instantes de cada etapa."""
+    import urllib.request
+    server.ready.wait()
+    if server.error is None:
+        with urllib.request.urlopen(server.url + "/login") as r:
+            r.read()
+        marks["pagina"] = time.time()
+    marks.update(server.marks, processo=STARTED_AT, erro=str(server.error) if server.error else None)
+    out = os.environ.get("BBH_PARTIDA_JSON")
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(json.dumps(marks))
+    else:
+        print(json.dumps(marks), flush=True)
+
+def main(port=0):
+    measuring = "--medir-inicio" in sys.argv
+    server = ServerThread(port=port)
+    server.start()   # o app é importado enquanto a janela abre
     try:
-        import http.client
-        conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=0.5)
-        conn.request("GET", "/login")
-        r = conn.getresponse()
-        if r.status in (200, 302, 301, 401):
-            break
+        import webview
     except Exception:
-        time.sleep(0.2)
-else:
-    print("Falha ao iniciar o servidor Flask.")
-    sys.exit(1)
-
-# Abre janela nativa com o app
-import webview
-title = getattr(webapp, "APP_TITLE", "BBH — Sistema")
-window = webview.create_window(title, f"http://127.0.0.1:{PORT}/login", width=1200, height=800, confirm_close=True)
-webview.start()
-
-# Encerra o processo todo ao fechar a janela
-os._exit(0)
+        webview = None
+
+    if webview is None:   # sem pywebview: abre no navegador padrão
+        if measuring:
+            measure(server, dict(janela=None)); return
+        server.ready.wait()
+        if server.error is not None:
+            print(f"Falha ao iniciar o servidor: {server.error}"); sys.exit(1)
+        import webbrowser
+        webbrowser.open(server.url + "/login")
+        server.join()
+        return
+
+    marks = {}
+    window = webview.create_window(TITLE, html=splash(), width=1200, height=800, confirm_close=not measuring)
+    window.events.shown += lambda: marks.setdefault("janela", time.time())
+
+    def load():
+        # roda numa thread do pywebview depois que a janela existe
+        server.ready.wait()
+        if server.error is not None:
+            window.load_html(splash(f"Falha ao iniciar o servidor: {server.error}"))
+            return
+        if measuring:
+            measure(server, marks); window.destroy(); return
+        window.load_url(server.url + "/login")
+
+    webview.start(load)
+
+    # Encerra o processo todo ao fechar a janela
+    os._exit(0)
+
+# Guarda necessária: os processos de renderização dos romaneios reimportam este módulo
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,344 @@
+# ledger_pg.py - Livro de movimentações em PostgreSQL (vários hotéis gravando no mesmo banco)
+# Mesma interface do SqliteLedger de app.py; escolhido com BBH_DATABASE_URL=postgresql://...
+# Ficam aqui itens (e apelidos), movimentações e saldo, que são o que os hotéis compartilham;
+# usuários continuam no SQLite local de cada instalação. Sem fechamento diário: estoque em data
+# passada e tendência são somados direto de movements (o PostgreSQL agrega isso por índice).
+import time
+from datetime import date, timedelta
+from collections import OrderedDict
+from records import StockRow, RomaneioLine, trend_day
+
+# Driver e pool (opcional: pip install "psycopg[binary,pool]")
+try:
+    import psycopg
+    from psycopg_pool import ConnectionPool
+except Exception:
+    psycopg = ConnectionPool = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id SERIAL PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    unit TEXT DEFAULT 'un',
+    active INTEGER DEFAULT 1,
+    created_at TIMESTAMP DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS item_aliases (
+    item_id INTEGER NOT NULL REFERENCES items(id),
+    alias TEXT NOT NULL,
+    PRIMARY KEY(item_id, alias)
+);
+CREATE TABLE IF NOT EXISTS movements (
+    id BIGSERIAL PRIMARY KEY,
+    mov_date TEXT NOT NULL,
+    mov_day DATE,
+    mov_type TEXT NOT NULL CHECK(mov_type IN ('entrada','saida','envio','retorno','perda')),
+    item_id INTEGER NOT NULL REFERENCES items(id),
+    qty INTEGER NOT NULL,
+    ref TEXT,
+    note TEXT,
+    created_at TIMESTAMP DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_mov_day ON movements(mov_day, mov_type, item_id);
+CREATE INDEX IF NOT EXISTS idx_mov_seek ON movements(mov_day, id);
+CREATE INDEX IF NOT EXISTS idx_mov_item_day ON movements(item_id, mov_day, id);
+CREATE INDEX IF NOT EXISTS idx_mov_type_day ON movements(mov_type, mov_day, id);
+CREATE INDEX IF NOT EXISTS idx_mov_ref_day ON movements(ref, mov_day, id);
+CREATE TABLE IF NOT EXISTS stock_balance (
+    item_id INTEGER PRIMARY KEY REFERENCES items(id),
+    no_hotel BIGINT NOT NULL DEFAULT 0,
+    em_lavanderia BIGINT NOT NULL DEFAULT 0
+);
+-- Quantidades em peças inteiras (bancos criados antes guardavam DOUBLE PRECISION)
+DO $$ BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema=current_schema() AND table_name='movements' AND column_name='qty') <> 'integer' THEN
+        ALTER TABLE movements ALTER COLUMN qty TYPE INTEGER USING round(qty)::integer;
+        ALTER TABLE stock_balance ALTER COLUMN no_hotel TYPE BIGINT USING round(no_hotel)::bigint,
+                                  ALTER COLUMN em_lavanderia TYPE BIGINT USING round(em_lavanderia)::bigint;
+    END IF;
+END $$;
+CREATE TABLE IF NOT EXISTS app_meta (
+    key TEXT PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+"""
+
+CATALOG_TTL = 2.0   # segundos sem reler app_meta.catalog_gen: itens cadastrados em outro hotel aparecem nesse prazo
+
+class Row(tuple):
+    """Linha acessível por posição e por nome, como sqlite3.Row (templates e rotas usam os dois)."""
+    def __new__(cls, values, index):
+        row = super().__new__(cls, values); row._index = index
+        return row
+
+    def __getitem__(self, key):
+        return tuple.__getitem__(self, self._index[key] if isinstance(key, str) else key)
+
+    def keys(self):
+        return list(self._index)
+
+def row_factory(cursor):
+    index = {col.name: i for i, col in enumerate(cursor.description or ())}
+    return lambda values: Row(values, index)
+
+class PostgresLedger:
+    """Itens, movimentações, saldo e relatórios num PostgreSQL central, com pool de conexões."""
+    name = "postgresql"
+
+    def __init__(self, url, mov_types, stock_effect, default_names, pool_size=10):
+        if ConnectionPool is None:
+            raise RuntimeError('Backend PostgreSQL requer: pip install "psycopg[binary,pool]"')
+        self.mov_types = mov_types; self.stock_effect = stock_effect; self.default_names = default_names
+        self.pool = ConnectionPool(url, min_size=1, max_size=pool_size, open=True,
+                                   kwargs=dict(row_factory=row_factory))
+        self._catalog = None
+        self._catalog_local = 0   # sobe a cada mudança de itens feita por esta instalação (após o commit)
+        with self.pool.connection() as conn:
+            conn.execute(SCHEMA)
+            conn.cursor().executemany("INSERT INTO items(name) VALUES (%s) ON CONFLICT (name) DO NOTHING;",
+                                      [(n,) for n in default_names])
+
+    def close(self):
+        self.pool.close()
+
+    def stats(self):
+        return dict(backend=self.name, **self.pool.get_stats())
+
+    # ---- Catálogo ----
+    def _bump_catalog(self, conn):
+        conn.execute("""INSERT INTO app_meta(key, value) VALUES ('catalog_gen', 1)
+                        ON CONFLICT (key) DO UPDATE SET value=app_meta.value+1;""")
+        self._bump_ledger(conn)
+
+    # ---- Versão do livro (ETags e cache de páginas) ----
+    def _bump_ledger(self, conn):
+        conn.execute("""INSERT INTO app_meta(key, value) VALUES ('ledger_gen', 1), ('ledger_at', extract(epoch FROM now())::bigint)
+                        ON CONFLICT (key) DO UPDATE SET value=CASE app_meta.key WHEN 'ledger_gen' THEN app_meta.value+1
+                                                                                ELSE excluded.value END;""")
+
+    def version(self):
+        """(gen, at) como ledger_version() do app; uma consulta a app_meta (outros hotéis também gravam)."""
+        with self.pool.connection() as conn:
+            meta = dict(conn.execute("SELECT key, value FROM app_meta WHERE key IN ('ledger_gen', 'ledger_at');").fetchall())
+        return meta.get("ledger_gen", 0), meta.get("ledger_at", 0)
+
+    def closed_through(self):
+        """Sem arquivo anual no PostgreSQL: o livro central guarda todos os anos."""
+        return ""
+
+    def catalog(self):
+        """Mesmo formato de catalog() do app; recarrega quando app_meta.catalog_gen muda.
+
+        Como o PRAGMA data_version do lado SQLite, evita a consulta a app_meta: o catálogo vale enquanto esta
+        instalação não mudou itens (_catalog_local) e foi conferido há menos de CATALOG_TTL segundos.
+        """
+        cached = self._catalog; local = self._catalog_local; now = time.monotonic()
+        if cached is not None and cached["local"] == local and now - cached["checked"] < CATALOG_TTL:
+            return cached
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT value FROM app_meta WHERE key='catalog_gen';").fetchone()
+            gen = row[0] if row else 0
+            if cached is not None and cached["gen"] == gen and cached["local"] == local:
+                cached["checked"] = now
+                return cached
+            items = conn.execute(
+                "SELECT id, name FROM items WHERE active=1 ORDER BY name;").fetchall()
+        id_by_name = {r["name"]: r["id"] for r in items}
+        self._catalog = dict(gen=gen, local=local, checked=now, items=items, id_by_name=id_by_name,
+                             default_ids=[id_by_name[n] for n in self.default_names if n in id_by_name],
+                             ids=frozenset(id_by_name.values()))
+        return self._catalog
+
+    def item_aliases(self):
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT item_id, alias FROM item_aliases;").fetchall()
+
+    def items_list(self, ids=None):
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            if ids is not None:
+                by_id = {r["id"]: r for r in cur.execute("SELECT * FROM items WHERE id = ANY(%s);", (list(ids),))}
+                return [by_id[i] for i in ids if i in by_id]
+            return cur.execute("SELECT * FROM items WHERE active=1 ORDER BY name;").fetchall()
+
+    def add_item(self, name, aliases=()):
+        """False se o item já existe."""
+        with self.pool.connection() as conn:
+            row = conn.execute("INSERT INTO items(name) VALUES (%s) ON CONFLICT (name) DO NOTHING RETURNING id;", (name,)).fetchone()
+            if row is None:
+                return False
+            conn.cursor().executemany("INSERT INTO item_aliases(item_id, alias) VALUES (%s,%s) ON CONFLICT DO NOTHING;",
+                                      [(row[0], a) for a in aliases])
+            self._bump_catalog(conn)
+        self._catalog_local += 1
+        return True
+
+    def add_aliases(self, item_id, aliases):
+        """False se o item não existe."""
+        with self.pool.connection() as conn:
+            if conn.execute("SELECT 1 FROM items WHERE id=%s;", (item_id,)).fetchone() is None:
+                return False
+            conn.cursor().executemany("INSERT INTO item_aliases(item_id, alias) VALUES (%s,%s) ON CONFLICT DO NOTHING;",
+                                      [(item_id, a) for a in aliases])
+            self._bump_catalog(conn)
+        self._catalog_local += 1
+        return True
+
+    def deactivate_item(self, item_id):
+        with self.pool.connection() as conn:
+            conn.execute("UPDATE items SET active=0 WHERE id=%s;", (item_id,))
+            self._bump_catalog(conn)
+        self._catalog_local += 1
+
+    # ---- Movimentações ----
+    def _deltas(self, rows, sign=1):
+        deltas = {}
+        for iid, mov_type, qty in rows:
+            h, l = self.stock_effect[mov_type]
+            dh, dl = deltas.get(iid, (0, 0))
+            deltas[iid] = (dh + sign*h*qty, dl + sign*l*qty)
+        return deltas
+
+    def _apply(self, conn, deltas):
+        # Itens em ordem: transações concorrentes travam as linhas de saldo sempre na mesma sequência
+        conn.cursor().executemany("""
+            INSERT INTO stock_balance(item_id, no_hotel, em_lavanderia) VALUES (%s,%s,%s)
+            ON CONFLICT (item_id) DO UPDATE SET no_hotel=stock_balance.no_hotel+EXCLUDED.no_hotel,
+                                                em_lavanderia=stock_balance.em_lavanderia+EXCLUDED.em_lavanderia;
+        """, [(iid, h, l) for iid, (h, l) in sorted(deltas.items())])
+
+    def write_movements(self, valid):
+        """Grava linhas já validadas (mov_date, mov_date, tipo, item_id, qty, ref, note) e o saldo, numa transação."""
+        with self.pool.connection() as conn:
+            conn.cursor().executemany("""INSERT INTO movements(mov_date,mov_day,mov_type,item_id,qty,ref,note)
+                                         VALUES (%s,left(%s,10)::date,%s,%s,%s,%s,%s);""", valid)
+            self._apply(conn, self._deltas((v[3], v[2], v[4]) for v in valid))
+            self._bump_ledger(conn)
+
+    def delete_movement(self, mid):
+        with self.pool.connection() as conn:
+            row = conn.execute("DELETE FROM movements WHERE id=%s RETURNING item_id, mov_type, qty;", (mid,)).fetchone()
+            if row:
+                self._apply(conn, self._deltas([row], sign=-1))
+                self._bump_ledger(conn)
+        return row is not None
+
+    def recent_movements(self, limit=50):
+        with self.pool.connection() as conn:
+            return conn.execute("""
+                SELECT m.id, m.mov_date, m.mov_type, m.qty, m.ref, m.note, i.name as item_name
+                FROM movements m JOIN items i ON i.id = m.item_id
+                ORDER BY m.id DESC LIMIT %s;
+            """, (limit,)).fetchall()
+
+    def history_rows(self, item_id=None, mov_type=None, ref=None, start=None, end=None, after=None, limit=50):
+        """Linhas do histórico anteriores à chave after=(mov_day, id), mais recentes primeiro (ver app.movements_page)."""
+        where, params = [], []
+        if item_id: where.append("m.item_id=%s"); params.append(item_id)
+        if mov_type: where.append("m.mov_type=%s"); params.append(mov_type)
+        if ref: where.append("m.ref=%s"); params.append(ref)
+        if start: where.append("m.mov_day>=%s::date"); params.append(start)
+        if end: where.append("m.mov_day<=%s::date"); params.append(end)
+        if after:
+            where.append("(m.mov_day, m.id) < (%s::date, %s)"); params += list(after)
+        else:
+            where.append("m.mov_day IS NOT NULL")
+        with self.pool.connection() as conn:
+            return conn.execute(f"""
+                SELECT m.id, m.mov_date, m.mov_day::text AS mov_day, m.mov_type, m.qty, m.ref, m.note,
+                       m.created_at::text AS created_at, i.name as item_name
+                FROM movements m JOIN items i ON i.id = m.item_id
+                WHERE {" AND ".join(where)}
+                ORDER BY m.mov_day DESC, m.id DESC
+                LIMIT %s;
+            """, params + [limit]).fetchall()
+
+    def iter_movements(self, start, end, size=500):
+        """Movimentações do período em ordem de data, lidas em blocos por cursor nomeado no servidor."""
+        with self.pool.connection() as conn:
+            with conn.cursor(name="export_movimentos") as cur:
+                cur.itersize = size
+                cur.execute("""
+                    SELECT m.mov_date, m.mov_type, i.name as item, m.qty, m.ref, m.note, m.created_at::text AS created_at
+                    FROM movements m JOIN items i ON i.id=m.item_id
+                    WHERE m.mov_day BETWEEN %s::date AND %s::date
+                    ORDER BY m.mov_day ASC, m.id ASC;
+                """, (start, end))
+                yield from cur
+
+    # ---- Relatórios ----
+    def period_report(self, start, end):
+        with self.pool.connection() as conn:
+            rows = conn.execute("""
+                SELECT mov_day::text, mov_type, SUM(qty), COUNT(*)
+                FROM movements WHERE mov_day BETWEEN %s::date AND %s::date
+                GROUP BY mov_day, mov_type;
+            """, (start, end)).fetchall()
+            itens_distintos = conn.execute("SELECT COUNT(DISTINCT item_id) FROM movements WHERE mov_day BETWEEN %s::date AND %s::date;",
+                                           (start, end)).fetchone()[0]
+        totals = dict.fromkeys(self.mov_types, 0); days = {}; linhas = 0
+        for day, mov_type, qty, n in rows:
+            totals[mov_type] += qty; linhas += n
+            days.setdefault(day, dict.fromkeys(self.mov_types, 0))[mov_type] = qty
+        return dict(start=start, end=end, totals=totals, linhas=linhas, itens_distintos=itens_distintos, days=days)
+
+    def _balances(self, sql, params):
+        items = self.catalog()["items"]
+        with self.pool.connection() as conn:
+            balance = {iid: (h or 0, l or 0) for iid, h, l in conn.execute(sql, params)}
+        return [StockRow(iid, name, h, l, h + l) for iid, name in items for h, l in [balance.get(iid, (0, 0))]]
+
+    def _effect_sums(self):
+        nh = " ".join(f"WHEN '{t}' THEN {h}*qty" for t, (h, _) in self.stock_effect.items())
+        el = " ".join(f"WHEN '{t}' THEN {l}*qty" for t, (_, l) in self.stock_effect.items())
+        return f"SUM(CASE mov_type {nh} ELSE 0 END), SUM(CASE mov_type {el} ELSE 0 END)"
+
+    def stock_summary(self):
+        return self._balances("SELECT item_id, no_hotel, em_lavanderia FROM stock_balance;", ())
+
+    def stock_on(self, d):
+        return self._balances(f"SELECT item_id, {self._effect_sums()} FROM movements WHERE mov_day <= %s::date GROUP BY item_id;", (d,))
+
+    def stock_trend(self, start, end, item_id=None):
+        item_filter = "AND item_id=%s" if item_id else ""
+        extra = (item_id,) if item_id else ()
+        flows = ", ".join(f"SUM(CASE WHEN mov_type='{t}' THEN qty ELSE 0 END)" for t in self.mov_types)
+        with self.pool.connection() as conn:
+            no_hotel, em_lavanderia = conn.execute(
+                f"SELECT {self._effect_sums()} FROM movements WHERE mov_day < %s::date {item_filter};", (start,) + extra).fetchone()
+            by_day = {r[0]: r[1:] for r in conn.execute(
+                f"SELECT mov_day::text, {flows} FROM movements WHERE mov_day BETWEEN %s::date AND %s::date {item_filter} GROUP BY mov_day;",
+                (start, end) + extra)}
+        no_hotel = no_hotel or 0; em_lavanderia = em_lavanderia or 0
+        TrendDay = trend_day(self.mov_types)
+        effect_h = [self.stock_effect[t][0] for t in self.mov_types]; effect_l = [self.stock_effect[t][1] for t in self.mov_types]
+        series = []; d = date.fromisoformat(start); last = date.fromisoformat(end)
+        zero = (0,) * len(self.mov_types)
+        while d <= last:
+            day = d.isoformat(); day_flows = by_day.get(day, zero)
+            no_hotel += sum(h * q for h, q in zip(effect_h, day_flows))
+            em_lavanderia += sum(l * q for l, q in zip(effect_l, day_flows))
+            series.append(TrendDay(day, *day_flows, no_hotel, em_lavanderia))
+            d += timedelta(days=1)
+        return series
+
+    def romaneio(self, d):
+        sql = """SELECT i.name, SUM(m.qty) as qty FROM movements m JOIN items i ON i.id=m.item_id
+                 WHERE m.mov_type=%s AND m.mov_day=%s::date GROUP BY i.name ORDER BY i.name;"""
+        with self.pool.connection() as conn:
+            return ([RomaneioLine(*r) for r in conn.execute(sql, ('envio', d))],
+                    [RomaneioLine(*r) for r in conn.execute(sql, ('retorno', d))])
+
+    def romaneio_range(self, start, end):
+        days = OrderedDict()
+        with self.pool.connection() as conn:
+            for day, mov_type, name, qty in conn.execute("""
+                SELECT m.mov_day::text, m.mov_type, i.name, SUM(m.qty) as qty
+                FROM movements m JOIN items i ON i.id=m.item_id
+                WHERE m.mov_day BETWEEN %s::date AND %s::date AND m.mov_type IN ('envio','retorno')
+                GROUP BY m.mov_day, m.mov_type, i.name ORDER BY m.mov_day, i.name;
+            """, (start, end)):
+                envio, retorno = days.setdefault(day, ([], []))
+                (envio if mov_type == 'envio' else retorno).append(RomaneioLine(name, qty))
+        return [(d, envio, retorno) for d, (envio, retorno) in days.items()]
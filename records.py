@@ -0,0 +1,25 @@
+# records.py - Registros compactos (tuplas nomeadas) devolvidos pelos relatórios do app e do ledger_pg
+# Quantidades são peças inteiras. Os registros valem por nome (r.total), por posição e desempacotados;
+# nos templates r.name e r['name'] funcionam igual. Para JSON use r._asdict() (ou as_dicts).
+from collections import namedtuple
+from functools import lru_cache
+
+# Estoque de um item, atual ou ao fim de um dia
+StockRow = namedtuple("StockRow", "id name no_hotel em_lavanderia total")
+# Um dia do gráfico de 7 dias do painel (rótulo dd/mm, envios, retornos)
+SeriesDay = namedtuple("SeriesDay", "day env ret")
+# Linha do romaneio (item, quantidade somada no dia)
+RomaneioLine = namedtuple("RomaneioLine", "name qty")
+# Peças de um item ainda na lavanderia: lotes de envio abertos, peças por faixa de idade (faixas), envio mais
+# antigo em aberto e peças devolvidas sem envio correspondente (sobras)
+AgingRow = namedtuple("AgingRow", "item_id name lotes pecas mais_antigo faixas sobras")
+# Envio de um dia (item e ref.) que ainda não voltou inteiro; dias = idade do envio
+ShortfallRow = namedtuple("ShortfallRow", "day item_id name ref enviado devolvido faltando dias")
+
+@lru_cache(maxsize=None)
+def trend_day(mov_types):
+    """Tipo do dia da tendência de estoque: day, um campo por tipo de movimentação, no_hotel e em_lavanderia."""
+    return namedtuple("TrendDay", ("day",) + tuple(mov_types) + ("no_hotel", "em_lavanderia"))
+
+def as_dicts(records):
+    return [r._asdict() for r in records]
@@ -0,0 +1,218 @@
+# romaneio_pdf.py - Geração do PDF do romaneio (ReportLab)
+# Estilos, logo e estilos de tabela são montados uma vez por processo e reaproveitados.
+import atexit, os, re, threading, time
+from io import BytesIO
+from datetime import datetime
+from functools import lru_cache
+from types import SimpleNamespace
+
+@lru_cache(maxsize=None)
+def reportlab():
+    """Partes do ReportLab usadas aqui, importadas no primeiro PDF do processo (None se não estiver instalado).
+
+    Importar o ReportLab leva ~0,1 s: fica fora da partida do app e da janela do desktop.py.
+    """
+    try:
+        from reportlab.lib.pagesizes import A4
+        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image
+        from reportlab.lib import colors
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import cm
+    except Exception:
+        return None
+    return SimpleNamespace(A4=A4, SimpleDocTemplate=SimpleDocTemplate, Table=Table, TableStyle=TableStyle, Paragraph=Paragraph,
+                           Spacer=Spacer, PageBreak=PageBreak, Image=Image, colors=colors,
+                           getSampleStyleSheet=getSampleStyleSheet, ParagraphStyle=ParagraphStyle, cm=cm)
+
+def available():
+    return reportlab() is not None
+
+@lru_cache(maxsize=None)
+def _pdf_writer():
+    # Junção de PDFs já renderizados (opcional: pip install pypdf)
+    try:
+        from pypdf import PdfWriter
+    except Exception:
+        return None
+    return PdfWriter
+
+def can_merge():
+    return _pdf_writer() is not None
+
+LOGO_SIZE_PX = 256   # logo reduzido uma vez; no PDF ocupa 3,2 cm
+
+_assets = {}
+
+def load_assets(base_dir):
+    """Estilos, estilo das tabelas e logo (já reduzido) do processo atual, carregados na primeira chamada."""
+    assets = _assets.get(base_dir)
+    if assets is not None:
+        return assets
+    rl = reportlab(); colors = rl.colors
+    styles = rl.getSampleStyleSheet()
+    styles.add(rl.ParagraphStyle(name="Small", fontSize=9, textColor=colors.grey))
+    styles["Title"].textColor = colors.HexColor("#0f172a")
+    table_style = rl.TableStyle([
+        ("BACKGROUND",(0,0),(-1,0), colors.HexColor("#0f172a")),
+        ("TEXTCOLOR",(0,0),(-1,0), colors.white),
+        ("FONTNAME",(0,0),(-1,0),"Helvetica-Bold"),
+        ("FONTSIZE",(0,0),(-1,0),10),
+        ("ALIGN",(1,1),(1,-1),"RIGHT"),
+        ("GRID",(0,0),(-1,-1),0.25, colors.grey),
+        ("ROWBACKGROUNDS",(0,1),(-1,-1), [colors.whitesmoke, colors.HexColor("#eef2ff")]),
+        ("BOTTOMPADDING",(0,0),(-1,0),6),
+    ])
+    logo = None
+    logo_path = os.path.join(base_dir, "static", "logo.png")
+    if os.path.exists(logo_path):
+        try:
+            from PIL import Image as PILImage
+            img = PILImage.open(logo_path); img.thumbnail((LOGO_SIZE_PX, LOGO_SIZE_PX))
+            buf = BytesIO(); img.save(buf, format="PNG"); logo = buf.getvalue()
+        except Exception:
+            with open(logo_path, "rb") as f:
+                logo = f.read()
+    assets = _assets[base_dir] = dict(styles=styles, table_style=table_style, logo=logo)
+    return assets
+
+def _table(rows, table_style):
+    data = [["Item","Quantidade"]] + [[name or "—", qty or 0] for name, qty in rows]
+    if len(data) == 1: data.append(["—", 0])
+    tbl = reportlab().Table(data, hAlign="LEFT", colWidths=[340, 110])
+    tbl.setStyle(table_style)
+    return tbl
+
+def romaneio_elements(d, envio, retorno, base_dir):
+    """Flowables de um dia de romaneio. envio/retorno: listas de (nome, quantidade)."""
+    assets = load_assets(base_dir); styles = assets["styles"]
+    rl = reportlab(); Paragraph, Spacer, cm = rl.Paragraph, rl.Spacer, rl.cm
+    total_env = sum((qty or 0) for _, qty in envio)
+    total_ret = sum((qty or 0) for _, qty in retorno)
+
+    elements = []
+    if assets["logo"]:
+        elements.append(rl.Image(BytesIO(assets["logo"]), width=3.2*cm, height=3.2*cm))
+        elements.append(Spacer(1, 6))
+
+    when = datetime.strptime(d, "%Y-%m-%d").strftime("%d/%m/%Y (%A)").title()
+    elements.append(Paragraph("BBH — Romaneio de Lavanderia", styles["Title"]))
+    elements.append(Paragraph(f"Data: <b>{when}</b>", styles["Normal"]))
+    elements.append(Paragraph("Criado por André Vinicius · Bessa Beach Hotel — Solicitado por Helbo Moura (Diretor)", styles["Small"]))
+    elements.append(Paragraph("Responsável: Micheline Moura", styles["Small"]))
+    elements.append(Spacer(1, 14))
+
+    # Envios
+    elements.append(Paragraph("<b>Envios</b>", styles["Heading2"]))
+    elements.append(_table(envio, assets["table_style"]))
+    elements.append(Paragraph(f"<br/><b>Total de Envios:</b> {total_env}", styles["Normal"]))
+    elements.append(Spacer(1, 12))
+
+    # Retornos
+    elements.append(Paragraph("<b>Retornos</b>", styles["Heading2"]))
+    elements.append(_table(retorno, assets["table_style"]))
+    elements.append(Paragraph(f"<br/><b>Total de Retornos:</b> {total_ret}", styles["Normal"]))
+    elements.append(Spacer(1, 18))
+    elements.append(Paragraph("<br/>Conferido por: ____________________________", styles["Normal"]))
+    elements.append(Paragraph("Recebido por: ____________________________", styles["Normal"]))
+    return elements
+
+def _new_doc(buffer, title):
+    rl = reportlab(); cm = rl.cm
+    return rl.SimpleDocTemplate(buffer, pagesize=rl.A4, title=title, leftMargin=2*cm, rightMargin=2*cm, topMargin=1.6*cm, bottomMargin=1.6*cm)
+
+def render(d, envio, retorno, base_dir):
+    """PDF (bytes) do romaneio de um dia."""
+    buffer = BytesIO()
+    _new_doc(buffer, f"Romaneio {d}").build(romaneio_elements(d, envio, retorno, base_dir))
+    return buffer.getvalue()
+
+def render_merged(days, base_dir):
+    """Um único PDF com um romaneio por página (em sequência, no processo atual). days: [(d, envio, retorno)]."""
+    buffer = BytesIO(); elements = []
+    for n, (d, envio, retorno) in enumerate(days):
+        if n: elements.append(reportlab().PageBreak())
+        elements += romaneio_elements(d, envio, retorno, base_dir)
+    title = f"Romaneios {days[0][0]} a {days[-1][0]}" if days else "Romaneios"
+    _new_doc(buffer, title).build(elements)
+    return buffer.getvalue()
+
+def merge_pdfs(pdfs):
+    """Concatena PDFs com pypdf; None se pypdf não estiver instalado."""
+    PdfWriter = _pdf_writer()
+    if PdfWriter is None:
+        return None
+    writer = PdfWriter()
+    for pdf in pdfs:
+        writer.append(BytesIO(pdf))
+    out = BytesIO(); writer.write(out)
+    return out.getvalue()
+
+def count_pages(pdf):
+    return len(re.findall(rb"/Type /Page\b(?!s)", pdf))
+
+def _render_job(job):
+    d, envio, retorno, base_dir = job
+    return d, render(d, envio, retorno, base_dir)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def shared_executor():
+    """Pool de processos do módulo (um por CPU), criado no primeiro lote e reaproveitado pelos seguintes.
+
+    Os processos já carregados (ReportLab, estilos, logo) ficam prontos para a próxima exportação.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            _executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+            atexit.register(_executor.shutdown)
+        return _executor
+
+def _discard_executor(pool):
+    global _executor
+    with _executor_lock:
+        if _executor is pool:
+            _executor = None
+    pool.shutdown(wait=False)
+
+def render_batch(days, base_dir, workers=None, progress=None):
+    """Renderiza vários dias distribuindo entre processos. Retorna {d: pdf} na ordem de days.
+
+    days: [(d, envio, retorno)]; workers: nº de processos (padrão: o pool do módulo, um por CPU; 1 = no processo
+    atual; outro número usa um pool só para este lote, como no --bench); progress(feitos, total, d) é chamado a
+    cada dia concluído.
+    """
+    jobs = [(d, envio, retorno, base_dir) for d, envio, retorno in days]
+    done = {}
+    if (workers or os.cpu_count() or 1) <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            d, pdf = _render_job(job); done[d] = pdf
+            if progress: progress(len(done), len(jobs), d)
+        return {d: done[d] for d, _, _ in days}
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from concurrent.futures.process import BrokenProcessPool
+    pool = shared_executor() if workers is None else ProcessPoolExecutor(max_workers=min(workers, len(jobs)))
+    try:
+        for fut in as_completed([pool.submit(_render_job, job) for job in jobs]):
+            d, pdf = fut.result(); done[d] = pdf
+            if progress: progress(len(done), len(jobs), d)
+    except BrokenProcessPool:
+        _discard_executor(pool); raise   # processo morto: o próximo lote cria um pool novo
+    finally:
+        if workers is not None:
+            pool.shutdown()
+    return {d: done[d] for d, _, _ in days}
+
+def benchmark(days, base_dir, worker_counts):
+    """Páginas por segundo para cada quantidade de processos. Retorna [dict(workers, pages, seconds, pages_per_sec)]."""
+    results = []
+    for workers in worker_counts:
+        t = time.perf_counter()
+        pdfs = render_batch(days, base_dir, workers=workers)
+        seconds = time.perf_counter() - t
+        pages = sum(count_pages(p) for p in pdfs.values())
+        results.append(dict(workers=workers, pages=pages, seconds=round(seconds, 3),
+                            pages_per_sec=round(pages / seconds, 1) if seconds else 0.0))
+    return results
@@ -1,4 +1,6 @@
+import multiprocessing
 from waitress import serve
-from app import app
+from app import app, SERVER_THREADS
 if __name__ == "__main__":
-    serve(app, host="127.0.0.1", port=5000)
+    multiprocessing.freeze_support()
+    serve(app, host="127.0.0.1", port=5000, threads=SERVER_THREADS)
@@ -0,0 +1,75 @@
+// painel_ao_vivo.js - Atualiza o painel (/) com os eventos de /api/painel/eventos, sem recarregar a página
+//
+// Incluído em templates/dashboard.html:
+//   <script src="{{ url_for('static', filename='js/painel_ao_vivo.js') }}"
+//           data-versao="{{ versao }}" data-inicio="{{ start }}" data-fim="{{ end }}" defer></script>
+// Elementos atualizados (todos opcionais):
+//   [data-kpi="envios"], [data-kpi="retornos"]           totais de hoje
+//   [data-kpi-periodo="<tipo>|linhas"]                    totais do período filtrado (inicio..fim)
+//   [data-estoque="<item_id>"] [data-campo="no_hotel|em_lavanderia|total"]
+//   window.BBH_GRAFICO (Chart.js da semana: rótulos dd/mm, datasets envios e retornos)
+// Com o servidor lotado (BBH_LIVE_MAX), a resposta traz só o que faltou e fecha; o EventSource reconecta sozinho
+// com Last-Event-ID, e o painel passa a consultar de tempos em tempos sem mudar nada aqui.
+(function () {
+  "use strict";
+  var script = document.currentScript;
+  if (!script || !window.EventSource) return;
+  var versao = parseInt(script.dataset.versao || "-1", 10);
+  var inicio = script.dataset.inicio || "", fim = script.dataset.fim || "";
+
+  function hoje() {
+    var d = new Date();
+    return d.getFullYear() + "-" + ("0" + (d.getMonth() + 1)).slice(-2) + "-" + ("0" + d.getDate()).slice(-2);
+  }
+
+  function soma(el, valor) {
+    if (!el || !valor) return;
+    var atual = parseInt((el.textContent || "0").replace(/\D+/g, ""), 10) || 0;
+    if (/^\s*-/.test(el.textContent)) atual = -atual;
+    el.textContent = String(atual + valor);
+    el.classList.add("bbh-atualizado");
+    setTimeout(function () { el.classList.remove("bbh-atualizado"); }, 1500);
+  }
+
+  function aplicar(delta) {
+    Object.keys(delta.estoque || {}).forEach(function (iid) {
+      var linha = document.querySelector('[data-estoque="' + iid + '"]');
+      if (!linha) return;
+      var h = delta.estoque[iid][0], l = delta.estoque[iid][1];
+      soma(linha.querySelector('[data-campo="no_hotel"]'), h);
+      soma(linha.querySelector('[data-campo="em_lavanderia"]'), l);
+      soma(linha.querySelector('[data-campo="total"]'), h + l);
+    });
+    var dia = hoje(), grafico = window.BBH_GRAFICO;
+    Object.keys(delta.dias || {}).forEach(function (d) {
+      var t = delta.dias[d];
+      if (d === dia) {
+        soma(document.querySelector('[data-kpi="envios"]'), t.envio);
+        soma(document.querySelector('[data-kpi="retornos"]'), t.retorno);
+      }
+      if (d >= inicio && d <= fim) {
+        Object.keys(t).forEach(function (k) { soma(document.querySelector('[data-kpi-periodo="' + k + '"]'), t[k]); });
+      }
+      if (grafico) {
+        var i = grafico.data.labels.indexOf(d.slice(8, 10) + "/" + d.slice(5, 7));
+        if (i >= 0) {
+          grafico.data.datasets[0].data[i] += t.envio;
+          grafico.data.datasets[1].data[i] += t.retorno;
+          grafico.update();
+        }
+      }
+    });
+  }
+
+  var fonte = new EventSource("/api/painel/eventos?desde=" + versao);
+  fonte.addEventListener("delta", function (e) {
+    var id = parseInt(e.lastEventId, 10);
+    if (id <= versao) return;   // a página já foi montada com esta gravação
+    versao = id;
+    aplicar(JSON.parse(e.data));
+  });
+  fonte.addEventListener("recarregar", function () {
+    fonte.close();
+    window.location.reload();
+  });
+})();
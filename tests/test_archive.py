@@ -0,0 +1,41 @@
+# test_archive.py - Arquivo anual: anos fechados saem de movements para lavanderia_AAAA.db e histórico e romaneios
+# continuam lendo deles, anexando um arquivo por vez e desanexando ao terminar (mesmo quando a página enche antes).
+# Arquiva 2001 e 2002: nenhum outro teste grava datas tão antigas.
+import pytest
+
+def attached(app):
+    conn = app.db_connect()
+    try:
+        return [r[1] for r in conn.execute("PRAGMA database_list;")]
+    finally:
+        conn.close()
+
+@pytest.fixture(scope="module")
+def archived(app):
+    iid = app.LEDGER.add_item("TESTE ARQUIVO") and app.LEDGER.catalog()["id_by_name"]["TESTE ARQUIVO"]
+    app.LEDGER.write_movements([(d, d, t, iid, q, "", "") for d, t, q in [
+        ("2001-03-01", "entrada", 1), ("2001-06-01", "envio", 2), ("2002-02-01", "entrada", 3),
+        ("2002-05-01", "envio", 4), ("2040-01-01", "entrada", 5)]])
+    assert [app.archive_year(y)["linhas"] for y in (2001, 2002)] == [2, 2]
+    return iid
+
+def test_history_pages_across_archives(app, archived):
+    qtys, cursor = [], None
+    while True:
+        rows, cursor = app.movements_page(item_id=archived, cursor=cursor, limit=2)
+        qtys += [r["qty"] for r in rows]
+        assert "arq" not in attached(app)
+        if not cursor:
+            break
+    assert qtys == [5, 4, 3, 2, 1]
+    assert [r["qty"] for r in app.LEDGER.history_rows(item_id=archived, limit=3)] == [5, 4, 3]
+    assert "arq" not in attached(app)
+
+def test_romaneio_and_stock_after_archive(app, archived):
+    envio, _ = app.LEDGER.romaneio("2001-06-01")
+    assert [l.qty for l in envio if l.name == "TESTE ARQUIVO"] == [2]
+    assert "arq" not in attached(app)
+    row = next(r for r in app.LEDGER.stock_summary() if r.id == archived)
+    assert (row.no_hotel, row.em_lavanderia) == (3, 6)
+    with pytest.raises(ValueError, match="ano arquivado"):
+        app.LEDGER.write_movements([("2002-12-31", "2002-12-31", "entrada", archived, 1, "", "")])
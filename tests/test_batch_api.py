@@ -0,0 +1,55 @@
+# test_batch_api.py - POST /api/movimentos/lote: entrada inválida vira erro por linha (422), nunca 500, e nada é
+# gravado com data que o SQLite não entende (mov_day NULL ficaria fora dos relatórios).
+import pytest
+
+@pytest.fixture
+def client(app):
+    c = app.app.test_client()
+    c.post("/login", data=dict(username="admin", password="1234"))
+    return c
+
+@pytest.mark.parametrize("payload, erro", [
+    (dict(mov_type="envio", itens=[dict(qty=1, note=["x"])]), "tipo, ref. ou observação inválidos"),
+    (dict(mov_type="envio", ref={"a": 1}, itens=[dict(qty=1)]), "tipo, ref. ou observação inválidos"),
+    (dict(mov_type=5, itens=[dict(qty=1)]), "tipo de movimentação inválido"),
+    (dict(mov_type="envio", itens=[dict(qty=1, mov_type=True)]), "tipo, ref. ou observação inválidos"),
+    (dict(mov_type="envio", mov_date="2025-1-5", itens=[dict(qty=1)]), "data inválida"),
+    (dict(mov_type="entrada", itens=[dict(qty=5, mov_date="2026-10-10x")]), "data inválida"),
+    (dict(mov_type="entrada", itens=[dict(qty=1e300)]), "quantidade acima do limite (1000000 peças)"),
+    (dict(mov_type="entrada", itens=[dict(qty=10**30)]), "quantidade acima do limite (1000000 peças)"),
+])
+def test_invalid_rows(app, client, new_item, payload, erro):
+    iid = new_item()
+    for row in payload["itens"]:
+        row["item_id"] = iid
+    r = client.post("/api/movimentos/lote", json=payload)
+    assert r.status_code == 422 and r.json["rows"][0]["erro"] == erro
+    conn = app.db_connect()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM movements WHERE item_id=?;", (iid,)).fetchone()[0] == 0
+    finally:
+        conn.close()
+
+def test_valid_row_is_canonical(app, client, new_item):
+    iid = new_item()
+    r = client.post("/api/movimentos/lote", json=dict(mov_type="envio", ref=12345,
+                                                      itens=[dict(item_id=iid, qty=2, mov_date=" 2039-09-10 ")]))
+    assert r.status_code == 200 and r.json["inserted"] == 1
+    conn = app.db_connect()
+    try:
+        row = conn.execute("SELECT mov_date, mov_day, ref FROM movements WHERE item_id=?;", (iid,)).fetchone()
+    finally:
+        conn.close()
+    assert tuple(row) == ("2039-09-10", "2039-09-10", "12345")
+
+def test_out_of_range_qty_rejects_only_its_row(app, client, new_item):
+    iid = new_item()
+    r = client.post("/api/movimentos/lote", json=dict(mov_type="entrada", mov_date="2039-09-11", itens=[
+        dict(item_id=iid, qty=2**63), dict(item_id=iid, qty=app.MOV_QTY_MAX), dict(item_id=iid, qty="1e300")]))
+    assert r.status_code == 200 and r.json["inserted"] == 1
+    assert [row["ok"] for row in r.json["rows"]] == [False, True, False]
+    conn = app.db_connect()
+    try:
+        assert conn.execute("SELECT qty FROM movements WHERE item_id=?;", (iid,)).fetchall()[0][0] == app.MOV_QTY_MAX
+    finally:
+        conn.close()
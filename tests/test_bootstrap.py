@@ -0,0 +1,49 @@
+# test_bootstrap.py - Migrações versionadas: o banco novo recebe todas uma vez; com o schema em dia, bootstrap()
+# não aplica nada e registra o tempo da partida em BOOTSTRAP_STATS.
+import pytest
+
+def test_fresh_db_has_every_migration(app):
+    conn = app.db_connect()
+    try:
+        versions = [r[0] for r in conn.execute("SELECT version FROM schema_version ORDER BY version;")]
+    finally:
+        conn.close()
+    assert versions == [v for v, _, _ in app.MIGRATIONS]
+
+def test_bootstrap_fast_path(app):
+    for _ in range(2):
+        app.bootstrap()
+        stats = dict(app.BOOTSTRAP_STATS)
+        assert stats["applied"] == []
+        assert stats["version"] == app.SCHEMA_VERSION
+        assert isinstance(stats["seconds"], float) and 0 <= stats["seconds"] < 0.5   # um SELECT em schema_version
+
+def test_integer_qty_keeps_fractional_originals(app, new_item, caplog):
+    """Migração 11 sobre um movements antigo (qty REAL), desfeita no fim."""
+    iid = new_item()
+    conn = app.db_connect(); c = conn.cursor()
+    try:
+        c.execute("BEGIN IMMEDIATE;")
+        c.execute(app.MOVEMENTS_DDL.format(table="movements_real").replace("qty INTEGER", "qty REAL"))
+        c.execute(f"INSERT INTO movements_real SELECT {app.MOVEMENTS_COLUMNS} FROM movements;")
+        c.execute("DROP TABLE movements;")
+        c.execute("ALTER TABLE movements_real RENAME TO movements;")
+        c.executemany("INSERT INTO movements(mov_date, mov_day, mov_type, item_id, qty) VALUES (?,?,?,?,?);",
+                      [("2030-06-01", "2030-06-01", "entrada", iid, q) for q in (2.4, 3.0, 1.5)])
+        app.migrate_integer_qty(c)
+        assert app.column_type(c, "movements", "qty") == "INTEGER"
+        c.execute("SELECT qty FROM movements WHERE item_id=? ORDER BY id;", (iid,))
+        assert [r[0] for r in c.fetchall()] == [2, 3, 2]
+        c.execute("SELECT qty_original, qty_rounded FROM qty_rounding WHERE item_id=? ORDER BY movement_id;", (iid,))
+        assert [tuple(r) for r in c.fetchall()] == [(2.4, 2), (1.5, 2)]
+        c.execute("SELECT no_hotel FROM stock_balance WHERE item_id=?;", (iid,))
+        assert c.fetchone()[0] == 7
+    finally:
+        conn.rollback(); conn.close()
+    assert "2 movimentação(ões) com quantidade fracionada" in caplog.text
+
+def test_old_sqlite_fails_clearly(app, monkeypatch):
+    monkeypatch.setattr(app.sqlite3, "sqlite_version_info", (3, 31, 1))
+    monkeypatch.setattr(app.sqlite3, "sqlite_version", "3.31.1")
+    with pytest.raises(RuntimeError, match=r"SQLite 3\.31\.1 .* precisa do 3\.35\.0"):
+        app.bootstrap()
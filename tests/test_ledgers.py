@@ -0,0 +1,117 @@
+# test_ledgers.py - A mesma bateria contra o SqliteLedger (app.LEDGER) e o PostgresLedger (ledger_pg).
+# Cada teste cadastra seus itens e usa datas próprias, então o banco pode ter outros dados.
+import os
+
+import pytest
+
+@pytest.fixture(scope="module", params=["sqlite", "postgresql"])
+def ledger(request, app):
+    if request.param == "sqlite":
+        yield app.LEDGER
+        return
+    url = os.environ.get("BBH_TEST_DATABASE_URL", "")
+    if not url.startswith(("postgres://", "postgresql://")):
+        pytest.skip("defina BBH_TEST_DATABASE_URL para testar o livro em PostgreSQL")
+    import ledger_pg
+    if ledger_pg.psycopg is None:
+        pytest.skip('psycopg não instalado (pip install "psycopg[binary,pool]")')
+    pg = ledger_pg.PostgresLedger(url, app.MOV_TYPES, app.STOCK_EFFECT, app.DEFAULT_MOV_NAMES, pool_size=2)
+    yield pg
+    pg.close()
+
+def write(ledger, iid, rows):
+    """rows: (dia, tipo, qtd, ref) -> tuplas validadas de write_movements."""
+    ledger.write_movements([(d, d, t, iid, q, ref, "") for d, t, q, ref in rows])
+
+def stock(rows, iid):
+    r = next(r for r in rows if r.id == iid)
+    return r.no_hotel, r.em_lavanderia, r.total
+
+def history(ledger, iid, page=3, **filters):
+    """Histórico inteiro do item, página a página pela chave (mov_day, id)."""
+    rows, after = [], None
+    while True:
+        chunk = ledger.history_rows(item_id=iid, after=after, limit=page, **filters)
+        rows += chunk
+        if len(chunk) < page:
+            return rows
+        after = (chunk[-1]["mov_day"], chunk[-1]["id"])
+
+def test_balances(ledger, new_item):
+    iid = new_item(ledger)
+    write(ledger, iid, [("2031-01-05", "entrada", 20, ""), ("2031-01-06", "envio", 8, "R1"),
+                        ("2031-01-08", "retorno", 5, "R1"), ("2031-01-09", "perda", 1, ""), ("2031-01-09", "saida", 2, "")])
+    assert stock(ledger.stock_summary(), iid) == (14, 3, 17)
+    assert stock(ledger.stock_on("2031-01-04"), iid) == (0, 0, 0)
+    assert stock(ledger.stock_on("2031-01-06"), iid) == (12, 8, 20)
+    assert stock(ledger.stock_on("2031-12-31"), iid) == (14, 3, 17)
+    trend = ledger.stock_trend("2031-01-05", "2031-01-09", iid)
+    assert [t.day for t in trend] == ["2031-01-05", "2031-01-06", "2031-01-07", "2031-01-08", "2031-01-09"]
+    assert [(t.no_hotel, t.em_lavanderia) for t in trend] == [(20, 0), (12, 8), (12, 8), (17, 3), (14, 3)]
+    assert (trend[1].envio, trend[3].retorno, trend[4].perda, trend[4].saida) == (8, 5, 1, 2)
+
+def test_period_report(ledger, new_item):
+    iid = new_item(ledger)
+    before = ledger.period_report("2032-02-01", "2032-02-29")
+    write(ledger, iid, [("2032-02-01", "envio", 7, ""), ("2032-02-01", "envio", 3, ""), ("2032-02-15", "retorno", 4, ""),
+                        ("2032-02-29", "entrada", 9, ""), ("2032-03-01", "entrada", 100, "")])
+    after = ledger.period_report("2032-02-01", "2032-02-29")
+    assert after["linhas"] - before["linhas"] == 4
+    assert {t: after["totals"][t] - before["totals"][t] for t in after["totals"]} == \
+        dict(entrada=9, saida=0, envio=10, retorno=4, perda=0)
+    assert after["days"]["2032-02-01"]["envio"] - before["days"].get("2032-02-01", {}).get("envio", 0) == 10
+    assert "2032-03-01" not in after["days"]
+
+def test_history_cursor(ledger, new_item):
+    iid = new_item(ledger)
+    rows = [("2033-05-01", "envio", 1, "A"), ("2033-05-03", "retorno", 2, "A"), ("2033-05-03", "envio", 3, "B"),
+            ("2033-05-02", "entrada", 4, ""), ("2033-05-03", "envio", 5, "B"), ("2033-05-07", "saida", 6, ""),
+            ("2033-04-30", "envio", 7, "")]
+    write(ledger, iid, rows)
+    got = history(ledger, iid)
+    keys = [(r["mov_day"], r["id"]) for r in got]
+    assert len(got) == len(rows) and keys == sorted(keys, reverse=True) and len(set(keys)) == len(keys)
+    assert [r["qty"] for r in got] == [6, 5, 3, 2, 4, 1, 7]   # mesmo dia: id maior (gravado depois) primeiro
+    assert [r["qty"] for r in history(ledger, iid, page=2, mov_type="envio")] == [5, 3, 1, 7]
+    assert [r["qty"] for r in history(ledger, iid, ref="B")] == [5, 3]
+    assert [r["qty"] for r in history(ledger, iid, start="2033-05-02", end="2033-05-03")] == [5, 3, 2, 4]
+
+def test_delete(ledger, new_item):
+    iid = new_item(ledger)
+    write(ledger, iid, [("2034-07-01", "entrada", 10, ""), ("2034-07-02", "envio", 6, "X")])
+    envio = next(r for r in history(ledger, iid) if r["mov_type"] == "envio")
+    before = ledger.period_report("2034-07-01", "2034-07-31")
+    assert [(l.name, l.qty) for l in ledger.romaneio("2034-07-02")[0] if l.qty == 6]
+    assert stock(ledger.stock_summary(), iid) == (4, 6, 10)
+
+    assert ledger.delete_movement(envio["id"])
+    assert not ledger.delete_movement(envio["id"])
+    assert stock(ledger.stock_summary(), iid) == (10, 0, 10)
+    assert stock(ledger.stock_on("2034-12-31"), iid) == (10, 0, 10)
+    assert [r["mov_type"] for r in history(ledger, iid)] == ["entrada"]
+    after = ledger.period_report("2034-07-01", "2034-07-31")
+    assert before["linhas"] - after["linhas"] == 1 and before["totals"]["envio"] - after["totals"]["envio"] == 6
+    assert ledger.stock_trend("2034-07-01", "2034-07-02", iid)[-1].em_lavanderia == 0
+
+def test_catalog(ledger, new_item):
+    iid = new_item(ledger)
+    cat = ledger.catalog()
+    assert iid in cat["ids"] and ledger.catalog() is cat   # sem mudança: o mesmo catálogo, sem recarregar
+    ledger.deactivate_item(iid)
+    assert iid not in ledger.catalog()["ids"]
+
+def test_pg_catalog_sees_other_hotels(ledger, app, monkeypatch):
+    if ledger.name != "postgresql":
+        pytest.skip("só no PostgreSQL: outra instalação gravando no mesmo banco")
+    import ledger_pg, uuid
+    other = ledger_pg.PostgresLedger(os.environ["BBH_TEST_DATABASE_URL"], app.MOV_TYPES, app.STOCK_EFFECT,
+                                     app.DEFAULT_MOV_NAMES, pool_size=1)
+    try:
+        name = f"TESTE {uuid.uuid4().hex[:10].upper()}"
+        cat = ledger.catalog()
+        assert other.add_item(name)
+        assert ledger.catalog() is cat                         # dentro do CATALOG_TTL
+        monkeypatch.setattr(ledger_pg, "CATALOG_TTL", 0)
+        assert name in ledger.catalog()["id_by_name"]
+    finally:
+        other.close()
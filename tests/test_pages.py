@@ -0,0 +1,24 @@
+# test_pages.py - Páginas cujos templates estão no repositório (templates/) renderizam pelo render_template.
+import pytest
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
+
+def test_login_page(client):
+    r = client.get("/login")
+    assert r.status_code == 200 and b'name="password"' in r.data
+
+def test_import_page_requires_admin(client):
+    assert client.get("/admin/importar").status_code == 302
+    client.post("/login", data=dict(username="admin", password="1234"))
+    r = client.get("/admin/importar")
+    assert r.status_code == 200 and b'name="arquivo"' in r.data and b"Importar hist" in r.data
+
+@pytest.mark.parametrize("url", ["/login", "/", "/movimentos/historico", "/admin/importar"])
+def test_pages_use_local_css(app, client, url):
+    client.post("/login", data=dict(username="admin", password="1234"))
+    html = client.get(url).get_data(as_text=True)
+    with app.app.test_request_context():
+        css = app.asset_url("src/app.css")
+    assert f'href="{css}"' in html and "cdn.tailwindcss.com" not in html
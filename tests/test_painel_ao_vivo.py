@@ -0,0 +1,31 @@
+# test_painel_ao_vivo.py - Painel ao vivo: o dashboard inclui o script dos eventos e, acima de LIVE_MAX_CLIENTS
+# painéis em streaming, /api/painel/eventos responde o que faltou e fecha (o EventSource volta a consultar).
+import pytest
+
+@pytest.fixture
+def client(app):
+    c = app.app.test_client()
+    c.post("/login", data=dict(username="admin", password="1234"))
+    return c
+
+def test_dashboard_includes_live_script(app, client):
+    html = client.get("/").get_data(as_text=True)
+    assert "js/painel_ao_vivo.js" in html and f'data-versao="{app.LEDGER.version()[0]}"' in html
+
+def test_over_cap_answers_and_closes(app, new_item, monkeypatch):
+    monkeypatch.setattr(app, "LIVE_MAX_CLIENTS", 1)
+    iid = new_item()
+    hub = app.LiveHub()
+    since = app.LEDGER.version()[0]
+    held = hub.subscribe(since)
+    assert held is not None and hub.subscribe(since) is None
+    app.LEDGER.write_movements([("2041-01-02", "2041-01-02", "envio", iid, 3, "", "")])
+    gen = app.LEDGER.version()[0]
+    hub.publish(gen, "delta", dict(versao=gen))
+    body = list(hub.stream(gen - 1))                  # gerador finito: não segura o thread
+    assert body[0] == f"retry: {app.LIVE_POLL_RETRY * 1000}\n\n"
+    assert [m.split("\n")[:2] for m in body[1:]] == [[f"id: {gen}", "event: delta"]]
+    assert list(hub.stream(gen)) == [body[0]]         # em dia: só o retry
+    assert hub.info()["consultas"] == 2 and hub.info()["clientes"] == 1
+    hub.unsubscribe(held)
+    assert hub.subscribe(gen) is not None             # com vaga, volta ao streaming
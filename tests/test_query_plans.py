@@ -0,0 +1,75 @@
+# test_query_plans.py - As consultas de relatório (REPORT_SQL) usam índices: nenhum plano com SCAN em movements ou
+# stock_daily, no banco recém-criado pelo bootstrap() e depois de ter dados e estatísticas (ANALYZE).
+import random
+from datetime import date, timedelta
+
+def plans_and_scans(app):
+    plans, scans = app.report_query_plans()
+    assert set(plans) == set(app.REPORT_SQL)
+    return plans, scans
+
+def test_fresh_db_plans_use_indexes(app):
+    plans, scans = plans_and_scans(app)
+    assert scans == [], {name: plans[name] for name in scans}
+
+def test_plans_with_data_and_stats(app, new_item):
+    ids = [new_item() for _ in range(3)]
+    rng = random.Random(2)
+    d0 = date(2035, 1, 1)
+    app.movements_insert_batch([dict(item_id=rng.choice(ids), qty=rng.randint(1, 9), mov_type=rng.choice(app.MOV_TYPES),
+                                     mov_date=(d0 + timedelta(days=rng.randint(0, 120))).isoformat()) for _ in range(3000)])
+    app.rollup_update()
+    conn = app.db_connect()
+    try:
+        conn.execute("ANALYZE;"); conn.commit()
+    finally:
+        conn.close()
+    plans, scans = plans_and_scans(app)
+    assert scans == [], {name: plans[name] for name in scans}
+
+# ---- Fechamento diário (stock_daily) ----
+def rollup_snapshot(c):
+    c.execute("SELECT * FROM stock_daily ORDER BY day, item_id;")
+    return [tuple(r) for r in c.fetchall()]
+
+def assert_rollup_matches_rebuild(app):
+    """stock_daily mantido dia a dia (rollup_dirty) == refeito do zero; a reconstrução é desfeita no fim."""
+    app.rollup_update()
+    conn = app.db_connect(); c = conn.cursor()
+    try:
+        incremental = rollup_snapshot(c)
+        c.execute("BEGIN IMMEDIATE;")
+        app.rollup_rebuild(c)
+        rebuilt = rollup_snapshot(c)
+        c.execute("""SELECT b.item_id, b.no_hotel, b.em_lavanderia, s.no_hotel, s.em_lavanderia FROM stock_balance b
+                     JOIN stock_daily s ON s.item_id=b.item_id AND s.day=(SELECT MAX(day) FROM stock_daily WHERE item_id=b.item_id);""")
+        drift = [tuple(r) for r in c.fetchall() if tuple(r[1:3]) != tuple(r[3:])]
+    finally:
+        conn.rollback(); conn.close()
+    assert incremental == rebuilt, sorted(set(incremental) ^ set(rebuilt))[:5]
+    assert drift == []
+
+def test_rollup_incremental_equals_rebuild(app, new_item):
+    ids = [new_item() for _ in range(4)]
+    rng = random.Random(13)
+    d0 = date(2036, 3, 1)
+    def rows(n, lo, hi):
+        return [dict(item_id=rng.choice(ids), qty=rng.randint(1, 9), mov_type=rng.choice(app.MOV_TYPES),
+                     mov_date=(d0 + timedelta(days=rng.randint(lo, hi))).isoformat()) for _ in range(n)]
+    app.movements_insert_batch(rows(400, 0, 60))
+    assert_rollup_matches_rebuild(app)
+    app.movements_insert_batch(rows(50, 5, 15))       # lançamentos com data atrasada
+    app.movements_insert_batch(rows(20, 90, 95))      # dias novos depois de um buraco
+    assert_rollup_matches_rebuild(app)
+    conn = app.db_connect()
+    try:
+        mids = [r[0] for r in conn.execute(
+            f"SELECT id FROM movements WHERE item_id IN ({','.join('?' * len(ids))}) ORDER BY id;", ids)]
+    finally:
+        conn.close()
+    client = app.app.test_client()
+    client.post("/login", data=dict(username="admin", password="1234"))
+    for mid in rng.sample(mids, 40):                  # exclusões espalhadas, inclusive o único lançamento de um dia
+        assert client.post(f"/movimentos/{mid}/delete").status_code == 302
+    app.movements_insert_batch(rows(10, 0, 2))
+    assert_rollup_matches_rebuild(app)
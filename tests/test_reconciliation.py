@@ -0,0 +1,106 @@
+# test_reconciliation.py - Conciliação envio/retorno (Reconciler), mantida a cada gravação e exclusão.
+#
+# Por item valem sempre: enviado = casado + aberto (por lote) e devolvido = casado + sobra (por retorno), todo casamento
+# liga um envio a um retorno de data igual ou posterior, e aberto - sobras = stock_balance.em_lavanderia.
+# O estado incremental é o que vale (é o que os relatórios leem): recon_rebuild() casa de novo em ordem de data e,
+# com lançamentos atrasados, pode dividir aberto/sobra de outro jeito; a divisão muda, as invariantes e o líquido não.
+import random
+
+import pytest
+
+@pytest.fixture
+def db(app):
+    conn = app.db_connect()
+    yield conn
+    conn.close()
+
+def add(app, db, iid, day, mov_type, qty, ref=""):
+    app.LEDGER.write_movements([(day, day, mov_type, iid, qty, ref, "")])
+    return db.execute("SELECT MAX(id) FROM movements WHERE item_id=?;", (iid,)).fetchone()[0]
+
+def state(db, iids):
+    """Por item: {envio_id: (qtd, aberto)}, {retorno_id: (qtd, sobra)} e casamentos [(retorno, envio, qtd)]."""
+    q = ",".join("?" * len(iids))
+    batches = {r[0]: tuple(r[1:]) for r in db.execute(
+        f"SELECT envio_id, qty, open_qty FROM recon_batches WHERE item_id IN ({q});", iids)}
+    excess = {r[0]: r[1] for r in db.execute(f"SELECT retorno_id, qty FROM recon_excess WHERE item_id IN ({q});", iids)}
+    matches = [tuple(r) for r in db.execute(f"""
+        SELECT m.retorno_id, m.envio_id, m.qty FROM recon_matches m JOIN recon_batches b ON b.envio_id=m.envio_id
+        WHERE b.item_id IN ({q}) ORDER BY 1, 2;""", iids)]
+    return batches, excess, matches
+
+def check_invariants(app, db, iids):
+    q = ",".join("?" * len(iids))
+    movs = {r[0]: tuple(r[1:]) for r in db.execute(
+        f"SELECT id, mov_type, mov_day, qty FROM movements WHERE item_id IN ({q}) AND mov_type IN ('envio','retorno');", iids)}
+    batches, excess, matches = state(db, iids)
+    envios = {mid for mid, (t, _, _) in movs.items() if t == "envio"}
+    assert set(batches) == envios
+    matched_e, matched_r = {}, {}
+    for rid, eid, qty in matches:
+        assert qty > 0 and movs[rid][0] == "retorno" and movs[eid][1] <= movs[rid][1]
+        matched_e[eid] = matched_e.get(eid, 0) + qty; matched_r[rid] = matched_r.get(rid, 0) + qty
+    for eid, (qty, open_qty) in batches.items():
+        assert qty == movs[eid][2] == matched_e.get(eid, 0) + open_qty and open_qty >= 0
+    for rid, (t, _, qty) in movs.items():
+        if t == "retorno":
+            assert qty == matched_r.get(rid, 0) + excess.get(rid, 0)
+    assert set(excess) <= set(movs) and all(v > 0 for v in excess.values())
+    assert app.recon_verify(db.cursor()) == []
+
+def net_by_item(db, iids):
+    return {iid: db.execute("""SELECT (SELECT IFNULL(SUM(open_qty), 0) FROM recon_batches WHERE item_id=?1)
+                                    - (SELECT IFNULL(SUM(qty), 0) FROM recon_excess WHERE item_id=?1);""", (iid,)).fetchone()[0]
+            for iid in iids}
+
+def test_matching_rules(app, db, new_item):
+    iid = new_item()
+    e1 = add(app, db, iid, "2037-01-02", "envio", 10, "A")
+    e2 = add(app, db, iid, "2037-01-03", "envio", 5, "B")
+    r1 = add(app, db, iid, "2037-01-04", "retorno", 6, "B")      # mesma ref. primeiro, o resto no mais antigo
+    assert state(db, [iid])[2] == sorted([(r1, e1, 1), (r1, e2, 5)])
+    r0 = add(app, db, iid, "2037-01-01", "retorno", 4)           # sem envio até essa data: sobra
+    assert state(db, [iid])[1] == {r0: 4}
+    e3 = add(app, db, iid, "2037-01-01", "envio", 3)             # envio atrasado absorve a sobra do mesmo dia
+    batches, excess, _ = state(db, [iid])
+    assert batches[e3] == (3, 0) and excess == {r0: 1}
+    check_invariants(app, db, [iid])
+
+    assert app.movement_delete(e2)                               # o que r1 tinha abatido de e2 volta para e1
+    batches, _, matches = state(db, [iid])
+    assert e2 not in batches and matches == sorted([(r0, e3, 3), (r1, e1, 6)]) and batches[e1] == (10, 4)
+    check_invariants(app, db, [iid])
+    assert app.movement_delete(r1)                               # e1 reabre; a sobra de 01/01 é anterior e fica
+    batches, excess, _ = state(db, [iid])
+    assert batches[e1] == (10, 10) and excess == {r0: 1}
+    check_invariants(app, db, [iid])
+
+    short = [s for s in app.recon_shortfall("2037-01-01", "2037-01-31", today="2037-01-12") if s.item_id == iid]
+    assert [(s.day, s.ref, s.enviado, s.devolvido, s.faltando, s.dias) for s in short] == [("2037-01-02", "A", 10, 0, 10, 10)]
+    aging = next(a for a in app.recon_aging(today="2037-01-12") if a.item_id == iid)
+    assert (aging.lotes, aging.pecas, aging.mais_antigo, aging.sobras) == (1, 10, "2037-01-02", 1)
+
+def test_random_operations_keep_invariants(app, db, new_item):
+    iids = [new_item() for _ in range(3)]
+    rng = random.Random(23)
+    live = []
+    for n in range(400):
+        if live and rng.random() < 0.2:
+            mid = live.pop(rng.randrange(len(live)))
+            assert app.movement_delete(mid)
+        else:
+            day = f"2038-{rng.randint(1, 3):02d}-{rng.randint(1, 28):02d}"   # datas fora de ordem
+            mov_type = "envio" if rng.random() < 0.55 else "retorno"
+            live.append(add(app, db, rng.choice(iids), day, mov_type, rng.randint(1, 12), rng.choice(["", "", "R1", "R2"])))
+        if n % 50 == 49:
+            check_invariants(app, db, iids)
+    check_invariants(app, db, iids)
+    incremental = net_by_item(db, iids)
+
+    db.execute("BEGIN IMMEDIATE;")
+    try:
+        app.recon_rebuild(db.cursor())
+        check_invariants(app, db, iids)
+        assert net_by_item(db, iids) == incremental
+    finally:
+        db.rollback()
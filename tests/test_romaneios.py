@@ -0,0 +1,52 @@
+# test_romaneios.py - Romaneio do dia (tela, CSV e PDF): ?data= precisa ser uma data AAAA-MM-DD; o resto é 400 antes
+# de qualquer consulta. Romaneios de vários dias: um PDF por dia renderizado no pool de processos do módulo (o mesmo
+# a cada exportação) e juntado com pypdf, ou ZIP com PDF e CSV por dia.
+import io, zipfile
+
+import pytest
+
+@pytest.fixture
+def client(app):
+    c = app.app.test_client()
+    c.post("/login", data=dict(username="admin", password="1234"))
+    return c
+
+@pytest.mark.parametrize("url", ["/romaneio", "/export/romaneio.csv", "/export/romaneio.pdf"])
+@pytest.mark.parametrize("data", ["2025-13-01", "ontem", "2025-01-05' OR 1=1", "../../x"])
+def test_invalid_day_is_400(app, client, monkeypatch, url, data):
+    def fail(d):
+        raise AssertionError(f"romaneio consultado com {d!r}")
+    monkeypatch.setattr(app.LEDGER, "romaneio", fail)
+    r = client.get(url, query_string=dict(data=data))
+    assert r.status_code == 400 and "data inválida" in r.get_data(as_text=True)
+
+def test_valid_day(app, client, new_item):
+    iid = new_item()
+    assert app.movements_insert_batch([dict(item_id=iid, qty=7)], mov_date="2040-03-05", mov_type="envio")["inserted"] == 1
+    r = client.get("/export/romaneio.csv", query_string=dict(data="2040-03-05"))
+    assert r.status_code == 200 and "romaneio_2040-03-05.csv" in r.headers["Content-Disposition"]
+    assert ";7" in r.get_data(as_text=True)
+
+@pytest.fixture
+def days(app, new_item):
+    pytest.importorskip("reportlab")
+    pytest.importorskip("pypdf")
+    iid = new_item()
+    for d, t, q in [("2040-02-03", "envio", 4), ("2040-02-04", "retorno", 3), ("2040-02-06", "envio", 2)]:
+        assert app.movements_insert_batch([dict(item_id=iid, qty=q)], mov_date=d, mov_type=t)["inserted"] == 1
+    return "2040-02-01", "2040-02-07"
+
+def test_merged_pdf_reuses_pool(app, days, monkeypatch):
+    monkeypatch.setattr(app.romaneio_pdf.os, "cpu_count", lambda: 2)   # paralelo mesmo em máquina de um núcleo
+    pdf, mimetype, name = app.romaneio_batch(*days)
+    pool = app.romaneio_pdf._executor
+    assert mimetype == "application/pdf" and name == "romaneios_2040-02-01_a_2040-02-07.pdf"
+    assert app.romaneio_pdf.count_pages(pdf) == 3 and pool is not None
+    again, _, _ = app.romaneio_batch(*days)
+    assert app.romaneio_pdf._executor is pool and app.romaneio_pdf.count_pages(again) == 3
+
+def test_zip_has_pdf_and_csv_per_day(app, days):
+    data, mimetype, _ = app.romaneio_batch(*days, formato="zip")
+    names = zipfile.ZipFile(io.BytesIO(data)).namelist()
+    assert mimetype == "application/zip"
+    assert sorted(names) == [f"romaneio_2040-02-0{d}.{ext}" for d in (3, 4, 6) for ext in ("csv", "pdf")]
@@ -0,0 +1,51 @@
+# test_view_cache.py - Cache de páginas por versão do livro (ledger_cached): ETag/304, corpos em memória só para
+# respostas comuns (as exportações em streaming não são guardadas) e contadores certos com várias threads.
+import threading
+
+import pytest
+
+def login(app):
+    c = app.app.test_client()
+    c.post("/login", data=dict(username="admin", password="1234"))
+    with c.session_transaction() as s:
+        s.pop("_flashes", None)   # com mensagem pendente a página não usa o cache
+    return c
+
+@pytest.fixture
+def client(app):
+    return login(app)
+
+def test_streamed_export_gets_etag_but_is_not_stored(app, client):
+    before = app.view_cache_stats()
+    r = client.get("/export/estoque.csv")
+    assert r.status_code == 200 and r.headers["ETag"]
+    assert r.data.decode("utf-8-sig").startswith("Item")
+    after = app.view_cache_stats()
+    assert (after["items"], after["bytes"]) == (before["items"], before["bytes"])
+    assert client.get("/export/estoque.csv", headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+
+def test_regular_response_is_stored(app, client):
+    url = "/api/estoque/tendencia?start=2039-01-01&end=2039-01-03"
+    items = app.view_cache_stats()["items"]
+    first = client.get(url)
+    assert first.status_code == 200 and first.is_json
+    assert app.view_cache_stats()["items"] == items + 1
+    second = client.get(url)
+    assert second.data == first.data and second.headers["ETag"] == first.headers["ETag"]
+    assert app.view_cache_stats()["items"] == items + 1
+
+def test_counters_under_concurrency(app, client):
+    url = "/api/estoque/tendencia?start=2039-02-01&end=2039-02-02"
+    etag = client.get(url).headers["ETag"]
+    before = app.view_cache_stats()
+    n_threads, n_requests = 8, 25
+    def worker():
+        c = login(app)
+        for i in range(n_requests):
+            assert c.get(url, headers={"If-None-Match": etag} if i % 2 else {}).status_code in (200, 304)
+    threads = [threading.Thread(target=worker) for _ in range(n_threads)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    after = app.view_cache_stats()
+    counted = sum(after[k] - before[k] for k in ("hits", "misses", "not_modified"))
+    assert counted == n_threads * n_requests
@@ -0,0 +1,30 @@
+# test_write_queue.py - Fila de gravação (WRITE_QUEUE): o recálculo do fechamento pedido por uma leitura roda no
+# gravador, e o gravador acompanha a troca de DB_PATH como o db_connect das requisições.
+import os
+
+def main_file(c):
+    return c.execute("PRAGMA database_list;").fetchone()[2]
+
+def test_rollup_refresh_runs_on_writer(app, new_item):
+    iid = new_item()
+    app.LEDGER.write_movements([("2039-04-02", "2039-04-02", "entrada", iid, 5, "", "")])
+    conn = app.db_connect()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM rollup_dirty;").fetchone()[0] > 0
+        ops = app.WRITE_QUEUE.stats["operacoes"]
+        report = app.LEDGER.period_report("2039-04-01", "2039-04-30")
+        assert app.WRITE_QUEUE.stats["operacoes"] == ops + 1 and not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM rollup_dirty;").fetchone()[0] == 0
+    finally:
+        conn.close()
+    assert report["totals"]["entrada"] == 5
+    app.LEDGER.period_report("2039-04-01", "2039-04-30")   # nada pendente: não passa pela fila
+    assert app.WRITE_QUEUE.stats["operacoes"] == ops + 1
+
+def test_writer_follows_db_path(app, tmp_path, monkeypatch):
+    path = app.DB_PATH
+    assert os.path.samefile(app.WRITE_QUEUE.submit(main_file), path)
+    monkeypatch.setattr(app, "DB_PATH", str(tmp_path / "outro.db"))
+    assert os.path.samefile(app.WRITE_QUEUE.submit(main_file), tmp_path / "outro.db")
+    monkeypatch.setattr(app, "DB_PATH", path)
+    assert os.path.samefile(app.WRITE_QUEUE.submit(main_file), path)